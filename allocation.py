@@ -0,0 +1,425 @@
+from bisect import bisect_right
+from collections import deque
+
+from assignment import max_weight_assignment
+from seat_map import SeatLayout
+
+# Bus layout and allocation constants (shared by the web app and the CLI)
+TOTAL_SEATS = 40  # 10 rows (A–J), 4 seats per row
+SEAT_ROWS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J']
+SEAT_COLS = [1, 2, 3, 4]
+SEAT_ZONES = {
+    'front': ['A', 'B', 'C'],
+    'middle': ['D', 'E', 'F', 'G'],
+    'back': ['H', 'I', 'J']
+}
+SEAT_LAYOUT = SeatLayout(SEAT_ROWS, SEAT_COLS, SEAT_ZONES)
+# Drop-off seating: the door is at the front (row A); aisle seats are quicker
+# to leave than window seats
+AISLE_COLS = [2, 3]
+SEAT_DOOR_ORDER = sorted(SEAT_LAYOUT.seats, key=lambda seat: (SEAT_ROWS.index(seat[0]), int(seat[1:]) not in AISLE_COLS))
+TIME_SLOTS = {
+    '11AM': {'reuse': None},
+    '1PM': {'reuse': '11AM'},
+    '4PM': {'reuse': '1PM'},
+    '6PM': {'reuse': '4PM'}
+}
+
+# Priority points per special need (higher = served first)
+SPECIAL_NEEDS_PRIORITY = {
+    'Injury': 100,     # Highest priority for injured students
+    'Medical': 90,     # Very high priority for medical conditions
+    'Disability': 80,  # High priority for disabled students
+    'Pregnant': 70,    # High priority for pregnant students
+    'Elderly': 60      # Medium-high priority for elderly
+}
+
+# Seat bonus for special-needs students: need -> (bonus, preferred rows)
+SPECIAL_NEEDS_SEAT_BONUS = {
+    'Injury': (20, ['A', 'B']),
+    'Disability': (15, ['A', 'B']),
+    'Medical': (18, ['A', 'B']),
+    'Elderly': (10, ['A', 'B', 'C'])
+}
+# Bonuses used by the priority queue allocator
+PRIORITY_QUEUE_SEAT_BONUS = {
+    'Injury': (20, ['A', 'B']),      # Front seats for injured
+    'Disability': (15, ['A', 'B']),  # Front seats for disabled
+    'Elderly': (10, ['A', 'B', 'C'])  # Front-middle for elderly
+}
+# Bonuses used inside hybrid priority groups
+GROUP_SEAT_BONUS = {
+    'Injury': (20, ['A', 'B']),
+    'Disability': (15, ['A', 'B']),
+    'Medical': (18, ['A', 'B'])
+}
+
+# Fleet planning: a bus can serve a later slot once its trip and turnaround are over
+BUS_TRIP_MINUTES = 60
+BUS_TURNAROUND_MINUTES = 30
+
+# Algorithm Configuration
+ALLOCATION_ALGORITHM = 'hybrid'  # Options: 'greedy', 'knapsack', 'dp_knapsack', 'priority_queue', 'round_robin', 'hybrid', 'dropoff'
+
+# Allocation strategies by name. Each is called as allocator(context, booking)
+# with the slot's shared SlotContext and the new booking's StudentID,
+# Destination and SpecialNeeds, and returns (BusNumber, SeatNumber) or (None, None).
+ALLOCATORS = {}
+
+def allocator(name):
+    """Register an allocation strategy under name"""
+    def register(function):
+        ALLOCATORS[name] = function
+        return function
+    return register
+
+@allocator('greedy')
+def get_available_seat(context, booking):
+    """Greedy algorithm to allocate seat based on distance and zone"""
+    # Get destination zone (defaults to middle)
+    zone = context.routes.zone(booking['Destination'])
+    
+    # Bus of the slot with the most free seats in that zone
+    bus_number = context.bus(zone)
+    
+    if not bus_number:
+        return None, None
+    
+    # Get booked seats for this bus
+    occupied = context.occupancy(bus_number)
+    
+    # Find available seat in the appropriate zone
+    seat = SEAT_LAYOUT.first_free(occupied, SEAT_LAYOUT.zone_masks[zone])
+    if seat:
+        return bus_number, seat
+    
+    # If no seat in preferred zone, find any available seat
+    seat = SEAT_LAYOUT.first_free(occupied)
+    if seat:
+        return bus_number, seat
+    
+    return None, None
+
+def calculate_seat_preference_score(route_table, destination, seat_number):
+    """Calculate preference score for a seat based on destination"""
+    # 10 if the seat's row is in the destination's zone, 5 otherwise;
+    # precomputed per destination x row by the route table
+    return route_table.seat_preference(destination, seat_number)
+
+@allocator('knapsack')
+def knapsack_seat_allocation(context, booking):
+    """
+    0/1 Knapsack approach for seat allocation
+    Maximizes overall satisfaction while considering seat preferences
+    """
+    destination = booking['Destination']
+    
+    # Get bus number for time slot (most free seats in the destination's zone)
+    bus_number = context.bus(context.routes.zone(destination))
+    
+    if not bus_number:
+        return None, None
+    
+    # Get all available seats
+    occupied = context.occupancy(bus_number)
+    
+    # Create list of available seats with their preference scores
+    available_seats = []
+    for seat in SEAT_LAYOUT.free_seats(occupied):
+        preference_score = calculate_seat_preference_score(context.routes, destination, seat)
+        available_seats.append({
+            'seat': seat,
+            'value': preference_score,
+            'weight': 1  # Each seat has weight 1
+        })
+    
+    if not available_seats:
+        return None, None
+    
+    # Sort by preference score (descending) for greedy approach
+    # In a full knapsack implementation, we'd use dynamic programming
+    available_seats.sort(key=lambda x: x['value'], reverse=True)
+    
+    # Return the seat with highest preference score
+    best_seat = available_seats[0]['seat']
+    return bus_number, best_seat
+
+@allocator('dp_knapsack')
+def dynamic_programming_knapsack_seat_allocation(context, booking):
+    """
+    Batch optimal allocation for a single booking
+    Solves the seat assignment for every pending booking of the slot plus the
+    current student at once, over every bus of the slot, and returns the
+    current student's bus and seat
+    """
+    bus_occupancy = context.bus_occupancy()
+    if not bus_occupancy:
+        return None, None
+    
+    bookings = context.queue(booking)
+    allocations = solve_batch_assignment(context.scorer, bookings, bus_occupancy, context.priority_scores(booking),
+                                         context.seat_scores(booking, SPECIAL_NEEDS_SEAT_BONUS))
+    
+    return allocations.get(len(bookings) - 1, (None, None))
+
+def calculate_priority_score(route_table, student_id, special_needs, destination):
+    """
+    Calculate priority score for students based on special needs and destination
+    Higher score = Higher priority
+    """
+    priority_score = 0
+    
+    # Base priority based on special needs
+    priority_score += SPECIAL_NEEDS_PRIORITY.get(special_needs, 0)
+    
+    # Distance-based priority (longer distance = higher priority)
+    distance = route_table.distance(destination)
+    if distance is not None:
+        priority_score += distance * 2  # Distance factor
+    
+    # Student ID based priority (lower ID = higher priority for same conditions)
+    priority_score += (10000 - int(student_id)) / 10000
+    
+    return priority_score
+
+def queue_priority(route_table, booking):
+    """Priority of a pending or waitlisted booking (see calculate_priority_score)"""
+    return calculate_priority_score(route_table, booking['StudentID'], booking.get('SpecialNeeds'), booking.get('Destination'))
+
+@allocator('priority_queue')
+def priority_queue_seat_allocation(context, booking):
+    """
+    Priority Queue algorithm for seat allocation
+    Prioritizes students with special needs, injuries, or longer travel distances
+    Pending students ranked ahead of the current one (higher priority, or
+    equal and queued earlier) keep their tentative seats; the current
+    student gets the best seat left after them. The reservations come from
+    the slot's persistent priority heap and are shared by every request
+    until the next commit, so a booking costs a binary search and one pass
+    over the seats however long the pending queue is.
+    """
+    # Get bus number for time slot (most free seats in the destination's zone)
+    bus_number = context.bus(context.routes.zone(booking['Destination']))
+    
+    if not bus_number:
+        return None, None
+    
+    # Seats held by pending students ranked ahead of this one
+    reserved_keys, reserved_prefix = context.reservations(bus_number, PRIORITY_QUEUE_SEAT_BONUS)
+    ahead = bisect_right(reserved_keys, (-queue_priority(context.routes, booking), float('inf')))
+    occupied = context.occupancy(bus_number) | reserved_prefix[ahead]
+    
+    # Seat preference score + special-needs bonus: the best seat still free
+    seat_scores = context.scorer.seat_scores([booking], PRIORITY_QUEUE_SEAT_BONUS)
+    allocations = context.scorer.greedy_assign(seat_scores, [0], occupied)
+    
+    if 0 in allocations:
+        return bus_number, allocations[0]
+    
+    return None, None
+
+@allocator('round_robin')
+def round_robin_seat_allocation(context, booking):
+    """
+    Round Robin algorithm for fair seat distribution
+    Ensures equal opportunity for all students regardless of booking time
+    """
+    # Get bus number for time slot (most free seats)
+    bus_number = context.bus()
+    
+    if not bus_number:
+        return None, None
+    
+    # Get booked seats
+    occupied = context.occupancy(bus_number)
+    
+    # Create round robin queue for available seats
+    available_seats = deque(SEAT_LAYOUT.free_seats(occupied))
+    
+    if not available_seats:
+        return None, None
+    
+    # Position of the student's first booking in the slot's FIFO (BookingDate)
+    # order; new students join at the end of the queue
+    current_position = context.history_position(booking['StudentID'])
+    
+    # Rotate queue based on current position for fair distribution
+    rotation = current_position % len(available_seats)
+    available_seats.rotate(-rotation)
+    
+    # Get the next available seat
+    allocated_seat = available_seats.popleft()
+    
+    return bus_number, allocated_seat
+
+@allocator('hybrid')
+def hybrid_priority_knapsack_allocation(context, booking):
+    """
+    Hybrid Algorithm: Combines Priority Queue and 0/1 Knapsack
+    Step 1: Use Priority Queue to rank students by priority
+    Step 2: Use Knapsack approach to optimize seat allocation for each priority group
+    """
+    student_id = booking['StudentID']
+    
+    # Get bus number for time slot (most free seats in the destination's zone)
+    bus_number = context.bus(context.routes.zone(booking['Destination']))
+    
+    if not bus_number:
+        return None, None
+    
+    # All pending bookings for this time slot, then the current booking
+    pending_bookings = context.queue(booking)
+    
+    # Step 1: Priority Queue - Group students by priority levels
+    priority_groups = {
+        'Critical': [],    # Injury, Medical (100-90 points)
+        'High': [],        # Disability, Pregnant (80-70 points)
+        'Medium': [],      # Elderly (60 points)
+        'Normal': []       # Regular students
+    }
+    
+    priority_scores = context.priority_scores(booking)
+    for queued, priority_score in zip(pending_bookings, priority_scores):
+        if priority_score >= 90:
+            priority_groups['Critical'].append(queued)
+        elif priority_score >= 70:
+            priority_groups['High'].append(queued)
+        elif priority_score >= 60:
+            priority_groups['Medium'].append(queued)
+        else:
+            priority_groups['Normal'].append(queued)
+    
+    # Step 2: Knapsack Optimization for each priority group
+    allocated_seats = {}
+    
+    # Get already booked seats
+    occupied = context.occupancy(bus_number)
+    
+    # Process each priority group in order
+    for priority_level in ['Critical', 'High', 'Medium', 'Normal']:
+        group_bookings = priority_groups[priority_level]
+        
+        if not group_bookings:
+            continue
+        
+        # Apply Knapsack optimization within this priority group
+        group_allocations = knapsack_optimize_group(context, group_bookings, occupied, priority_level)
+        
+        # Update allocations and booked seats
+        for allocated_student, seat in group_allocations.items():
+            allocated_seats[allocated_student] = seat
+            occupied = SEAT_LAYOUT.take(occupied, seat)
+    
+    # Return seat for current student
+    if student_id in allocated_seats:
+        return bus_number, allocated_seats[student_id]
+    
+    return None, None
+
+@allocator('dropoff')
+def dropoff_seat_allocation(context, booking):
+    """
+    Drop-off sequence allocation
+    Stops are ordered by DistanceFromCollege and spread over the seats from
+    the door backwards, so students who get off first sit nearest the door
+    and nobody has to squeeze past later passengers at a stop. Seat orders
+    are precomputed once per route set by the route table.
+    """
+    seats = context.routes.dropoff_order(booking['Destination'])
+    if not seats:
+        return None, None
+    
+    # Bus of the slot with the most free seats around this stop's band
+    zone = next((zone for zone, rows in SEAT_ZONES.items() if seats[0][0] in rows), None)
+    bus_number = context.bus(zone)
+    
+    if not bus_number:
+        return None, None
+    
+    occupied = context.occupancy(bus_number)
+    for seat in seats:
+        if SEAT_LAYOUT.is_free(occupied, seat):
+            return bus_number, seat
+    
+    return None, None
+
+def knapsack_optimize_group(context, group_bookings, occupied, priority_level):
+    """
+    Apply 0/1 Knapsack optimization within a priority group
+    occupied is the bus occupancy bitmask (see SeatLayout)
+    """
+    if not group_bookings:
+        return {}
+    
+    if not SEAT_LAYOUT.count_free(occupied):
+        return {}
+    
+    # Create items for knapsack (each booking is an item)
+    items = []
+    for booking in group_bookings:
+        # Calculate value based on destination preference and priority level
+        base_value = calculate_seat_preference_score(context.routes, booking['Destination'], 'A1')
+        
+        # Priority level multiplier
+        priority_multiplier = {
+            'Critical': 3.0,  # Highest multiplier for critical cases
+            'High': 2.0,      # High multiplier for high priority
+            'Medium': 1.5,    # Medium multiplier
+            'Normal': 1.0     # Normal multiplier
+        }
+        
+        value = base_value * priority_multiplier[priority_level]
+        
+        # Special needs bonus
+        if booking.get('SpecialNeeds') != 'None':
+            if booking.get('SpecialNeeds') == 'Injury':
+                value += 50
+            elif booking.get('SpecialNeeds') == 'Disability':
+                value += 40
+            elif booking.get('SpecialNeeds') == 'Medical':
+                value += 45
+        
+        items.append({
+            'booking': booking,
+            'value': value,
+            'weight': 1  # Each booking has weight 1
+        })
+    
+    # Sort by value (descending) for greedy knapsack approach
+    order = sorted(range(len(items)), key=lambda i: items[i]['value'], reverse=True)
+    
+    # Allocate seats using greedy knapsack: best free seat by preference + special-needs bonus
+    seat_scores = context.scorer.seat_scores(group_bookings, GROUP_SEAT_BONUS)
+    group_allocations = context.scorer.greedy_assign(seat_scores, order, occupied)
+    
+    allocations = {}
+    for index in order:
+        if index in group_allocations:
+            allocations[group_bookings[index]['StudentID']] = group_allocations[index]
+    
+    return allocations
+
+def solve_batch_assignment(scorer, bookings, bus_occupancy, priority_scores=None, seat_scores=None):
+    """
+    Globally optimal seat assignment for a list of bookings
+    Builds a booking x free-seat weight matrix over every bus in
+    bus_occupancy ({BusNumber: occupancy bitmask}) and solves it as a
+    maximum-weight bipartite matching. Returns {booking index: (bus, seat)};
+    when there are more bookings than seats, the highest-weight ones win.
+    priority_scores and seat_scores (SPECIAL_NEEDS_SEAT_BONUS) may be given
+    when already computed, e.g. by a SlotContext; scorer is the SeatScorer.
+    """
+    columns = [(bus_number, seat) for bus_number, occupied in bus_occupancy.items()
+               for seat in SEAT_LAYOUT.free_seats(occupied)]
+    if not bookings or not columns:
+        return {}
+    
+    # Weight = priority score + seat preference + special-needs seat bonus
+    if priority_scores is None or seat_scores is None:
+        encoded = scorer.encode(bookings)
+        priority_scores = scorer.priority_scores(bookings, encoded)
+        seat_scores = scorer.seat_scores(bookings, SPECIAL_NEEDS_SEAT_BONUS, encoded)
+    weights = scorer.assignment_weights(priority_scores, seat_scores, [seat for _, seat in columns])
+    
+    assignment = max_weight_assignment(weights)
+    return {index: columns[column] for index, column in assignment.items()}
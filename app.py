@@ -1,629 +1,219 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, g
 import csv
+import io
 import os
-from datetime import datetime
 import json
-from queue import PriorityQueue
-from collections import deque
+from datetime import datetime
+from itertools import islice
+import click
+from allocation import ALLOCATORS, SEAT_LAYOUT, TIME_SLOTS
+from booking_service import BookingError, BookingService
+from events import EventHub
+from storage import BOOKING_FIELDS, SqliteStorage
+from bulk_import import REPORT_FIELDS, import_summary, read_requests
+import metrics
+from metrics import SlowRequestProfiler
 
 app = Flask(__name__)
 
-# Constants
-TOTAL_SEATS = 40  # 10 rows (A–J), 4 seats per row
-SEAT_ROWS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J']
-SEAT_COLS = [1, 2, 3, 4]
-SEAT_ZONES = {
-    'front': ['A', 'B', 'C'],
-    'middle': ['D', 'E', 'F', 'G'],
-    'back': ['H', 'I', 'J']
-}
-TIME_SLOTS = {
-    '11AM': {'reuse': None},
-    '1PM': {'reuse': '11AM'},
-    '4PM': {'reuse': '1PM'},
-    '6PM': {'reuse': '4PM'}
-}
-
-# Algorithm Configuration
-ALLOCATION_ALGORITHM = 'hybrid'  # Options: 'greedy', 'knapsack', 'dp_knapsack', 'priority_queue', 'round_robin', 'hybrid'
-
-# CSV file paths
-ROUTES_FILE = 'data/routes.csv'
-BOOKING_FILE = 'data/booking.csv'
-BUSES_FILE = 'data/buses.csv'
-
-def ensure_data_directory():
-    """Ensure the data directory exists and create CSV files if they don't exist"""
-    os.makedirs('data', exist_ok=True)
-    
-    # Create routes.csv if it doesn't exist
-    if not os.path.exists(ROUTES_FILE):
-        with open(ROUTES_FILE, 'w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(['Destination', 'DistanceFromCollege', 'SeatZone'])
-            writer.writerow(['Rajpur Road', 3, 'front'])
-            writer.writerow(['ISBT', 7, 'middle'])
-            writer.writerow(['Clement Town', 12, 'back'])
-    
-    # Create booking.csv if it doesn't exist
-    if not os.path.exists(BOOKING_FILE):
-        with open(BOOKING_FILE, 'w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(['BookingID', 'StudentID', 'Name', 'Email', 'BusNumber', 'SeatNumber', 'TimeSlot', 'Destination', 'BookingDate', 'Status'])
-    
-    # Create buses.csv if it doesn't exist
-    if not os.path.exists(BUSES_FILE):
-        with open(BUSES_FILE, 'w', newline='', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            writer.writerow(['BusID', 'BusNumber', 'TimeSlot', 'TotalSeats', 'BookedSeats', 'AvailableSeats', 'IsReused', 'ReusedFrom'])
-            writer.writerow(['B1', 'BUS1', '11AM', 40, 0, 40, False, ''])
-            writer.writerow(['B2', 'BUS2', '1PM', 40, 0, 40, False, ''])
-            writer.writerow(['B3', 'BUS3', '4PM', 40, 0, 40, False, ''])
-            writer.writerow(['B4', 'BUS4', '6PM', 40, 0, 40, False, ''])
-
-def get_next_booking_id():
-    """Generate the next booking ID"""
-    if not os.path.exists(BOOKING_FILE):
-        return 1
-    
-    with open(BOOKING_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        bookings = list(reader)
-        if not bookings:
-            return 1
-        return max(int(booking['BookingID']) for booking in bookings) + 1
-
-def get_available_seat(time_slot, destination):
-    """Greedy algorithm to allocate seat based on distance and zone"""
-    # Get destination zone
-    with open(ROUTES_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for route in reader:
-            if route['Destination'] == destination:
-                zone = route['SeatZone']
-                break
-        else:
-            zone = 'middle'  # default zone
-    
-    # Get current bus status
-    bus_number = None
-    with open(BUSES_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for bus in reader:
-            if bus['TimeSlot'] == time_slot:
-                bus_number = bus['BusNumber']
-                break
-    
-    if not bus_number:
-        return None, None
-    
-    # Get booked seats for this bus
-    booked_seats = set()
-    with open(BOOKING_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for booking in reader:
-            if booking['BusNumber'] == bus_number and booking['Status'] == 'Confirmed':
-                booked_seats.add(booking['SeatNumber'])
-    
-    # Find available seat in the appropriate zone
-    zone_rows = SEAT_ZONES[zone]
-    for row in zone_rows:
-        for col in SEAT_COLS:
-            seat = f"{row}{col}"
-            if seat not in booked_seats:
-                return bus_number, seat
-    
-    # If no seat in preferred zone, find any available seat
-    for row in SEAT_ROWS:
-        for col in SEAT_COLS:
-            seat = f"{row}{col}"
-            if seat not in booked_seats:
-                return bus_number, seat
-    
-    return None, None
-
-def calculate_seat_preference_score(destination, seat_number):
-    """Calculate preference score for a seat based on destination"""
-    # Get destination zone
-    with open(ROUTES_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for route in reader:
-            if route['Destination'] == destination:
-                zone = route['SeatZone']
-                distance = int(route['DistanceFromCollege'])
-                break
-        else:
-            zone = 'middle'
-            distance = 5  # default distance
-    
-    # Extract row from seat number (e.g., "A1" -> "A")
-    row = seat_number[0]
-    
-    # Calculate preference score
-    if zone == 'front' and row in ['A', 'B', 'C']:
-        return 10  # High preference for front zone
-    elif zone == 'middle' and row in ['D', 'E', 'F', 'G']:
-        return 10  # High preference for middle zone
-    elif zone == 'back' and row in ['H', 'I', 'J']:
-        return 10  # High preference for back zone
-    else:
-        # Lower preference for non-preferred zones
-        return 5
+# Seat layout, time slots, special-needs tables and the allocation strategies
+# live in allocation.py; storage and allocation are run by a BookingService
+# (booking_service.py), which works without Flask (see cli.py)
+DATA_DIR = 'data'
+# Optional overrides, followed by every worker without a restart (see /api/allocation-config):
+# {"default": "greedy", "slots": {"4PM": "dp_knapsack"}}
+ALLOCATION_CONFIG_FILE = os.path.join(DATA_DIR, 'allocation.json')
 
-def knapsack_seat_allocation(time_slot, destination, student_id):
-    """
-    0/1 Knapsack approach for seat allocation
-    Maximizes overall satisfaction while considering seat preferences
-    """
-    # Get bus number for time slot
-    bus_number = None
-    with open(BUSES_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for bus in reader:
-            if bus['TimeSlot'] == time_slot:
-                bus_number = bus['BusNumber']
-                break
-    
-    if not bus_number:
-        return None, None
-    
-    # Get all available seats
-    booked_seats = set()
-    with open(BOOKING_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for booking in reader:
-            if booking['BusNumber'] == bus_number and booking['Status'] == 'Confirmed':
-                booked_seats.add(booking['SeatNumber'])
-    
-    # Create list of available seats with their preference scores
-    available_seats = []
-    for row in SEAT_ROWS:
-        for col in SEAT_COLS:
-            seat = f"{row}{col}"
-            if seat not in booked_seats:
-                preference_score = calculate_seat_preference_score(destination, seat)
-                available_seats.append({
-                    'seat': seat,
-                    'value': preference_score,
-                    'weight': 1  # Each seat has weight 1
-                })
-    
-    if not available_seats:
-        return None, None
-    
-    # Sort by preference score (descending) for greedy approach
-    # In a full knapsack implementation, we'd use dynamic programming
-    available_seats.sort(key=lambda x: x['value'], reverse=True)
-    
-    # Return the seat with highest preference score
-    best_seat = available_seats[0]['seat']
-    return bus_number, best_seat
+# Storage backend: 'csv' (routes.csv, booking.csv and buses.csv in DATA_DIR),
+# 'sqlite' (one WAL-mode database, seeded from the CSV files on first start) or
+# 'binary' (bookings as fixed-width records in booking.bin, seeded from
+# booking.csv on first start; routes and buses stay in CSV)
+STORAGE_BACKEND = os.environ.get('BUS_OPTIMIZER_STORAGE', 'csv')
+DATABASE_FILE = os.environ.get('BUS_OPTIMIZER_DATABASE', os.path.join(DATA_DIR, 'bus_optimizer.db'))
+# Snapshot of the booking index (JSON lines); startup replays only the bookings
+# written after it (see journal.py)
+BOOKING_SNAPSHOT_FILE = os.environ.get('BUS_OPTIMIZER_SNAPSHOT', os.path.join(DATA_DIR, 'booking.snapshot'))
 
-def dynamic_programming_knapsack_seat_allocation(time_slot, destination, student_id):
-    """
-    Full 0/1 Knapsack implementation using dynamic programming
-    This would be used for batch allocation of multiple bookings
-    """
-    # This is a more complex implementation for batch optimization
-    # Would be useful when processing multiple bookings simultaneously
-    
-    # Get all pending bookings for the time slot
-    pending_bookings = []
-    with open(BOOKING_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for booking in reader:
-            if booking['TimeSlot'] == time_slot and booking['Status'] == 'Pending':
-                pending_bookings.append(booking)
-    
-    # Create items for knapsack (each booking is an item)
-    items = []
-    for booking in pending_bookings:
-        # Calculate value based on destination preference
-        value = calculate_seat_preference_score(booking['Destination'], 'A1')  # Example seat
-        items.append({
-            'booking': booking,
-            'value': value,
-            'weight': 1
-        })
-    
-    # Implement 0/1 Knapsack DP algorithm
-    # This would maximize total satisfaction across all bookings
-    # For now, return the greedy approach
-    return knapsack_seat_allocation(time_slot, destination, student_id)
+# /metrics is served to loopback clients unless BUS_OPTIMIZER_METRICS_REMOTE=1
+METRICS_ALLOW_REMOTE = os.environ.get('BUS_OPTIMIZER_METRICS_REMOTE') == '1'
+# Processes solving /api/batch-allocate (1 = in-process). Pool workers are
+# spawned, re-importing the main module: only raise it when serving through
+# run.py or a WSGI server, not with `python app.py`.
+BATCH_WORKERS = int(os.environ.get('BUS_OPTIMIZER_BATCH_WORKERS', '1'))
+# Opt-in: profile a sample of requests with cProfile and keep the stats of
+# those slower than BUS_OPTIMIZER_PROFILE_SLOW_MS
+PROFILE_SLOW_MS = os.environ.get('BUS_OPTIMIZER_PROFILE_SLOW_MS')
+PROFILE_SAMPLE_RATE = float(os.environ.get('BUS_OPTIMIZER_PROFILE_SAMPLE_RATE', '0.1'))
+PROFILE_DIR = os.path.join(DATA_DIR, 'profiles')
+# Open /api/events streams per process. Each one holds a server thread until
+# the client disconnects; run.py sets this to half of a worker's threads.
+# Clients turned away poll /api/seat-map instead.
+MAX_EVENT_STREAMS = int(os.environ.get('BUS_OPTIMIZER_MAX_STREAMS', '2'))
 
-def calculate_priority_score(student_id, special_needs, destination):
-    """
-    Calculate priority score for students based on special needs and destination
-    Higher score = Higher priority
-    """
-    priority_score = 0
-    
-    # Base priority based on special needs
-    if special_needs == 'Injury':
-        priority_score += 100  # Highest priority for injured students
-    elif special_needs == 'Disability':
-        priority_score += 80   # High priority for disabled students
-    elif special_needs == 'Elderly':
-        priority_score += 60   # Medium-high priority for elderly
-    elif special_needs == 'Pregnant':
-        priority_score += 70   # High priority for pregnant students
-    elif special_needs == 'Medical':
-        priority_score += 90   # Very high priority for medical conditions
-    
-    # Distance-based priority (longer distance = higher priority)
-    with open(ROUTES_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for route in reader:
-            if route['Destination'] == destination:
-                distance = int(route['DistanceFromCollege'])
-                priority_score += distance * 2  # Distance factor
-                break
-    
-    # Student ID based priority (lower ID = higher priority for same conditions)
-    priority_score += (10000 - int(student_id)) / 10000
-    
-    return priority_score
+slow_request_profiler = SlowRequestProfiler(PROFILE_DIR, float(PROFILE_SLOW_MS) / 1000 if PROFILE_SLOW_MS else None,
+                                            PROFILE_SAMPLE_RATE)
 
-def priority_queue_seat_allocation(time_slot, destination, student_id, special_needs):
-    """
-    Priority Queue algorithm for seat allocation
-    Prioritizes students with special needs, injuries, or longer travel distances
-    """
-    # Get bus number for time slot
-    bus_number = None
-    with open(BUSES_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for bus in reader:
-            if bus['TimeSlot'] == time_slot:
-                bus_number = bus['BusNumber']
-                break
-    
-    if not bus_number:
-        return None, None
-    
-    # Get all pending bookings for this time slot
-    pending_bookings = []
-    with open(BOOKING_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for booking in reader:
-            if booking['TimeSlot'] == time_slot and booking['Status'] == 'Pending':
-                pending_bookings.append(booking)
-    
-    # Add current booking to pending list
-    current_booking = {
-        'StudentID': student_id,
-        'Destination': destination,
-        'SpecialNeeds': special_needs
-    }
-    pending_bookings.append(current_booking)
-    
-    # Create priority queue
-    priority_queue = PriorityQueue()
-    
-    # Calculate priority scores and add to queue
-    for booking in pending_bookings:
-        priority_score = calculate_priority_score(
-            booking['StudentID'], 
-            booking.get('SpecialNeeds', 'None'), 
-            booking['Destination']
-        )
-        # Negative score because PriorityQueue returns lowest value first
-        priority_queue.put((-priority_score, booking))
-    
-    # Get booked seats for this bus
-    booked_seats = set()
-    with open(BOOKING_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for booking in reader:
-            if booking['BusNumber'] == bus_number and booking['Status'] == 'Confirmed':
-                booked_seats.add(booking['SeatNumber'])
-    
-    # Allocate seats based on priority
-    allocated_seats = {}
-    
-    while not priority_queue.empty():
-        priority_score, booking = priority_queue.get()
-        priority_score = -priority_score  # Convert back to positive
-        
-        # Find best available seat for this booking
-        best_seat = None
-        best_score = -1
-        
-        for row in SEAT_ROWS:
-            for col in SEAT_COLS:
-                seat = f"{row}{col}"
-                if seat not in booked_seats and seat not in allocated_seats.values():
-                    # Calculate seat preference score
-                    seat_score = calculate_seat_preference_score(booking['Destination'], seat)
-                    
-                    # Bonus for special needs students getting preferred seats
-                    if booking.get('SpecialNeeds') != 'None':
-                        if booking.get('SpecialNeeds') == 'Injury' and row in ['A', 'B']:  # Front seats for injured
-                            seat_score += 20
-                        elif booking.get('SpecialNeeds') == 'Disability' and row in ['A', 'B']:  # Front seats for disabled
-                            seat_score += 15
-                        elif booking.get('SpecialNeeds') == 'Elderly' and row in ['A', 'B', 'C']:  # Front-middle for elderly
-                            seat_score += 10
-                    
-                    if seat_score > best_score:
-                        best_score = seat_score
-                        best_seat = seat
-        
-        if best_seat:
-            allocated_seats[booking['StudentID']] = best_seat
-            booked_seats.add(best_seat)
-    
-    # Return seat for current student
-    if student_id in allocated_seats:
-        return bus_number, allocated_seats[student_id]
-    
-    return None, None
+@app.before_request
+def start_request_metrics():
+    metrics.start_request(request.endpoint or 'unmatched', slow_request_profiler)
 
-def round_robin_seat_allocation(time_slot, destination, student_id):
-    """
-    Round Robin algorithm for fair seat distribution
-    Ensures equal opportunity for all students regardless of booking time
-    """
-    # Get bus number for time slot
-    bus_number = None
-    with open(BUSES_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for bus in reader:
-            if bus['TimeSlot'] == time_slot:
-                bus_number = bus['BusNumber']
-                break
-    
-    if not bus_number:
-        return None, None
-    
-    # Get all bookings for this time slot
-    all_bookings = []
-    with open(BOOKING_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for booking in reader:
-            if booking['TimeSlot'] == time_slot:
-                all_bookings.append(booking)
-    
-    # Sort bookings by booking time (FIFO - First In, First Out)
-    all_bookings.sort(key=lambda x: x['BookingDate'])
-    
-    # Get booked seats
-    booked_seats = set()
-    for booking in all_bookings:
-        if booking['Status'] == 'Confirmed':
-            booked_seats.add(booking['SeatNumber'])
-    
-    # Create round robin queue for available seats
-    available_seats = deque()
-    for row in SEAT_ROWS:
-        for col in SEAT_COLS:
-            seat = f"{row}{col}"
-            if seat not in booked_seats:
-                available_seats.append(seat)
-    
-    if not available_seats:
-        return None, None
-    
-    # Find position of current student in booking queue
-    current_position = -1
-    for i, booking in enumerate(all_bookings):
-        if booking['StudentID'] == student_id:
-            current_position = i
-            break
-    
-    if current_position == -1:
-        # New booking, add to end of queue
-        current_position = len(all_bookings)
-    
-    # Rotate queue based on current position for fair distribution
-    rotation = current_position % len(available_seats)
-    available_seats.rotate(-rotation)
-    
-    # Get the next available seat
-    allocated_seat = available_seats.popleft()
-    
-    return bus_number, allocated_seat
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    return response
 
-def hybrid_priority_knapsack_allocation(time_slot, destination, student_id, special_needs):
-    """
-    Hybrid Algorithm: Combines Priority Queue and 0/1 Knapsack
-    Step 1: Use Priority Queue to rank students by priority
-    Step 2: Use Knapsack approach to optimize seat allocation for each priority group
-    """
-    # Get bus number for time slot
-    bus_number = None
-    with open(BUSES_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for bus in reader:
-            if bus['TimeSlot'] == time_slot:
-                bus_number = bus['BusNumber']
-                break
-    
-    if not bus_number:
-        return None, None
-    
-    # Get all pending bookings for this time slot
-    pending_bookings = []
-    with open(BOOKING_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for booking in reader:
-            if booking['TimeSlot'] == time_slot and booking['Status'] == 'Pending':
-                pending_bookings.append(booking)
-    
-    # Add current booking to pending list
-    current_booking = {
-        'StudentID': student_id,
-        'Destination': destination,
-        'SpecialNeeds': special_needs
-    }
-    pending_bookings.append(current_booking)
-    
-    # Step 1: Priority Queue - Group students by priority levels
-    priority_groups = {
-        'Critical': [],    # Injury, Medical (100-90 points)
-        'High': [],        # Disability, Pregnant (80-70 points)
-        'Medium': [],      # Elderly (60 points)
-        'Normal': []       # Regular students
-    }
-    
-    for booking in pending_bookings:
-        priority_score = calculate_priority_score(
-            booking['StudentID'], 
-            booking.get('SpecialNeeds', 'None'), 
-            booking['Destination']
-        )
-        
-        if priority_score >= 90:
-            priority_groups['Critical'].append(booking)
-        elif priority_score >= 70:
-            priority_groups['High'].append(booking)
-        elif priority_score >= 60:
-            priority_groups['Medium'].append(booking)
-        else:
-            priority_groups['Normal'].append(booking)
-    
-    # Step 2: Knapsack Optimization for each priority group
-    allocated_seats = {}
-    booked_seats = set()
-    
-    # Get already booked seats
-    with open(BOOKING_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for booking in reader:
-            if booking['BusNumber'] == bus_number and booking['Status'] == 'Confirmed':
-                booked_seats.add(booking['SeatNumber'])
-    
-    # Process each priority group in order
-    for priority_level in ['Critical', 'High', 'Medium', 'Normal']:
-        group_bookings = priority_groups[priority_level]
-        
-        if not group_bookings:
+@app.teardown_request
+def finish_request_metrics(exception):
+    metrics.finish_request(g.get('response_status', 500), slow_request_profiler)
+
+service = BookingService(DATA_DIR, STORAGE_BACKEND, database_file=DATABASE_FILE, snapshot_file=BOOKING_SNAPSHOT_FILE,
+                         allocation_config_file=ALLOCATION_CONFIG_FILE)
+# The service's parts used directly by the routes below
+booking_store = service.booking_store
+bus_table = service.bus_table
+route_table = service.route_table
+slot_locks = service.slot_locks
+allocation_settings = service.allocation_settings
+
+# Live seat/bus events for /api/events. Seat events come from the booking store,
+# so commits by other worker processes are published once this process syncs.
+event_hub = EventHub(poll=booking_store.sync, max_subscribers=MAX_EVENT_STREAMS)
+
+def publish_seat_changes(version, changes):
+    for bus_number, seat_number, taken in changes:
+        event_hub.publish('seat', {'bus': bus_number, 'seat': seat_number, 'taken': taken, 'version': version})
+
+def publish_bus_counters(bus):
+    event_hub.publish('bus', {'bus': bus['BusNumber'], 'booked': int(bus['BookedSeats']), 'available': int(bus['AvailableSeats'])})
+
+booking_store.add_listener(publish_seat_changes)
+service.add_bus_listener(publish_bus_counters)
+
+# Caches are warm before the first request (see /ready); the fleet is only
+# re-planned on demand (POST /api/fleet/plan, batch allocation)
+service.warm()
+
+def commit_booking(data):
+    """Allocate and persist one booking as a JSON response; the caller holds the lock of its time slot"""
+    try:
+        booking, algorithm = service.commit_booking(data)
+    except BookingError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'message': 'Seat Booked Successfully!',
+        'booking': booking,
+        'algorithm': algorithm
+    })
+
+# Booking listings: JSON pages, or streamed exports for ?format=ndjson / ?format=csv
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_CHUNK_ROWS = 200  # rows per streamed chunk
+
+def int_arg(name, minimum=0):
+    """Non-negative integer query parameter, or None when absent"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    number = int(value)  # ValueError is reported as a 400 by the caller
+    if number < minimum:
+        raise ValueError(f'{name} must be at least {minimum}')
+    return number
+
+def booking_filter(args):
+    """Predicate for the timeSlot, bus, status (comma separated) and from/to date parameters"""
+    time_slot = args.get('timeSlot')
+    bus_number = args.get('bus')
+    statuses = set(args['status'].split(',')) if args.get('status') else None
+    date_from = args.get('from')
+    date_to = args.get('to')
+    if date_to and len(date_to) == 10:  # a bare date includes the whole day
+        date_to += ' 23:59:59'
+
+    def matches(booking):
+        if time_slot and booking.get('TimeSlot') != time_slot:
+            return False
+        if bus_number and booking.get('BusNumber') != bus_number:
+            return False
+        if statuses and booking.get('Status') not in statuses:
+            return False
+        booking_date = booking.get('BookingDate') or ''
+        if date_from and booking_date < date_from:
+            return False
+        if date_to and booking_date > date_to:
+            return False
+        return True
+    return matches
+
+def matching_bookings(rows, matches, offset=0):
+    """(position, booking) pairs of rows accepted by matches, skipping the first offset matches"""
+    for position, booking in rows:
+        if not matches(booking):
             continue
-        
-        # Apply Knapsack optimization within this priority group
-        group_allocations = knapsack_optimize_group(group_bookings, booked_seats, priority_level)
-        
-        # Update allocations and booked seats
-        for student_id, seat in group_allocations.items():
-            allocated_seats[student_id] = seat
-            booked_seats.add(seat)
-    
-    # Return seat for current student
-    if student_id in allocated_seats:
-        return bus_number, allocated_seats[student_id]
-    
-    return None, None
+        if offset:
+            offset -= 1
+            continue
+        yield position, booking
 
-def knapsack_optimize_group(group_bookings, booked_seats, priority_level):
+def export_bookings(matches, export_format):
+    """Generator of NDJSON lines or CSV text for streamed bookings"""
+    buffer = io.StringIO()
+    if export_format == 'csv':
+        writer = csv.DictWriter(buffer, fieldnames=BOOKING_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+    count = 0
+    for _, booking in matches:
+        if export_format == 'csv':
+            writer.writerow(booking)
+        else:
+            buffer.write(json.dumps(booking) + '\n')
+        count += 1
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def list_bookings(rows_from):
     """
-    Apply 0/1 Knapsack optimization within a priority group
+    Respond with bookings filtered and paginated by the query string
+    rows_from(cursor) yields (position, booking) pairs in booking order,
+    starting at position cursor.
+    cursor starts the listing at a position and offset skips matches; with
+    limit, a JSON page carries the cursor of the following match in the
+    X-Next-Cursor header. Without limit the whole listing is returned, as
+    before.
     """
-    if not group_bookings:
-        return {}
-    
-    # Get available seats for this group
-    available_seats = []
-    for row in SEAT_ROWS:
-        for col in SEAT_COLS:
-            seat = f"{row}{col}"
-            if seat not in booked_seats:
-                available_seats.append(seat)
-    
-    if not available_seats:
-        return {}
-    
-    # Create items for knapsack (each booking is an item)
-    items = []
-    for booking in group_bookings:
-        # Calculate value based on destination preference and priority level
-        base_value = calculate_seat_preference_score(booking['Destination'], 'A1')
-        
-        # Priority level multiplier
-        priority_multiplier = {
-            'Critical': 3.0,  # Highest multiplier for critical cases
-            'High': 2.0,      # High multiplier for high priority
-            'Medium': 1.5,    # Medium multiplier
-            'Normal': 1.0     # Normal multiplier
-        }
-        
-        value = base_value * priority_multiplier[priority_level]
-        
-        # Special needs bonus
-        if booking.get('SpecialNeeds') != 'None':
-            if booking.get('SpecialNeeds') == 'Injury':
-                value += 50
-            elif booking.get('SpecialNeeds') == 'Disability':
-                value += 40
-            elif booking.get('SpecialNeeds') == 'Medical':
-                value += 45
-        
-        items.append({
-            'booking': booking,
-            'value': value,
-            'weight': 1  # Each booking has weight 1
-        })
-    
-    # Sort by value (descending) for greedy knapsack approach
-    items.sort(key=lambda x: x['value'], reverse=True)
-    
-    # Allocate seats using greedy knapsack
-    allocations = {}
-    seat_index = 0
-    
-    for item in items:
-        if seat_index < len(available_seats):
-            # Find best available seat for this booking
-            best_seat = None
-            best_score = -1
-            
-            for seat in available_seats:
-                if seat not in allocations.values():
-                    seat_score = calculate_seat_preference_score(item['booking']['Destination'], seat)
-                    
-                    # Bonus for special needs students getting preferred seats
-                    if item['booking'].get('SpecialNeeds') != 'None':
-                        row = seat[0]
-                        if item['booking'].get('SpecialNeeds') == 'Injury' and row in ['A', 'B']:
-                            seat_score += 20
-                        elif item['booking'].get('SpecialNeeds') == 'Disability' and row in ['A', 'B']:
-                            seat_score += 15
-                        elif item['booking'].get('SpecialNeeds') == 'Medical' and row in ['A', 'B']:
-                            seat_score += 18
-                    
-                    if seat_score > best_score:
-                        best_score = seat_score
-                        best_seat = seat
-            
-            if best_seat:
-                allocations[item['booking']['StudentID']] = best_seat
-                seat_index += 1
-    
-    return allocations
-
-def update_bus_status(bus_number):
-    """Update bus booking status"""
-    # Count booked seats for this bus
-    booked_count = 0
-    with open(BOOKING_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for booking in reader:
-            if booking['BusNumber'] == bus_number and booking['Status'] == 'Confirmed':
-                booked_count += 1
-    
-    # Update buses.csv
-    buses = []
-    with open(BUSES_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for bus in reader:
-            if bus['BusNumber'] == bus_number:
-                bus['BookedSeats'] = booked_count
-                bus['AvailableSeats'] = TOTAL_SEATS - booked_count
-            buses.append(bus)
-    
-    with open(BUSES_FILE, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.DictWriter(file, fieldnames=['BusID', 'BusNumber', 'TimeSlot', 'TotalSeats', 'BookedSeats', 'AvailableSeats', 'IsReused', 'ReusedFrom'])
-        writer.writeheader()
-        writer.writerows(buses)
+    try:
+        limit = int_arg('limit', minimum=1)
+        offset = int_arg('offset') or 0
+        cursor = int_arg('cursor') or 0
+    except ValueError as error:
+        return jsonify({'error': f'Invalid pagination parameter: {error}'}), 400
+    export_format = request.args.get('format', 'json')
+    if export_format != 'json' and export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown format: {export_format}'}), 400
+
+    matches = matching_bookings(rows_from(cursor), booking_filter(request.args), offset)
+
+    if export_format in EXPORT_FORMATS:
+        if limit is not None:
+            matches = islice(matches, limit)
+        response = Response(export_bookings(matches, export_format), mimetype=EXPORT_FORMATS[export_format])
+        if export_format == 'csv':
+            response.headers['Content-Disposition'] = 'attachment; filename=bookings.csv'
+        return response
+
+    if limit is None:
+        return jsonify([booking for _, booking in matches])
+    page = [booking for _, booking in islice(matches, limit)]
+    response = jsonify(page)
+    following = next(matches, None)
+    if following is not None:
+        response.headers['X-Next-Cursor'] = str(following[0])
+    return response
 
 @app.route('/')
 def index():
@@ -640,22 +230,13 @@ def admin():
 @app.route('/api/routes', methods=['GET'])
 def get_routes():
     """Get all routes from routes.csv"""
-    routes = []
-    with open(ROUTES_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for route in reader:
-            routes.append(route)
-    return jsonify(routes)
+    return jsonify(route_table.rows())
 
 @app.route('/api/bookings', methods=['GET'])
 def get_bookings():
-    """Get all bookings from booking.csv"""
-    bookings = []
-    with open(BOOKING_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for booking in reader:
-            bookings.append(booking)
-    return jsonify(bookings)
+    """Get bookings, optionally filtered, paginated or streamed (see list_bookings)"""
+    booking_store.sync()
+    return list_bookings(lambda cursor: booking_store.iter_bookings(start=cursor))
 
 @app.route('/api/student-bookings', methods=['GET'])
 def get_student_bookings():
@@ -666,15 +247,11 @@ def get_student_bookings():
     if not student_email and not student_id:
         return jsonify({'error': 'Email or Student ID is required'}), 400
     
-    bookings = []
-    with open(BOOKING_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for booking in reader:
-            if (student_email and booking['Email'] == student_email) or \
-               (student_id and booking['StudentID'] == student_id):
-                bookings.append(booking)
+    booking_store.sync()
+    bookings = booking_store.student_bookings(student_id=student_id, email=student_email)
     
-    return jsonify(bookings)
+    positions = [(booking_store.position_of(booking['BookingID']), booking) for booking in bookings]
+    return list_bookings(lambda cursor: (row for row in positions if row[0] >= cursor))
 
 @app.route('/api/book', methods=['POST'])
 def book_seat():
@@ -691,82 +268,425 @@ def book_seat():
         if not all([name, student_id, email, time_slot, destination]):
             return jsonify({'error': 'All fields are required'}), 400
         
-        # Check if student already has a booking for this time slot
-        with open(BOOKING_FILE, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for booking in reader:
-                if booking['StudentID'] == student_id and booking['TimeSlot'] == time_slot and booking['Status'] == 'Confirmed':
-                    return jsonify({'error': 'You already have a booking for this time slot'}), 400
-        
-        # Allocate seat
-        if ALLOCATION_ALGORITHM == 'greedy':
-            bus_number, seat_number = get_available_seat(time_slot, destination)
-        elif ALLOCATION_ALGORITHM == 'knapsack':
-            bus_number, seat_number = knapsack_seat_allocation(time_slot, destination, student_id)
-        elif ALLOCATION_ALGORITHM == 'dp_knapsack':
-            bus_number, seat_number = dynamic_programming_knapsack_seat_allocation(time_slot, destination, student_id)
-        elif ALLOCATION_ALGORITHM == 'priority_queue':
-            special_needs = data.get('specialNeeds')
-            bus_number, seat_number = priority_queue_seat_allocation(time_slot, destination, student_id, special_needs)
-        elif ALLOCATION_ALGORITHM == 'round_robin':
-            bus_number, seat_number = round_robin_seat_allocation(time_slot, destination, student_id)
-        elif ALLOCATION_ALGORITHM == 'hybrid':
-            special_needs = data.get('specialNeeds')
-            bus_number, seat_number = hybrid_priority_knapsack_allocation(time_slot, destination, student_id, special_needs)
-        else:
-            bus_number, seat_number = get_available_seat(time_slot, destination)  # Default to greedy
-        
-        if not bus_number or not seat_number:
-            return jsonify({'error': 'No seats available for this time slot'}), 400
-        
-        # Create booking
-        booking_id = get_next_booking_id()
-        booking_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        special_needs = data.get('specialNeeds', 'None')
-        priority = data.get('priority', 'Normal')
-        
-        new_booking = {
-            'BookingID': booking_id,
-            'StudentID': student_id,
-            'Name': name,
-            'Email': email,
-            'BusNumber': bus_number,
-            'SeatNumber': seat_number,
-            'TimeSlot': time_slot,
-            'Destination': destination,
-            'BookingDate': booking_date,
-            'Status': 'Confirmed',
-            'Priority': priority,
-            'SpecialNeeds': special_needs
-        }
+        # Optional per-request strategy (e.g. for A/B comparisons)
+        if data.get('algorithm') and data['algorithm'] not in ALLOCATORS:
+            return jsonify({'error': 'Unknown allocation algorithm'}), 400
+        
+        with metrics.stage('bus_lookup'):
+            has_bus = service.find_bus_for_time_slot(time_slot)
+        if not has_bus:
+            # The client may offer POST /api/waitlist instead
+            return jsonify({'error': 'No seats available for this time slot', 'waitlist': True}), 400
+        
+        # Check, pick a bus, allocate and commit while holding the slot lock, so
+        # concurrent requests (threads or worker processes) never get the same seat
+        slot_lock = slot_locks(time_slot)
+        with metrics.stage('lock_wait'):
+            slot_lock.acquire()
+        try:
+            with metrics.stage('sync'):
+                booking_store.sync()
+            return commit_booking(data)
+        finally:
+            slot_lock.release()
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/pending', methods=['POST'])
+def queue_booking():
+    """Queue a seat request for the next batch allocation of its time slot"""
+    try:
+        data = request.get_json()
+        name = data.get('name')
+        student_id = data.get('studentId')
+        email = data.get('email')
+        time_slot = data.get('timeSlot')
+        destination = data.get('destination')
+        
+        if not all([name, student_id, email, time_slot, destination]):
+            return jsonify({'error': 'All fields are required'}), 400
+        
+        if time_slot not in TIME_SLOTS:
+            return jsonify({'error': 'Unknown time slot'}), 400
         
-        # Save booking to CSV
-        with open(BOOKING_FILE, 'a', newline='', encoding='utf-8') as file:
-            writer = csv.DictWriter(file, fieldnames=['BookingID', 'StudentID', 'Name', 'Email', 'BusNumber', 'SeatNumber', 'TimeSlot', 'Destination', 'BookingDate', 'Status', 'Priority', 'SpecialNeeds'])
-            writer.writerow(new_booking)
+        if route_table.get(destination) is None:
+            return jsonify({'error': 'Unknown destination'}), 400
         
-        # Update bus status
-        update_bus_status(bus_number)
+        if not str(student_id).isdigit():
+            return jsonify({'error': 'Student ID must be numeric'}), 400
+        
+        with slot_locks(time_slot):
+            booking_store.sync()
+            if booking_store.has_booking(student_id, time_slot, ('Confirmed', 'Pending')):
+                return jsonify({'error': 'You already have a booking for this time slot'}), 400
+            
+            pending_booking = booking_store.append({
+                'BookingID': None,
+                'StudentID': student_id,
+                'Name': name,
+                'Email': email,
+                'BusNumber': '',
+                'SeatNumber': '',
+                'TimeSlot': time_slot,
+                'Destination': destination,
+                'BookingDate': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'Status': 'Pending',
+                'Priority': data.get('priority', 'Normal'),
+                'SpecialNeeds': data.get('specialNeeds', 'None')
+            })
         
         return jsonify({
             'success': True,
-            'message': 'Seat Booked Successfully!',
-            'booking': new_booking
+            'message': 'Request queued for batch allocation',
+            'booking': pending_booking
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/waitlist', methods=['POST'])
+def join_waitlist():
+    """Wait for a seat in a time slot; seated right away if one is free"""
+    try:
+        data = request.get_json()
+        name = data.get('name')
+        student_id = data.get('studentId')
+        email = data.get('email')
+        time_slot = data.get('timeSlot')
+        destination = data.get('destination')
+        
+        if not all([name, student_id, email, time_slot, destination]):
+            return jsonify({'error': 'All fields are required'}), 400
+        
+        if time_slot not in TIME_SLOTS:
+            return jsonify({'error': 'Unknown time slot'}), 400
+        
+        if route_table.get(destination) is None:
+            return jsonify({'error': 'Unknown destination'}), 400
+        
+        if not str(student_id).isdigit():
+            return jsonify({'error': 'Student ID must be numeric'}), 400
+        
+        with slot_locks(time_slot):
+            booking_store.sync()
+            if booking_store.has_booking(student_id, time_slot, ('Confirmed', 'Pending', 'Waitlisted')):
+                return jsonify({'error': 'You already have a booking for this time slot'}), 400
+            
+            waitlisted = booking_store.append({
+                'BookingID': None,
+                'StudentID': student_id,
+                'Name': name,
+                'Email': email,
+                'BusNumber': '',
+                'SeatNumber': '',
+                'TimeSlot': time_slot,
+                'Destination': destination,
+                'BookingDate': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'Status': 'Waitlisted',
+                'Priority': data.get('priority', 'Normal'),
+                'SpecialNeeds': data.get('specialNeeds', 'None')
+            })
+        
+        service.fill_from_waitlist(time_slot)
+        booking = booking_store.get(waitlisted['BookingID'])
+        if booking['Status'] == 'Confirmed':
+            return jsonify({'success': True, 'message': 'Seat Booked Successfully!', 'booking': booking})
+        
+        position = [waiter['BookingID'] for waiter in booking_store.waitlisted(time_slot)].index(booking['BookingID']) + 1
+        return jsonify({
+            'success': True,
+            'message': 'Added to the waitlist',
+            'booking': booking,
+            'position': position
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/waitlist', methods=['GET'])
+def get_waitlist():
+    """Waitlisted students of a time slot, highest priority first"""
+    time_slot = request.args.get('timeSlot')
+    if time_slot not in TIME_SLOTS:
+        return jsonify({'error': 'Unknown time slot'}), 400
+    
+    booking_store.sync()
+    return jsonify([dict(booking, WaitlistPosition=position)
+                    for position, booking in enumerate(booking_store.waitlisted(time_slot), start=1)])
+
+@app.route('/api/cancel', methods=['POST'])
+def cancel_booking():
+    """
+    Cancel a booking (confirmed, pending or waitlisted)
+    A freed seat goes to the slot's highest-priority waitlisted student in
+    the same write that cancels the booking.
+    """
+    try:
+        data = request.get_json()
+        booking_id = str(data.get('bookingId') or '')
+        student_id = data.get('studentId')
+        
+        if not booking_id or not student_id:
+            return jsonify({'error': 'Booking ID and student ID are required'}), 400
+        
+        booking_store.sync()
+        booking = booking_store.get(booking_id)
+        if booking is None or booking['StudentID'] != str(student_id):
+            return jsonify({'error': 'Booking not found'}), 404
+        
+        try:
+            cancelled, promoted = service.cancel(booking_id)
+        except BookingError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'message': 'Booking cancelled',
+            'booking': cancelled,
+            'promoted': promoted
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/batch-allocate', methods=['POST'])
+def batch_allocate():
+    """Allocate all pending requests of one time slot (or of every slot)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        time_slot = data.get('timeSlot')
+        
+        if time_slot and time_slot not in TIME_SLOTS:
+            return jsonify({'error': 'Unknown time slot'}), 400
+        
+        # Make sure every slot has enough buses for its queue first
+        service.plan_buses()
+        slots = [time_slot] if time_slot else list(TIME_SLOTS)
+        confirmed, still_pending = service.batch_allocate(slots, workers=BATCH_WORKERS)
+        results = {}
+        for slot in slots:
+            results[slot] = {
+                'allocated': confirmed[slot],
+                'pending': still_pending[slot],
+                'promoted': service.fill_from_waitlist(slot)
+            }
+        
+        return jsonify({'success': True, 'results': results})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/import', methods=['POST'])
+def import_booking_requests():
+    """
+    Bulk import of booking requests from a CSV upload (multipart field
+    'file', or a text/csv request body)
+    Query parameters: waitlist=1 waitlists students left without a seat,
+    plan=1 re-plans the fleet for the imported demand first, format=csv
+    returns the per-row report as CSV instead of JSON.
+    """
+    try:
+        upload = request.files.get('file')
+        stream = upload.stream if upload is not None else request.stream
+        lines = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        
+        try:
+            report = service.import_bookings(read_requests(lines),
+                                     waitlist=request.args.get('waitlist') in ('1', 'true'),
+                                     plan=request.args.get('plan') in ('1', 'true'))
+        except (ValueError, UnicodeDecodeError) as e:
+            return jsonify({'error': f'Invalid CSV: {e}'}), 400
+        
+        if request.args.get('format') == 'csv':
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(report)
+            return Response(buffer.getvalue(), mimetype='text/csv')
+        
+        return jsonify({'success': True, 'summary': import_summary(report), 'results': report})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/fleet/plan', methods=['POST'])
+def replan_fleet():
+    """Re-plan bus reuse and overflow buses from current demand"""
+    try:
+        buses, vehicles, skipped = service.plan_buses()
+        # Overflow buses may have made room for waitlisted students
+        promoted = [booking for time_slot in TIME_SLOTS for booking in service.fill_from_waitlist(time_slot)]
+        return jsonify({'success': True, 'physicalBuses': vehicles, 'buses': buses, 'promoted': promoted,
+                        'skippedSlots': skipped})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/allocation-config', methods=['GET'])
+def get_allocation_config():
+    """Allocation strategy in use by default and per time slot"""
+    settings = allocation_settings.get()
+    return jsonify({
+        'default': settings.get('default') or service.default_algorithm,
+        'slots': {time_slot: service.allocation_algorithm(time_slot) for time_slot in TIME_SLOTS},
+        'algorithms': sorted(ALLOCATORS)
+    })
+
+@app.route('/api/allocation-config', methods=['PUT'])
+def set_allocation_config():
+    """Set the default and/or per-slot strategies ({"default": ..., "slots": {TimeSlot: ...}}; null clears)"""
+    try:
+        data = request.get_json()
+        default = data.get('default')
+        slots = {time_slot: algorithm for time_slot, algorithm in (data.get('slots') or {}).items() if algorithm}
+        
+        if default and default not in ALLOCATORS or any(algorithm not in ALLOCATORS for algorithm in slots.values()):
+            return jsonify({'error': 'Unknown allocation algorithm'}), 400
+        if any(time_slot not in TIME_SLOTS for time_slot in slots):
+            return jsonify({'error': 'Unknown time slot'}), 400
+        
+        settings = {'slots': slots}
+        if default:
+            settings['default'] = default
+        allocation_settings.save(settings)
+        return get_allocation_config()
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/buses', methods=['GET'])
 def get_buses():
     """Get all bus information"""
-    buses = []
-    with open(BUSES_FILE, 'r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for bus in reader:
-            buses.append(bus)
-    return jsonify(buses)
+    return jsonify(bus_table.buses())
+
+@app.route('/api/seat-map', methods=['GET'])
+def get_seat_map():
+    """
+    Confirmed seats per bus as hex bitmaps (bit i = SEAT_LAYOUT.seats[i])
+    The response is tagged with the booking version (ETag and "version").
+    A conditional request for the current version gets a 304; with
+    ?since=<version> only the seats changed since then are returned, as
+    "taken"/"released" bitmaps per bus, unless the server no longer knows
+    them, in which case the full map is sent.
+    """
+    booking_store.sync()
+    version = booking_store.version()
+    etag = str(version)
+    try:
+        since = int_arg('since')
+    except ValueError as error:
+        return jsonify({'error': f'Invalid since: {error}'}), 400
+
+    if request.if_none_match.contains(etag) or since == version:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    changes = booking_store.seat_changes(since) if since is not None else None
+    if changes is None:
+        payload = {
+            'version': version,
+            'rows': SEAT_LAYOUT.rows,
+            'cols': SEAT_LAYOUT.cols,
+            'buses': {bus['BusNumber']: format(booking_store.occupancy(bus['BusNumber']), 'x')
+                      for bus in bus_table.buses()}
+        }
+    else:
+        # Replay in order so each seat ends up in its latest state
+        latest = {}
+        for bus_number, seat_number, taken in changes:
+            latest[(bus_number, seat_number)] = taken
+        buses = {}
+        for (bus_number, seat_number), taken in latest.items():
+            masks = buses.setdefault(bus_number, {'taken': 0, 'released': 0})
+            masks['taken' if taken else 'released'] |= SEAT_LAYOUT.mask_of((seat_number,))
+        payload = {
+            'version': version,
+            'since': since,
+            'changes': {bus_number: {key: format(mask, 'x') for key, mask in masks.items()}
+                        for bus_number, masks in buses.items()}
+        }
+
+    response = jsonify(payload)
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events: "seat" when a seat is taken or released, "bus" when a
+    bus counter changes, "resync" when the client fell behind and should
+    re-read /api/seat-map
+    503 once MAX_EVENT_STREAMS streams are open in this process
+    """
+    subscription = event_hub.subscribe()
+    if subscription is None:
+        response = jsonify({'error': 'Too many open event streams; poll /api/seat-map instead'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    try:
+        booking_store.sync()
+    except Exception:
+        event_hub.unsubscribe(subscription)
+        raise
+    response = Response(event_hub.stream(subscription, hello={'version': booking_store.version()}),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # The stream's own cleanup only runs once it has started
+    response.call_on_close(lambda: event_hub.unsubscribe(subscription))
+    return response
+
+@app.route('/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 200 once this worker's caches are warm, 503 before"""
+    if not service.ready:
+        return jsonify({'ready': False}), 503
+    return jsonify({'ready': True, 'pid': os.getpid(), 'version': booking_store.version()})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request metrics of this worker process in the Prometheus text format"""
+    if not METRICS_ALLOW_REMOTE and request.remote_addr not in ('127.0.0.1', '::1'):
+        return jsonify({'error': 'Metrics are only served to local clients'}), 403
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.cli.command('migrate-sqlite')
+def migrate_sqlite_command():
+    """Copy routes, bookings and buses from the CSV files into the SQLite database"""
+    counts = SqliteStorage(DATABASE_FILE).migrate_from_csv(service.routes_file, service.booking_file, service.buses_file)
+    if counts is None:
+        print(f'{DATABASE_FILE} already has data; remove it to migrate again')
+        return
+    routes, bookings, buses = counts
+    print(f'Migrated {routes} routes, {bookings} bookings and {buses} buses into {DATABASE_FILE}')
+
+@app.cli.command('compact-bookings')
+def compact_bookings_command():
+    """Rewrite booking.csv with the latest row of each booking and snapshot the index"""
+    booking_store.wait()
+    rows = booking_store.journal_rows
+    booking_store.compact()
+    booking_store.sync()
+    print(f'Compacted {rows} booking rows to {len(booking_store.all_bookings())} bookings')
+
+@app.cli.command('import-bookings')
+@click.argument('csv_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--waitlist', is_flag=True, help='Waitlist students left without a seat instead of rejecting them')
+@click.option('--plan', is_flag=True, help='Re-plan the fleet (overflow buses) for the imported demand first')
+@click.option('--report', type=click.Path(dir_okay=False), help='Write the per-row result report to this CSV file')
+def import_bookings_command(csv_file, waitlist, plan, report):
+    """Import booking requests from a registrar CSV file"""
+    with open(csv_file, newline='', encoding='utf-8-sig') as file:
+        rows = service.import_bookings(read_requests(file), waitlist=waitlist, plan=plan)
+    if report:
+        with open(report, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    summary = import_summary(rows)
+    print(f"Imported {len(rows)} rows: {summary['Confirmed']} confirmed, "
+          f"{summary['Waitlisted']} waitlisted, {summary['Rejected']} rejected")
 
 if __name__ == '__main__':
-    ensure_data_directory()
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
@@ -0,0 +1,61 @@
+def max_weight_assignment(weights):
+    """
+    Maximum-weight bipartite assignment (Hungarian algorithm)
+    weights is an n x m matrix (list of rows); returns {row: column}.
+    Every row is matched when n <= m, every column when n > m.
+    Runs in O(min(n, m)^2 * max(n, m)), so a 40-seat bus with a queue of
+    N students costs O(40^2 * N).
+    """
+    n = len(weights)
+    if n == 0:
+        return {}
+    m = len(weights[0])
+    if m == 0:
+        return {}
+
+    if n > m:
+        transposed = [[weights[i][j] for i in range(n)] for j in range(m)]
+        return {i: j for j, i in max_weight_assignment(transposed).items()}
+
+    # Shortest augmenting path formulation on costs = -weights, 1-indexed
+    inf = float('inf')
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    match = [0] * (m + 1)  # column -> row
+    way = [0] * (m + 1)
+
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        min_slack = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            row = weights[i0 - 1]
+            delta = inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = -row[j - 1] - u[i0] - v[j]
+                    if cur < min_slack[j]:
+                        min_slack[j] = cur
+                        way[j] = j0
+                    if min_slack[j] < delta:
+                        delta = min_slack[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_slack[j] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+
+    return {match[j] - 1: j - 1 for j in range(1, m + 1) if match[j]}
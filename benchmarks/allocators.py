@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Allocation benchmark across every ALLOCATION_ALGORITHM option
+Generates synthetic workloads (number of destinations, booking history size,
+pending-queue length, special-needs mix), runs each allocator headlessly (a
+BookingService, without Flask) in a fresh process on its own copy of the data
+and reports per-booking latency percentiles, file opens per booking and
+allocation quality.
+
+    python benchmarks/allocators.py
+    python benchmarks/allocators.py --destinations 3,50 --history 0,20000 --pending 0,200 --special 0.1,0.5
+    python benchmarks/allocators.py --algorithms greedy,hybrid --json results.json
+
+Quality columns:
+    zone      share of granted seats in the destination's seat zone
+    priority  share of special-needs students seated in their bonus rows
+              (SPECIAL_NEEDS_SEAT_BONUS)
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from storage import BOOKING_FIELDS, BUS_FIELDS, ROUTE_FIELDS  # noqa: E402
+
+ALGORITHMS = ['greedy', 'knapsack', 'dp_knapsack', 'priority_queue', 'round_robin', 'hybrid', 'dropoff']
+TIME_SLOTS = ['11AM', '1PM', '4PM', '6PM']
+ZONES = ['front', 'middle', 'back']
+SPECIAL_NEEDS = ['Injury', 'Medical', 'Disability', 'Pregnant', 'Elderly']
+SEATS_PER_BUS = 40
+HISTORY_FILL = 0.25  # share of each bus already confirmed by the booking history
+
+# Runs inside the worker process: {work_dir, algorithm, requests}
+WORKER_SCRIPT = """
+import builtins, json, os, sys, time
+sys.path.insert(0, {repo!r})
+config = json.load(sys.stdin)
+os.chdir(config['work_dir'])
+
+opens = [0]
+real_open, real_os_open = builtins.open, os.open
+def counting_open(*args, **kwargs):
+    opens[0] += 1
+    return real_open(*args, **kwargs)
+def counting_os_open(*args, **kwargs):
+    opens[0] += 1
+    return real_os_open(*args, **kwargs)
+builtins.open, os.open = counting_open, counting_os_open
+
+started = time.perf_counter()
+from allocation import SEAT_ZONES, SPECIAL_NEEDS_SEAT_BONUS
+from booking_service import BookingError, BookingService
+service = BookingService(backend=os.environ.get('BUS_OPTIMIZER_STORAGE', 'csv'), default_algorithm=config['algorithm'])
+service.plan_buses()  # overflow buses for the stored demand, as POST /api/fleet/plan would add
+startup = time.perf_counter() - started
+startup_opens = opens[0]
+
+latencies, granted = [], []
+opens[0] = 0
+for data in config['requests']:
+    started = time.perf_counter()
+    try:
+        booking, _ = service.book(data)
+        granted.append(booking)
+    except BookingError:
+        pass
+    latencies.append(time.perf_counter() - started)
+request_opens = opens[0]
+service.bus_table.flush()
+
+zones = {{destination: route['zone'] for destination, route in service.route_table.snapshot().items()}}
+print(json.dumps({{
+    'startup': startup,
+    'startup_opens': startup_opens,
+    'latencies': latencies,
+    'opens': request_opens,
+    'granted': [[booking['Destination'], booking['SeatNumber'], booking['SpecialNeeds']] for booking in granted],
+    'zone_rows': {{zone: rows for zone, rows in SEAT_ZONES.items()}},
+    'destination_zones': zones,
+    'bonus_rows': {{need: rows for need, (_, rows) in SPECIAL_NEEDS_SEAT_BONUS.items()}}
+}}))
+"""
+
+
+def seat_numbers():
+    return [f'{row}{col}' for row in 'ABCDEFGHIJ' for col in range(1, 5)]
+
+
+def generate_workload(work_dir, destinations, history, pending, special_share, requests, seed):
+    """Write routes/booking/buses CSVs into work_dir/data; return the booking requests to replay"""
+    rng = random.Random(seed)
+    data_dir = os.path.join(work_dir, 'data')
+    os.makedirs(data_dir)
+
+    routes = [[f'Stop {i + 1}', rng.randint(1, 25), ZONES[i % len(ZONES)]] for i in range(destinations)]
+    with open(os.path.join(data_dir, 'routes.csv'), 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(ROUTE_FIELDS)
+        writer.writerows(routes)
+
+    def special_need():
+        return rng.choice(SPECIAL_NEEDS) if rng.random() < special_share else 'None'
+
+    rows = []
+    booked = {slot: 0 for slot in TIME_SLOTS}
+    free = {slot: rng.sample(seat_numbers(), SEATS_PER_BUS) for slot in TIME_SLOTS}
+    for i in range(history):
+        slot = TIME_SLOTS[i % len(TIME_SLOTS)]
+        # Keep a quarter of each bus confirmed; the rest of the history is cancelled
+        if booked[slot] < SEATS_PER_BUS * HISTORY_FILL:
+            status, seat = 'Confirmed', free[slot].pop()
+            booked[slot] += 1
+        else:
+            status, seat = 'Cancelled', rng.choice(seat_numbers())
+        rows.append([str(i + 1), str(200000 + i), f'History {i}', f'h{i}@example.com', f'BUS{TIME_SLOTS.index(slot) + 1}', seat,
+                     slot, rng.choice(routes)[0], '2025-01-01 08:00:00', status, 'Normal', special_need()])
+    for i in range(pending):
+        slot = TIME_SLOTS[i % len(TIME_SLOTS)]
+        rows.append([str(history + i + 1), str(300000 + i), f'Pending {i}', f'p{i}@example.com', f'BUS{TIME_SLOTS.index(slot) + 1}', '',
+                     slot, rng.choice(routes)[0], '2025-01-01 09:00:00', 'Pending', 'Normal', special_need()])
+    with open(os.path.join(data_dir, 'booking.csv'), 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(BOOKING_FIELDS)
+        writer.writerows(rows)
+
+    with open(os.path.join(data_dir, 'buses.csv'), 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(BUS_FIELDS)
+        for i, slot in enumerate(TIME_SLOTS, start=1):
+            writer.writerow([f'B{i}', f'BUS{i}', slot, SEATS_PER_BUS, booked[slot], SEATS_PER_BUS - booked[slot], False, ''])
+
+    return [{
+        'name': f'Student {i}',
+        'studentId': str(100000 + i),
+        'email': f's{i}@example.com',
+        'timeSlot': TIME_SLOTS[i % len(TIME_SLOTS)],
+        'destination': rng.choice(routes)[0],
+        'specialNeeds': special_need()
+    } for i in range(requests)]
+
+
+def run_allocator(template_dir, algorithm, requests, storage):
+    """Run one allocator on a fresh copy of a workload; returns the worker's raw measurements"""
+    work_dir = tempfile.mkdtemp(prefix='bus-bench-run-')
+    try:
+        shutil.copytree(os.path.join(template_dir, 'data'), os.path.join(work_dir, 'data'))
+        config = json.dumps({'work_dir': work_dir, 'algorithm': algorithm, 'requests': requests})
+        result = subprocess.run(
+            [sys.executable, '-c', WORKER_SCRIPT.format(repo=REPO_DIR)], input=config,
+            cwd=work_dir, env=dict(os.environ, BUS_OPTIMIZER_STORAGE=storage),
+            capture_output=True, text=True
+        )
+        if result.returncode:
+            raise RuntimeError(f'{algorithm} run failed:\n{result.stderr}')
+        return json.loads(result.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(raw, requests):
+    """Latency, I/O and quality figures of one allocator run"""
+    granted = raw['granted']
+    zone_hits = sum(1 for destination, seat, _ in granted
+                    if seat[0] in raw['zone_rows'].get(raw['destination_zones'].get(destination, 'middle'), ()))
+    special = [(seat, need) for _, seat, need in granted if need in raw['bonus_rows']]
+    priority_hits = sum(1 for seat, need in special if seat[0] in raw['bonus_rows'][need])
+    latencies = raw['latencies']
+    return {
+        'requests': len(requests),
+        'granted': len(granted),
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'opens_per_booking': raw['opens'] / max(len(requests), 1),
+        'startup_ms': raw['startup'] * 1000,
+        'startup_opens': raw['startup_opens'],
+        'zone_match': zone_hits / len(granted) if granted else 0.0,
+        'priority_satisfaction': priority_hits / len(special) if special else None
+    }
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+def float_list(value):
+    return [float(item) for item in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--algorithms', default=','.join(ALGORITHMS), help='comma separated (default: all)')
+    parser.add_argument('--destinations', type=int_list, default=[3, 30], help='routes.csv sizes')
+    parser.add_argument('--history', type=int_list, default=[0, 5000], help='booking history rows')
+    parser.add_argument('--pending', type=int_list, default=[0, 100], help='pending requests queued across the slots')
+    parser.add_argument('--special', type=float_list, default=[0.1, 0.4], help='share of students with special needs')
+    parser.add_argument('--requests', type=int, default=120, help='bookings replayed per run')
+    parser.add_argument('--storage', default='csv', choices=['csv', 'sqlite', 'binary'])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='also write every result to this file')
+    args = parser.parse_args()
+
+    algorithms = args.algorithms.split(',')
+    unknown = set(algorithms) - set(ALGORITHMS)
+    if unknown:
+        parser.error(f"unknown algorithm(s): {', '.join(sorted(unknown))}")
+
+    header = (f"{'dest':>4} {'hist':>6} {'pend':>4} {'spec':>4}  {'algorithm':<14} {'granted':>7} "
+              f"{'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'opens/bk':>8} {'start ms':>8} {'zone':>5} {'priority':>8}")
+    print(header)
+    print('-' * len(header))
+
+    results = []
+    for destinations, history, pending, special in itertools.product(args.destinations, args.history, args.pending, args.special):
+        template_dir = tempfile.mkdtemp(prefix='bus-bench-')
+        try:
+            requests = generate_workload(template_dir, destinations, history, pending, special, args.requests, args.seed)
+            for algorithm in algorithms:
+                summary = summarize(run_allocator(template_dir, algorithm, requests, args.storage), requests)
+                summary.update(destinations=destinations, history=history, pending=pending, special=special,
+                               algorithm=algorithm, storage=args.storage)
+                results.append(summary)
+                priority = '-' if summary['priority_satisfaction'] is None else f"{summary['priority_satisfaction']:.0%}"
+                print(f"{destinations:>4} {history:>6} {pending:>4} {special:>4.0%}  {algorithm:<14} "
+                      f"{summary['granted']:>3}/{summary['requests']:<3} {summary['p50_ms']:>7.2f} {summary['p95_ms']:>7.2f} "
+                      f"{summary['p99_ms']:>7.2f} {summary['opens_per_booking']:>8.1f} {summary['startup_ms']:>8.0f} "
+                      f"{summary['zone_match']:>5.0%} {priority:>8}", flush=True)
+        finally:
+            shutil.rmtree(template_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
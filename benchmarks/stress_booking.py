@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Concurrent booking stress test
+Starts several app worker processes on a throwaway copy of the data files,
+fires thousands of concurrent POST /api/book requests at them and checks
+that no seat was handed out twice.
+
+    python benchmarks/stress_booking.py --requests 2000 --concurrency 64 --workers 4
+    python benchmarks/stress_booking.py --storage sqlite
+    python benchmarks/stress_booking.py --storage binary
+"""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIME_SLOTS = ['11AM', '1PM', '4PM', '6PM']
+SPECIAL_NEEDS = ['None', 'None', 'None', 'None', 'Injury', 'Disability', 'Elderly', 'Medical']
+
+WORKER_SCRIPT = """
+import logging, sys
+sys.path.insert(0, {repo!r})
+import app
+app.service.default_algorithm = {algorithm!r}
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+app.app.run(host='127.0.0.1', port={port}, threaded=True)
+"""
+
+
+def prepare_data(work_dir):
+    """Fresh copy of routes.csv plus empty bookings and buses"""
+    data_dir = os.path.join(work_dir, 'data')
+    os.makedirs(data_dir)
+    shutil.copy(os.path.join(REPO_DIR, 'data', 'routes.csv'), data_dir)
+    with open(os.path.join(data_dir, 'booking.csv'), 'w', newline='', encoding='utf-8') as file:
+        csv.writer(file).writerow(['BookingID', 'StudentID', 'Name', 'Email', 'BusNumber', 'SeatNumber', 'TimeSlot', 'Destination', 'BookingDate', 'Status', 'Priority', 'SpecialNeeds'])
+    with open(os.path.join(data_dir, 'buses.csv'), 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['BusID', 'BusNumber', 'TimeSlot', 'TotalSeats', 'BookedSeats', 'AvailableSeats', 'IsReused', 'ReusedFrom'])
+        for i, time_slot in enumerate(TIME_SLOTS, start=1):
+            writer.writerow([f'B{i}', f'BUS{i}', time_slot, 40, 0, 40, False, ''])
+    with open(os.path.join(data_dir, 'routes.csv'), 'r', encoding='utf-8') as file:
+        return [route['Destination'] for route in csv.DictReader(file)]
+
+
+def start_workers(work_dir, count, base_port, algorithm, storage):
+    workers = []
+    env = dict(os.environ, BUS_OPTIMIZER_STORAGE=storage)
+    for i in range(count):
+        script = WORKER_SCRIPT.format(repo=REPO_DIR, algorithm=algorithm, port=base_port + i)
+        workers.append(subprocess.Popen([sys.executable, '-c', script], cwd=work_dir, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    for i in range(count):
+        url = f'http://127.0.0.1:{base_port + i}/api/buses'
+        deadline = time.time() + 30
+        while True:
+            try:
+                urllib.request.urlopen(url, timeout=1).read()
+                break
+            except (urllib.error.URLError, ConnectionError, OSError):
+                if time.time() > deadline:
+                    raise RuntimeError(f'worker on port {base_port + i} did not start')
+                time.sleep(0.1)
+    return workers
+
+
+def post_booking(port, payload):
+    request = urllib.request.Request(
+        f'http://127.0.0.1:{port}/api/book',
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            status = response.status
+            body = json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        status = error.code
+        body = json.loads(error.read() or b'{}')
+    return status, body, time.perf_counter() - started
+
+
+def read_committed(work_dir, storage):
+    """Latest version of every booking, and the bus rows"""
+    data_dir = os.path.join(work_dir, 'data')
+    if storage == 'sqlite':
+        connection = sqlite3.connect(os.path.join(data_dir, 'bus_optimizer.db'))
+        connection.row_factory = sqlite3.Row
+        bookings = [dict(row) for row in connection.execute('SELECT * FROM bookings')]
+        buses = [dict(row) for row in connection.execute('SELECT * FROM buses')]
+        connection.close()
+        return {booking['BookingID']: booking for booking in bookings}, buses
+
+    latest = {}
+    if storage == 'binary':
+        sys.path.insert(0, REPO_DIR)
+        from allocation import SEAT_LAYOUT
+        from binary_storage import BinaryStorage
+        journal = BinaryStorage(os.path.join(data_dir, 'routes.csv'), os.path.join(data_dir, 'booking.bin'),
+                                os.path.join(data_dir, 'buses.csv'), os.path.join(data_dir, '.locks'), SEAT_LAYOUT.seats)
+        bookings, _ = journal.load_bookings()
+    else:
+        with open(os.path.join(data_dir, 'booking.csv'), 'r', encoding='utf-8') as file:
+            bookings = list(csv.DictReader(file))
+    for booking in bookings:
+        latest[booking['BookingID']] = booking
+    with open(os.path.join(data_dir, 'buses.csv'), 'r', encoding='utf-8') as file:
+        buses = list(csv.DictReader(file))
+    return latest, buses
+
+
+def check_files(work_dir, storage):
+    """Return a list of problems found in the committed data"""
+    problems = []
+    latest, buses = read_committed(work_dir, storage)
+    confirmed = [booking for booking in latest.values() if booking['Status'] == 'Confirmed']
+
+    seats = Counter((booking['BusNumber'], booking['SeatNumber']) for booking in confirmed)
+    problems += [f'seat {bus}/{seat} booked {n} times' for (bus, seat), n in seats.items() if n > 1]
+    students = Counter((booking['StudentID'], booking['TimeSlot']) for booking in confirmed)
+    problems += [f'student {student} holds {n} seats in {slot}' for (student, slot), n in students.items() if n > 1]
+
+    per_bus = Counter(booking['BusNumber'] for booking in confirmed)
+    for bus in buses:
+        if int(bus['BookedSeats']) != per_bus.get(bus['BusNumber'], 0):
+            problems.append(f"{bus['BusNumber']}: bus table says {bus['BookedSeats']} booked, bookings have {per_bus.get(bus['BusNumber'], 0)}")
+    return problems, len(confirmed)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=4, help='app worker processes')
+    parser.add_argument('--port', type=int, default=5100, help='first worker port')
+    parser.add_argument('--algorithm', default='greedy')
+    parser.add_argument('--storage', default='csv', choices=['csv', 'sqlite', 'binary'])
+    parser.add_argument('--keep', action='store_true', help='keep the temporary data directory')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bus-stress-')
+    destinations = prepare_data(work_dir)
+    workers = start_workers(work_dir, args.workers, args.port, args.algorithm, args.storage)
+    try:
+        payloads = []
+        for i in range(args.requests):
+            payloads.append({
+                'name': f'Student {i}',
+                'studentId': str(100000 + i),
+                'email': f'student{i}@example.com',
+                'timeSlot': TIME_SLOTS[i % len(TIME_SLOTS)],
+                'destination': destinations[i % len(destinations)],
+                'specialNeeds': SPECIAL_NEEDS[i % len(SPECIAL_NEEDS)]
+            })
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda item: post_booking(args.port + item[0] % args.workers, item[1]),
+                                    enumerate(payloads)))
+        elapsed = time.perf_counter() - started
+        # Bus counters are flushed to storage on a short timer; let it fire
+        time.sleep(2)
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+
+    statuses = Counter(status for status, _, _ in results)
+    latencies = [latency for _, _, latency in results]
+    granted = [(body['booking']['BusNumber'], body['booking']['SeatNumber'])
+               for status, body, _ in results if status == 200]
+    problems, confirmed = check_files(work_dir, args.storage)
+    strategies = Counter(body.get('algorithm') for status, body, _ in results if status == 200)
+    duplicates = [seat for seat, n in Counter(granted).items() if n > 1]
+    problems += [f'seat {bus}/{seat} returned to more than one request' for bus, seat in duplicates]
+    if len(granted) != confirmed:
+        problems.append(f'{len(granted)} requests succeeded but storage has {confirmed} confirmed seats')
+
+    print(f'{args.requests} requests, {args.concurrency} concurrent, {args.workers} workers, algorithm={args.algorithm}, storage={args.storage}')
+    print(f'elapsed {elapsed:.2f}s ({args.requests / elapsed:.0f} req/s)')
+    print('status codes: ' + ', '.join(f'{code}={n}' for code, n in sorted(statuses.items())))
+    print(f'latency p50={percentile(latencies, 0.5) * 1000:.1f}ms p95={percentile(latencies, 0.95) * 1000:.1f}ms '
+          f'p99={percentile(latencies, 0.99) * 1000:.1f}ms')
+    print(f'seats granted: {len(granted)} (' + ', '.join(f'{name}={n}' for name, n in sorted(strategies.items())) + ')')
+
+    if args.keep:
+        print(f'data kept in {work_dir}')
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if strategies.keys() - {args.algorithm}:
+        print(f'Workers did not allocate with {args.algorithm}')
+        sys.exit(1)
+    if problems or statuses.get(500):
+        for problem in problems:
+            print('COLLISION: ' + problem)
+        if statuses.get(500):
+            print(f'{statuses[500]} requests failed with 500')
+        sys.exit(1)
+    print('OK: zero seat collisions')
+
+
+if __name__ == '__main__':
+    main()
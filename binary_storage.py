@@ -0,0 +1,362 @@
+import mmap
+import os
+import stat
+import struct
+import tempfile
+
+from metrics import file_opened, rows_parsed
+from storage import CsvStorage
+
+MAGIC = b'BUSBOOK1'
+HEADER = struct.Struct('<8sI4x')  # magic, record size
+# BookingID, StudentID, Name, Email, BookingDate, BusNumber, Destination,
+# TimeSlot, seat index, Status, Priority, SpecialNeeds; 3 bytes of padding
+# keep every record (and so every 32-bit column) 4-byte aligned
+RECORD = struct.Struct('<IIIIIHHBBBBB3x')
+RECORD_WORDS = RECORD.size // 4
+STRING_LENGTH = struct.Struct('<I')
+
+NO_SEAT = 63        # the seat index is 6 bits
+NO_STRING = 0xFFFFFFFF
+STRING_CACHE_SIZE = 4096  # strings this process wrote lately, reused instead of written again
+
+# Interned fields: namespace in the symbols file, largest id the record holds
+SYMBOL_FIELDS = {
+    'StudentID': ('s', 0xFFFFFFFF),
+    'BusNumber': ('b', 0xFFFF),
+    'Destination': ('d', 0xFFFF),
+    'TimeSlot': ('t', 0xFF),
+    'Status': ('x', 0xFF),
+    'Priority': ('p', 0xFF),
+    'SpecialNeeds': ('n', 0xFF),
+}
+STRING_FIELDS = ['Name', 'Email', 'BookingDate']
+
+# BookingID as a column: (view format, index in a record, stride)
+BOOKING_ID_COLUMN = ('I', 0, RECORD_WORDS)
+
+
+class BinaryStorage(CsvStorage):
+    """
+    Bookings as fixed-width binary records, read through mmap
+    booking.bin holds one 32-byte record per journal row (appended, later
+    rows of a booking superseding earlier ones, as in booking.csv). The seat
+    is its 6-bit index in the bus layout; StudentID, BusNumber, Destination,
+    TimeSlot, Status, Priority and SpecialNeeds are ids into per-field
+    symbol tables (booking.symbols), so every row shares one string object
+    per distinct value; Name, Email and BookingDate are offsets into a side
+    table of strings (booking.strings). Both side files only grow.
+    Queries are served by BookingStore's indexes as with the other backends;
+    compaction finds the latest record of each booking on a memoryview
+    column of the mapping and copies records without decoding them.
+    Routes and buses stay in their CSV files.
+    """
+
+    def __init__(self, routes_file, booking_file, buses_file, lock_dir, seats):
+        super().__init__(routes_file, booking_file, buses_file, lock_dir)
+        base = os.path.splitext(booking_file)[0]
+        self.strings_file = base + '.strings'
+        self.symbols_file = base + '.symbols'
+        self.seats = list(seats)
+        self.seat_index = {seat: i for i, seat in enumerate(self.seats)}
+        if len(self.seats) >= NO_SEAT:
+            raise ValueError('The bus layout has too many seats for a 6-bit seat index')
+
+        self.symbols = {namespace: [] for namespace, _ in SYMBOL_FIELDS.values()}  # namespace -> values by id
+        self.symbol_ids = {namespace: {} for namespace, _ in SYMBOL_FIELDS.values()}
+        self.symbols_read = 0  # bytes of booking.symbols loaded
+        self.strings_map = None
+        self.string_cache = {}  # string -> offset, at most STRING_CACHE_SIZE
+
+        self.journal_map = None  # (file id, mmap) of booking.bin
+
+        with self.booking_file_lock:
+            self._create()
+
+    # Files
+
+    def _create(self):
+        """Write the empty journal and side tables if they do not exist"""
+        directory = os.path.dirname(self.booking_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        for path, content in ((self.booking_file, HEADER.pack(MAGIC, RECORD.size)),
+                              (self.strings_file, b''), (self.symbols_file, b'')):
+            if not os.path.exists(path):
+                file_opened()
+                with open(path, 'ab') as file:
+                    if file.tell() == 0:
+                        file.write(content)
+
+    def _journal(self):
+        """(file id, mmap over the whole of booking.bin as it is now)"""
+        file_opened()
+        with open(self.booking_file, 'rb') as file:
+            info = os.fstat(file.fileno())
+            file_id = (info.st_dev, info.st_ino)
+            cached = self.journal_map
+            if cached is not None and cached[0] == file_id and len(cached[1]) == info.st_size:
+                return cached
+            journal = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, record_size = HEADER.unpack_from(journal)
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError(f'{self.booking_file} is not a booking journal of this version')
+        # Mappings are never closed explicitly: scans may still hold views into an
+        # older one, which is released with the last of them
+        self.journal_map = (file_id, journal)
+        return self.journal_map
+
+    def _record_count(self, journal):
+        return (len(journal) - HEADER.size) // RECORD.size
+
+    def _column(self, journal, column, count):
+        """Zero-copy view of one field of the first count records"""
+        fmt, start, stride = column
+        view = memoryview(journal)[HEADER.size:HEADER.size + count * RECORD.size].cast(fmt)
+        return view[start::stride]
+
+    def _load_symbols(self):
+        """Read symbols appended (by any process) since the last call"""
+        if os.path.getsize(self.symbols_file) == self.symbols_read:
+            return
+        file_opened()
+        with open(self.symbols_file, 'rb') as file:
+            file.seek(self.symbols_read)
+            data = file.read()
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].decode('utf-8').splitlines():
+            namespace, value = line.split('\t', 1)
+            self.symbol_ids[namespace][value] = len(self.symbols[namespace])
+            self.symbols[namespace].append(value)
+        self.symbols_read += end
+
+    def _strings(self, end):
+        """Mapping of the strings table covering at least end bytes"""
+        strings = self.strings_map
+        if strings is None or end > len(strings):
+            file_opened()
+            with open(self.strings_file, 'rb') as file:
+                strings = self.strings_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return strings
+
+    def _string(self, offset):
+        if offset == NO_STRING:
+            return ''
+        start = offset + STRING_LENGTH.size
+        length, = STRING_LENGTH.unpack_from(self._strings(start), offset)
+        return str(self._strings(start + length)[start:start + length], 'utf-8')
+
+    # Records
+
+    def _decode(self, journal, first, last):
+        """Booking rows of records first..last-1"""
+        if last > first:
+            self._load_symbols()
+        symbols = self.symbols
+        students, buses, destinations = symbols['s'], symbols['b'], symbols['d']
+        slots, statuses, priorities, needs = symbols['t'], symbols['x'], symbols['p'], symbols['n']
+        seats = self.seats
+        rows = []
+        view = memoryview(journal)[HEADER.size + first * RECORD.size:HEADER.size + last * RECORD.size]
+        for (booking_id, student, name, email, date, bus, destination, slot,
+             seat, status, priority, need) in RECORD.iter_unpack(view):
+            rows.append({
+                'BookingID': str(booking_id),
+                'StudentID': students[student],
+                'Name': self._string(name),
+                'Email': self._string(email),
+                'BusNumber': buses[bus],
+                'SeatNumber': '' if seat == NO_SEAT else seats[seat],
+                'TimeSlot': slots[slot],
+                'Destination': destinations[destination],
+                'BookingDate': self._string(date),
+                'Status': statuses[status],
+                'Priority': priorities[priority],
+                'SpecialNeeds': needs[need],
+            })
+        rows_parsed(len(rows))
+        return rows
+
+    def _symbol(self, field, value, new_symbols):
+        """Id of value in field's symbol table, adding it to new_symbols ({namespace: {value: id}}) if new"""
+        namespace, largest = SYMBOL_FIELDS[field]
+        symbol = self.symbol_ids[namespace].get(value)
+        if symbol is None:
+            pending = new_symbols.setdefault(namespace, {})
+            symbol = pending.get(value)
+            if symbol is None:
+                if '\n' in value or '\t' in value:
+                    raise ValueError(f'{field} may not contain tabs or line breaks: {value!r}')
+                symbol = pending[value] = len(self.symbols[namespace]) + len(pending)
+                if symbol > largest:
+                    raise ValueError(f'Too many distinct {field} values for the binary booking journal')
+        return symbol
+
+    def _encode(self, rows):
+        """
+        (records, new symbols, new strings ({value: offset})) for rows; the
+        bookings lock is held. New symbols and strings are only added to the in-memory tables
+        once append_bookings has written them.
+        """
+        self._load_symbols()
+        strings_end = os.path.getsize(self.strings_file)
+        records, new_symbols, new_strings = [], {}, {}
+        for row in rows:
+            seat = row.get('SeatNumber') or ''
+            if seat and seat not in self.seat_index:
+                raise ValueError(f'Seat {seat} is not in the bus layout')
+            values = {field: self._symbol(field, str(row.get(field) or ''), new_symbols) for field in SYMBOL_FIELDS}
+            offsets = {}
+            for field in STRING_FIELDS:
+                value = str(row.get(field) or '')
+                offset = self.string_cache.get(value, new_strings.get(value)) if value else NO_STRING
+                if offset is None:
+                    offset = new_strings[value] = strings_end
+                    strings_end += STRING_LENGTH.size + len(value.encode('utf-8'))
+                    if strings_end > NO_STRING:
+                        raise ValueError('The booking strings table is full (4 GiB)')
+                offsets[field] = offset
+            records.append(RECORD.pack(
+                int(row['BookingID']), values['StudentID'], offsets['Name'], offsets['Email'], offsets['BookingDate'],
+                values['BusNumber'], values['Destination'], values['TimeSlot'],
+                self.seat_index[seat] if seat else NO_SEAT, values['Status'], values['Priority'], values['SpecialNeeds']
+            ))
+        return records, new_symbols, new_strings
+
+    # Storage interface (see CsvStorage)
+
+    def load_bookings(self):
+        with self.booking_file_lock:
+            self._create()
+        self.version_bases.clear()
+        file_id, journal = self._journal()
+        count = self._record_count(journal)
+        return self._decode(journal, 0, count), (file_id, HEADER.size + count * RECORD.size)
+
+    def booking_changes(self, cursor):
+        try:
+            info = os.stat(self.booking_file)
+        except OSError:
+            return [], cursor
+        file_id, offset = cursor or (None, HEADER.size)
+        if (info.st_dev, info.st_ino) != file_id or info.st_size < offset:
+            self.version_bases.clear()
+            return None, None
+        # Only complete records; a writer may be mid-append
+        end = offset + (info.st_size - offset) // RECORD.size * RECORD.size
+        if end == offset:
+            return [], cursor
+        current_id, journal = self._journal()
+        if current_id != file_id:
+            self.version_bases.clear()
+            return None, None
+        first = (offset - HEADER.size) // RECORD.size
+        return self._decode(journal, first, (end - HEADER.size) // RECORD.size), (file_id, end)
+
+    def append_bookings(self, rows):
+        records, new_symbols, new_strings = self._encode(rows)
+        # Side tables first: a record never refers to a string or symbol not yet on disk
+        if new_strings:
+            file_opened()
+            with open(self.strings_file, 'ab') as file:
+                for value in new_strings:
+                    data = value.encode('utf-8')
+                    file.write(STRING_LENGTH.pack(len(data)) + data)
+            if len(self.string_cache) + len(new_strings) > STRING_CACHE_SIZE:
+                self.string_cache.clear()
+            if len(new_strings) <= STRING_CACHE_SIZE:
+                self.string_cache.update(new_strings)
+        if new_symbols:
+            file_opened()
+            with open(self.symbols_file, 'a', encoding='utf-8', newline='') as file:
+                file.write(''.join(f'{namespace}\t{value}\n' for namespace, values in new_symbols.items() for value in values))
+            self._load_symbols()
+        file_opened()
+        with open(self.booking_file, 'ab') as file:
+            file.write(b''.join(records))
+            file.flush()
+            info = os.fstat(file.fileno())
+        return ((info.st_dev, info.st_ino), info.st_size)
+
+    def compact_bookings(self, rows, cursor, before_replace=None):
+        """
+        Replace booking.bin with the latest record of every booking as of
+        cursor (rows, as indexed by the caller, in BookingID order) followed
+        by the records appended after cursor
+        Records are copied as they are, so the side tables do not grow.
+        Returns the new cursor, or None if booking.bin was replaced since
+        cursor or does not match rows.
+        """
+        file_id, offset = cursor
+        current_id, journal = self._journal()
+        if current_id != file_id or len(journal) < offset:
+            return None
+        count = (offset - HEADER.size) // RECORD.size
+        latest = {}
+        for record, booking_id in enumerate(self._column(journal, BOOKING_ID_COLUMN, count)):
+            latest[booking_id] = record
+        if len(latest) != len(rows):
+            return None
+
+        directory = os.path.dirname(self.booking_file) or '.'
+        fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(self.booking_file) + '.', suffix='.tmp', dir=directory)
+        file_opened()
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(HEADER.pack(MAGIC, RECORD.size))
+                for booking_id in sorted(latest):
+                    start = HEADER.size + latest[booking_id] * RECORD.size
+                    file.write(journal[start:start + RECORD.size])
+            rows_size = os.path.getsize(temp_path)
+
+            with self.booking_file_lock:
+                current = os.stat(self.booking_file)
+                if (current.st_dev, current.st_ino) != file_id or current.st_size < offset:
+                    os.remove(temp_path)
+                    return None
+                file_opened()
+                with open(self.booking_file, 'rb') as source:
+                    source.seek(offset)
+                    tail = source.read()
+                tail = tail[:len(tail) // RECORD.size * RECORD.size]
+                file_opened()
+                with open(temp_path, 'ab') as file:
+                    file.write(tail)
+                    file.flush()
+                    os.fsync(file.fileno())
+                    compacted = os.fstat(file.fileno())
+                new_id = (compacted.st_dev, compacted.st_ino)
+                self._record_compaction(cursor, new_id, rows_size)
+                if before_replace is not None:
+                    before_replace((new_id, rows_size), new_id)
+                os.chmod(temp_path, stat.S_IMODE(current.st_mode))
+                os.replace(temp_path, self.booking_file)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        return (new_id, rows_size + len(tail))
+
+    def migrate_from_csv(self, csv_booking_file):
+        """
+        One-shot import of booking.csv into an empty journal
+        Superseded rows collapse to their latest version. Returns the number
+        of bookings imported, or None (and imports nothing) if the journal
+        already has records.
+        """
+        csv_storage = CsvStorage(self.routes_file, csv_booking_file, self.buses_file,
+                                 os.path.dirname(self.booking_file_lock.path))
+        with self.booking_file_lock:
+            self._create()
+            if os.path.getsize(self.booking_file) > HEADER.size:
+                return None
+            bookings, _ = csv_storage.load_bookings()
+            latest = {}
+            for booking in bookings:
+                latest[booking['BookingID']] = booking
+            rows = sorted(latest.values(), key=lambda booking: int(booking['BookingID']))
+            if rows:
+                self.append_bookings(rows)
+        return len(rows)
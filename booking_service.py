@@ -0,0 +1,634 @@
+import csv
+import os
+from contextlib import ExitStack
+from datetime import datetime
+
+import metrics
+from allocation import (
+    ALLOCATION_ALGORITHM, ALLOCATORS, BUS_TRIP_MINUTES, BUS_TURNAROUND_MINUTES, PRIORITY_QUEUE_SEAT_BONUS,
+    SEAT_DOOR_ORDER, SEAT_LAYOUT, SEAT_ZONES, SPECIAL_NEEDS_PRIORITY, SPECIAL_NEEDS_SEAT_BONUS, TIME_SLOTS, TOTAL_SEATS,
+    get_available_seat, queue_priority
+)
+from binary_storage import BinaryStorage
+from booking_store import BookingStore
+from bulk_import import report_row
+from bus_index import BusIndex
+from bus_table import BusTable
+from fleet import plan_fleet
+from journal import SnapshotFile
+from locking import KeyedLocks
+from parallel_allocation import partition_slot, solve_partitions
+from route_cache import RouteTable
+from scoring import SeatScorer
+from settings_file import JsonSettings
+from slot_context import SlotContext
+from storage import BOOKING_FIELDS, BUS_FIELDS, ROUTE_FIELDS, CsvStorage, SqliteStorage
+
+
+class BookingError(ValueError):
+    """A booking request that cannot be met as asked (a 400 for the web app)"""
+
+
+def ensure_data_files(data_dir):
+    """Ensure the data directory exists and create CSV files if they don't exist"""
+    os.makedirs(data_dir, exist_ok=True)
+
+    # Create routes.csv if it doesn't exist
+    routes_file = os.path.join(data_dir, 'routes.csv')
+    if not os.path.exists(routes_file):
+        with open(routes_file, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(ROUTE_FIELDS)
+            writer.writerow(['Rajpur Road', 3, 'front'])
+            writer.writerow(['ISBT', 7, 'middle'])
+            writer.writerow(['Clement Town', 12, 'back'])
+
+    # Create booking.csv if it doesn't exist
+    booking_file = os.path.join(data_dir, 'booking.csv')
+    if not os.path.exists(booking_file):
+        with open(booking_file, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(BOOKING_FIELDS)
+
+    # Create buses.csv if it doesn't exist
+    buses_file = os.path.join(data_dir, 'buses.csv')
+    if not os.path.exists(buses_file):
+        with open(buses_file, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(BUS_FIELDS)
+            writer.writerow(['B1', 'BUS1', '11AM', 40, 0, 40, False, ''])
+            writer.writerow(['B2', 'BUS2', '1PM', 40, 0, 40, False, ''])
+            writer.writerow(['B3', 'BUS3', '4PM', 40, 0, 40, False, ''])
+            writer.writerow(['B4', 'BUS4', '6PM', 40, 0, 40, False, ''])
+
+
+class BookingService:
+    """
+    The allocation engine of one data directory, without the web layer
+    Opens the storage backend ('csv', 'sqlite' or 'binary') and keeps the booking
+    store, bus table, bus index, route table and seat scorer over it, and
+    books, batch-allocates, promotes waitlisted students, re-plans the fleet
+    and imports bookings on them. The Flask app serves one instance; cli.py,
+    batch jobs and benchmarks make their own. Any number of processes may
+    share a data directory: slot locks and the bookings lock are
+    inter-process.
+    """
+
+    def __init__(self, data_dir='data', backend='csv', database_file=None, snapshot_file=None,
+                 allocation_config_file=None, default_algorithm=ALLOCATION_ALGORITHM, flush_delay=1.0):
+        ensure_data_files(data_dir)
+        self.data_dir = data_dir
+        self.routes_file = os.path.join(data_dir, 'routes.csv')
+        self.booking_file = os.path.join(data_dir, 'booking.csv')
+        self.buses_file = os.path.join(data_dir, 'buses.csv')
+        self.lock_dir = os.path.join(data_dir, '.locks')
+        self.database_file = database_file or os.path.join(data_dir, 'bus_optimizer.db')
+        self.default_algorithm = default_algorithm
+        self.bus_listeners = []  # called with each bus row whose counters changed
+
+        self.storage = self._open_storage(backend)
+        # Booking history is loaded once per process (from the latest snapshot
+        # plus the rows after it); requests only query these indexes.
+        # Pending and waitlisted students are ordered by calculate_priority_score
+        self.booking_store = BookingStore(self.storage, SEAT_LAYOUT,
+                                          priority=lambda booking: queue_priority(self.route_table, booking),
+                                          snapshots=SnapshotFile(snapshot_file or os.path.join(data_dir, 'booking.snapshot')))
+        # Allocate-and-commit is serialized per time slot (the bus is chosen under
+        # the lock), across threads and processes
+        self.slot_locks = KeyedLocks(os.path.join(self.lock_dir, 'slot'))
+
+        # Bus seat counters are updated incrementally and flushed to storage in batches
+        self.bus_table = BusTable(self.storage, self.confirmed_seat_count, flush_delay=flush_delay,
+                                  source_lock=self.booking_store.lock)
+        self.bus_table.reconcile()
+
+        # Buses of each slot ranked by free seats (overall and per zone); re-ranked
+        # whenever the booking store sees seats change
+        self.bus_index = BusIndex(SEAT_LAYOUT, self.booking_store.occupancy)
+        self.booking_store.add_listener(
+            lambda version, changes: self.bus_index.update({bus_number for bus_number, _, _ in changes}))
+
+        # Routes are cached by destination and reloaded when they change in storage
+        self.route_table = RouteTable(self.storage, SEAT_ZONES, door_order=SEAT_DOOR_ORDER)
+        # Scores whole pending queues at once (vectorized when NumPy is installed)
+        self.seat_scorer = SeatScorer(SEAT_LAYOUT, SEAT_ZONES, self.route_table, SPECIAL_NEEDS_PRIORITY)
+
+        # One SlotContext per time slot, shared by the allocators until the next commit
+        self.slot_contexts = {}
+        # Runtime strategy selection: {"default": "greedy", "slots": {"4PM": "dp_knapsack"}}
+        self.allocation_settings = JsonSettings(allocation_config_file or os.path.join(data_dir, 'allocation.json'))
+        self.ready = False  # set by warm()
+
+    def _open_storage(self, backend):
+        if backend == 'binary':
+            storage = BinaryStorage(self.routes_file, os.path.join(self.data_dir, 'booking.bin'), self.buses_file,
+                                    self.lock_dir, SEAT_LAYOUT.seats)
+            storage.migrate_from_csv(self.booking_file)
+            return storage
+        if backend == 'sqlite':
+            storage = SqliteStorage(self.database_file)
+            storage.migrate_from_csv(self.routes_file, self.booking_file, self.buses_file)
+            return storage
+        if backend == 'csv':
+            return CsvStorage(self.routes_file, self.booking_file, self.buses_file, self.lock_dir)
+        raise ValueError(f'Unknown storage backend: {backend}')
+
+    def confirmed_seat_count(self, bus_number):
+        """Confirmed seats on a bus, including commits made by other processes"""
+        self.booking_store.sync()
+        return self.booking_store.confirmed_count(bus_number)
+
+    def next_booking_id(self):
+        return self.booking_store.next_booking_id()
+
+    def add_bus_listener(self, listener):
+        """Call listener(bus row) whenever update_bus_status moves a bus's counters"""
+        self.bus_listeners.append(listener)
+
+    def update_bus_status(self, bus_number, change=1):
+        """
+        Update bus booking status
+        change is the number of seats just confirmed (negative when seats are
+        released); buses.csv is rewritten by the bus table's coalesced flush
+        """
+        self.bus_table.adjust(bus_number, change)
+        bus = self.bus_table.bus(bus_number)
+        if bus is not None:
+            for listener in self.bus_listeners:
+                listener(bus)
+
+    # Process lifecycle
+
+    def warm(self):
+        """
+        Fill the caches a first request would otherwise fill: the booking
+        tail, routes, the bus table and index, and each slot's context (its
+        bus per zone and pending queue). Marks the service ready.
+        """
+        self.booking_store.sync()
+        for time_slot in TIME_SLOTS:
+            context = self.slot_context(time_slot)
+            for zone in [None] + list(SEAT_ZONES):
+                context.bus(zone)
+            context.pending()
+        self.ready = True
+
+    def prepare_fork(self):
+        """Finish background work (snapshots, counter flushes) so no thread or lock is mid-flight at fork"""
+        self.booking_store.wait()
+        self.bus_table.flush()
+
+    def after_fork(self):
+        """
+        Make a forked copy of a warmed service usable in the child process
+        The indexes are shared copy-on-write; only connections are reopened,
+        metrics restart from zero and the writes made since the fork are read.
+        """
+        self.ready = False
+        self.storage.after_fork()
+        metrics.reset()
+        self.warm()
+
+    # Buses and slot contexts
+
+    def sync_bus_index(self):
+        """Rebuild the bus index if the bus table was reloaded"""
+        self.bus_table.refresh()
+        if self.bus_index.version != self.bus_table.version:
+            self.bus_index.rebuild(self.bus_table.buses(), self.bus_table.version)
+
+    def find_bus_for_time_slot(self, time_slot, zone=None):
+        """
+        Bus of a time slot with the most free seats in zone (or overall, when no
+        bus has room there); None when every bus of the slot is full
+        """
+        self.sync_bus_index()
+        return self.bus_index.pick(time_slot, zone)
+
+    def slot_context(self, time_slot):
+        """
+        Shared SlotContext of a time slot; a new one is made only after a commit
+        (or when the bus table or routes change)
+        """
+        self.sync_bus_index()
+        self.route_table.refresh()
+        version = (self.booking_store.version(), self.bus_table.version, self.route_table.version)
+        context = self.slot_contexts.get(time_slot)
+        if context is None or context.version != version:
+            context = self.slot_contexts[time_slot] = SlotContext(
+                time_slot, version, self.booking_store, self.bus_index, self.seat_scorer, self.route_table)
+        return context
+
+    def allocation_algorithm(self, time_slot, requested=None):
+        """Strategy for a booking: the one requested, else the slot's configured one, else the default"""
+        settings = self.allocation_settings.get()
+        return requested or settings.get('slots', {}).get(time_slot) or settings.get('default') or self.default_algorithm
+
+    def slot_bus_occupancy(self, time_slot):
+        """{BusNumber: occupancy bitmask} for every bus of a time slot"""
+        self.sync_bus_index()
+        return {bus_number: self.booking_store.occupancy(bus_number) for bus_number in self.bus_index.buses(time_slot)}
+
+    # Booking
+
+    def commit_booking(self, data):
+        """
+        Allocate and persist one booking request (the /api/book fields); the
+        caller holds the lock of its time slot
+        Returns (booking, strategy used); raises BookingError when the
+        student already has a seat or the slot is full.
+        """
+        student_id = data.get('studentId')
+        time_slot = data.get('timeSlot')
+        destination = data.get('destination')
+        special_needs = data.get('specialNeeds', 'None')
+
+        # Check if student already has a booking (or a waitlist place) for this time slot
+        with metrics.stage('duplicate_check'):
+            duplicate = self.booking_store.has_booking(student_id, time_slot, ('Confirmed', 'Waitlisted'))
+        if duplicate:
+            raise BookingError('You already have a booking for this time slot')
+        # A request the student queued for batch allocation is taken over by
+        # this booking (same BookingID), so it leaves the pending queue
+        queued = next((booking for booking in self.booking_store.student_bookings(student_id)
+                       if booking['TimeSlot'] == time_slot and booking['Status'] == 'Pending'), None)
+
+        # Allocate seat with the selected strategy (unknown names fall back to greedy)
+        algorithm = self.allocation_algorithm(time_slot, data.get('algorithm'))
+        allocate = ALLOCATORS.get(algorithm, get_available_seat)
+        booking = {'StudentID': student_id, 'Destination': destination, 'SpecialNeeds': special_needs}
+        with metrics.stage('context'):
+            context = self.slot_context(time_slot)
+        with metrics.stage('allocate'):
+            bus_number, seat_number = allocate(context, booking)
+
+        if not bus_number or not seat_number:
+            metrics.allocations.inc(1, algorithm, 'full')
+            raise BookingError('No seats available for this time slot')
+        metrics.allocations.inc(1, algorithm, 'seated')
+
+        new_booking = {
+            'BookingID': queued['BookingID'] if queued else None,
+            'StudentID': student_id,
+            'Name': data.get('name'),
+            'Email': data.get('email'),
+            'BusNumber': bus_number,
+            'SeatNumber': seat_number,
+            'TimeSlot': time_slot,
+            'Destination': destination,
+            'BookingDate': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'Status': 'Confirmed',
+            'Priority': data.get('priority', 'Normal'),
+            'SpecialNeeds': special_needs
+        }
+
+        # Save booking to storage (append-only) and index it in memory; a new
+        # BookingID is assigned here, under the bookings lock
+        with metrics.stage('append'):
+            new_booking = self.booking_store.append(new_booking)
+
+        with metrics.stage('bus_status'):
+            self.update_bus_status(bus_number, 1)
+
+        return new_booking, algorithm
+
+    def book(self, data):
+        """commit_booking under the time slot's lock"""
+        with self.slot_locks(data.get('timeSlot')):
+            self.booking_store.sync()
+            return self.commit_booking(data)
+
+    def save_seat_changes(self, bookings):
+        """Persist bookings in one append and move the bus counters by the seats they take or release"""
+        previous = {booking['BookingID']: self.booking_store.get(booking['BookingID'])
+                    for booking in bookings if booking.get('BookingID')}
+        saved = self.booking_store.save(bookings)
+        changes = {}
+        for booking in saved:
+            before = previous.get(booking['BookingID'])
+            if before is not None and before['Status'] == 'Confirmed':
+                changes[before['BusNumber']] = changes.get(before['BusNumber'], 0) - 1
+            if booking['Status'] == 'Confirmed':
+                changes[booking['BusNumber']] = changes.get(booking['BusNumber'], 0) + 1
+        for bus_number, change in changes.items():
+            if change:
+                self.update_bus_status(bus_number, change)
+        return saved
+
+    def cancel(self, booking_id):
+        """
+        Cancel a booking (confirmed, pending or waitlisted)
+        A freed seat goes to the slot's highest-priority waitlisted student in
+        the same write. Returns (cancelled booking, promoted booking or None);
+        raises BookingError if the booking is unknown or no longer active.
+        """
+        booking = self.booking_store.get(booking_id)
+        if booking is None:
+            raise BookingError('Booking not found')
+        with self.slot_locks(booking['TimeSlot']):
+            self.booking_store.sync()
+            booking = self.booking_store.get(booking_id)
+            if booking['Status'] not in ('Confirmed', 'Pending', 'Waitlisted'):
+                raise BookingError('Booking is not active')
+
+            cancelled = dict(booking, Status='Cancelled')
+            promoted = []
+            if booking['Status'] == 'Confirmed':
+                promoted = self.promote_waitlisted(booking['TimeSlot'], [(booking['BusNumber'], booking['SeatNumber'])])
+            saved = self.save_seat_changes([cancelled] + promoted)
+        return saved[0], saved[1] if len(saved) > 1 else None
+
+    # Batch allocation and the waitlist
+
+    def batch_candidates(self, time_slot):
+        """
+        Pending bookings of a time slot that compete in a batch: students who
+        already hold a seat in the slot are not seated twice, and only the
+        first of several queued requests per student competes
+        """
+        candidates = []
+        queued_students = set()
+        for booking in self.booking_store.pending_bookings(time_slot):
+            if booking['StudentID'] in queued_students or \
+               self.booking_store.has_confirmed_booking(booking['StudentID'], time_slot):
+                continue
+            queued_students.add(booking['StudentID'])
+            candidates.append(booking)
+        return candidates
+
+    def solve_batch(self, slots, split=False, workers=1):
+        """
+        Assignments for {slot: (candidates, bus occupancy)}, as
+        {slot: [(candidate indexes, {index: (BusNumber, seat)})]}
+        With split, large slots are further split per bus (see
+        parallel_allocation.partition_slot); the problems are solved in a
+        process pool when workers allow.
+        """
+        problems = []
+        owners = []  # per problem: (slot, candidate indexes)
+        for time_slot, (candidates, bus_occupancy) in slots.items():
+            if not candidates:
+                continue
+            for indexes, occupancy in partition_slot(self.seat_scorer, self.route_table, candidates, bus_occupancy,
+                                                     split=split):
+                problems.append(([candidates[index] for index in indexes], occupancy))
+                owners.append((time_slot, indexes))
+        solved = {time_slot: [] for time_slot in slots}
+        results = solve_partitions(self.seat_scorer, self.route_table.snapshot(), problems, workers)
+        for (time_slot, indexes), allocations in zip(owners, results):
+            solved[time_slot].append((indexes, allocations))
+        return solved
+
+    def batch_allocate(self, time_slots=None, workers=1):
+        """
+        Allocate every pending booking of several time slots (default: all)
+        Slots share no buses, so each is an independent assignment problem,
+        committed with one write under its own lock. With more than one
+        worker, all slots are first solved together in a process pool (see
+        solve_batch) from a state read without the locks; a slot whose
+        bookings or seats changed meanwhile is solved again under its lock.
+        Returns ({slot: confirmed bookings}, {slot: bookings left pending}).
+        """
+        time_slots = list(time_slots or TIME_SLOTS)
+        split = workers > 1
+        solved = {}  # slot -> ((candidates, bus occupancy) solved for, assignments)
+        if workers > 1:
+            self.booking_store.sync()
+            slots = {time_slot: (self.batch_candidates(time_slot), self.slot_bus_occupancy(time_slot))
+                     for time_slot in time_slots}
+            for time_slot, parts in self.solve_batch(slots, split, workers).items():
+                solved[time_slot] = (slots[time_slot], parts)
+
+        confirmed = {}
+        for time_slot in time_slots:
+            with self.slot_locks(time_slot):
+                self.booking_store.sync()
+                candidates = self.batch_candidates(time_slot)
+                bus_occupancy = self.slot_bus_occupancy(time_slot)
+                state = (candidates, bus_occupancy)
+                if time_slot in solved and solved[time_slot][0] == state:
+                    parts = solved[time_slot][1]
+                else:
+                    parts = self.solve_batch({time_slot: state}, split)[time_slot]
+
+                updates = []
+                for indexes, allocations in parts:
+                    for index, (bus_number, seat) in allocations.items():
+                        booking = dict(candidates[indexes[index]])
+                        booking['BusNumber'] = bus_number
+                        booking['SeatNumber'] = seat
+                        booking['Status'] = 'Confirmed'
+                        updates.append(booking)
+                updates.sort(key=lambda booking: int(booking['BookingID']))
+                confirmed[time_slot] = self.save_seat_changes(updates)
+
+        return confirmed, {time_slot: self.booking_store.pending_bookings(time_slot) for time_slot in time_slots}
+
+    def batch_allocate_time_slot(self, time_slot):
+        """
+        Allocate every pending booking of a time slot in one pass
+        The assignment is solved once for the whole queue and committed with a
+        single write. Returns (confirmed bookings, bookings left pending).
+        """
+        confirmed, pending = self.batch_allocate([time_slot])
+        return confirmed[time_slot], pending[time_slot]
+
+    def promote_waitlisted(self, time_slot, seats):
+        """
+        Offer seats ((BusNumber, SeatNumber) pairs) to the highest-priority
+        waitlisted students of a time slot, one seat each
+        Returns the promoted bookings, not yet saved; the caller holds the slot
+        lock and saves them together with whatever freed the seats.
+        """
+        waiters = self.booking_store.next_waitlisted(time_slot, len(seats))
+        return [dict(waiter, BusNumber=bus_number, SeatNumber=seat, Status='Confirmed')
+                for waiter, (bus_number, seat) in zip(waiters, seats)]
+
+    def fill_from_waitlist(self, time_slot):
+        """
+        Seat waitlisted students of a time slot in the free seats; returns the
+        promoted bookings
+        Students are taken in priority order. Each goes to the bus with the
+        most free seats in their zone (a BusIndex over a working copy of the
+        occupancy) and gets the best free seat there by seat preference and
+        special-needs bonus, as the priority_queue allocator picks it.
+        """
+        with self.slot_locks(time_slot):
+            self.booking_store.sync()
+            occupancy = self.slot_bus_occupancy(time_slot)
+            free = sum(SEAT_LAYOUT.count_free(occupied) for occupied in occupancy.values())
+            waiters = self.booking_store.next_waitlisted(time_slot, free) if free else []
+            if not waiters:
+                return []
+
+            working = BusIndex(SEAT_LAYOUT, occupancy.__getitem__)
+            working.rebuild([{'BusNumber': bus_number, 'TimeSlot': time_slot} for bus_number in occupancy])
+            seat_scores = self.seat_scorer.seat_scores(waiters, PRIORITY_QUEUE_SEAT_BONUS)
+            promoted = []
+            for index, waiter in enumerate(waiters):
+                bus_number = working.pick(time_slot, self.route_table.zone(waiter['Destination']))
+                if bus_number is None:
+                    break
+                seat = self.seat_scorer.greedy_assign(seat_scores, [index], occupancy[bus_number])[index]
+                occupancy[bus_number] = SEAT_LAYOUT.take(occupancy[bus_number], seat)
+                working.update([bus_number])
+                promoted.append(dict(waiter, BusNumber=bus_number, SeatNumber=seat, Status='Confirmed'))
+            return self.save_seat_changes(promoted)
+
+    def plan_buses(self, extra_demand=None):
+        """
+        Re-plan the fleet from current demand: chain buses across TIME_SLOTS
+        (filling IsReused/ReusedFrom) and add overflow buses to slots whose
+        demand exceeds their seats. extra_demand ({TimeSlot: students}) is added
+        to the stored demand. Returns (bus rows, physical buses needed, time
+        slots skipped because their label has no start time).
+        """
+        self.booking_store.sync()
+        demand = self.booking_store.demand()
+        for time_slot, count in (extra_demand or {}).items():
+            demand[time_slot] = demand.get(time_slot, 0) + count
+        reuse = {time_slot: config['reuse'] for time_slot, config in TIME_SLOTS.items()}
+        planned = []
+
+        def plan(buses):
+            rows, vehicle_count, skipped = plan_fleet(buses, demand, TOTAL_SEATS, BUS_TRIP_MINUTES,
+                                                      BUS_TURNAROUND_MINUTES, reuse)
+            planned.append((vehicle_count, skipped))
+            return rows
+
+        rows = self.bus_table.rewrite(plan)
+        vehicle_count, skipped = planned[0]
+        return rows, vehicle_count, skipped
+
+    # Bulk import
+
+    def allocate_import(self, time_slot, requests):
+        """
+        Seat a time slot's imported requests in one pass
+        Requests are taken in calculate_priority_score order. Each goes to the
+        bus with the most free seats in its zone (a BusIndex over a working copy
+        of the occupancy) and takes the first free seat of its special-needs
+        rows within its zone, its special-needs rows, its zone, then anywhere:
+        the seat the greedy score would pick. Batch matching (see
+        solve_batch_assignment) is quadratic in the queue, too slow for
+        thousands of rows. Returns {request index: (bus, seat)}.
+        """
+        occupancy = self.slot_bus_occupancy(time_slot)
+        if not requests or not occupancy:
+            return {}
+
+        working = BusIndex(SEAT_LAYOUT, occupancy.__getitem__)
+        working.rebuild([{'BusNumber': bus_number, 'TimeSlot': time_slot} for bus_number in occupancy])
+        bonus_masks = {need: SEAT_LAYOUT.rows_mask(rows) for need, (_, rows) in SPECIAL_NEEDS_SEAT_BONUS.items()}
+
+        bookings = [{'StudentID': request['studentId'], 'Destination': request['destination'],
+                     'SpecialNeeds': request.get('specialNeeds') or 'None'} for request in requests]
+        scores = self.seat_scorer.priority_scores(bookings)
+        order = sorted(range(len(bookings)), key=lambda index: -scores[index])
+
+        allocations = {}
+        for index in order:
+            zone = self.route_table.zone(bookings[index]['Destination'])
+            bus_number = working.pick(time_slot, zone)
+            if bus_number is None:
+                break
+            zone_mask = SEAT_LAYOUT.zone_masks.get(zone, 0)
+            bonus_mask = bonus_masks.get(bookings[index]['SpecialNeeds'], 0)
+            occupied = occupancy[bus_number]
+            for candidates in (bonus_mask & zone_mask, bonus_mask, zone_mask, None):
+                if candidates == 0:
+                    continue
+                seat = SEAT_LAYOUT.first_free(occupied, candidates)
+                if seat:
+                    break
+            allocations[index] = (bus_number, seat)
+            occupancy[bus_number] = SEAT_LAYOUT.take(occupied, seat)
+            working.update([bus_number])
+        return allocations
+
+    def validate_import_request(self, request_data):
+        """Error message for an imported request, or None if it is valid"""
+        if not all(request_data.get(field) for field in ('name', 'studentId', 'email', 'timeSlot', 'destination')):
+            return 'All fields are required'
+        if request_data['timeSlot'] not in TIME_SLOTS:
+            return 'Unknown time slot'
+        if self.route_table.get(request_data['destination']) is None:
+            return 'Unknown destination'
+        if not request_data['studentId'].isdigit():
+            return 'Student ID must be numeric'
+        return None
+
+    def import_bookings(self, chunks, waitlist=False, plan=False):
+        """
+        Import booking requests (chunks of (row number, request) from
+        bulk_import.read_requests)
+        Rows are validated chunk by chunk, every time slot is allocated in one
+        pass (allocate_import), and all new bookings are committed with a single
+        append and one bus table flush. Students left without a seat are
+        waitlisted when waitlist is set, rejected otherwise; with plan, the
+        fleet is first re-planned for the imported demand (overflow buses).
+        Returns one report row per input row, in input order.
+        """
+        report = {}
+        slot_requests = {}
+        seen = set()
+        for chunk in chunks:
+            for row_number, request_data in chunk:
+                error = self.validate_import_request(request_data)
+                key = (request_data.get('studentId'), request_data.get('timeSlot'))
+                if error is None and key in seen:
+                    error = 'Duplicate request for this time slot'
+                if error is not None:
+                    report[row_number] = report_row(row_number, request_data, 'Rejected', error=error)
+                    continue
+                seen.add(key)
+                slot_requests.setdefault(request_data['timeSlot'], []).append((row_number, request_data))
+
+        if plan and slot_requests:
+            self.plan_buses({time_slot: len(requests) for time_slot, requests in slot_requests.items()})
+
+        with ExitStack() as stack:
+            for time_slot in sorted(slot_requests):
+                stack.enter_context(self.slot_locks(time_slot))
+            self.booking_store.sync()
+
+            booking_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            new_bookings = []
+            for time_slot, requests in slot_requests.items():
+                fresh = []
+                for row_number, request_data in requests:
+                    if self.booking_store.has_booking(request_data['studentId'], time_slot, ('Confirmed', 'Pending', 'Waitlisted')):
+                        report[row_number] = report_row(row_number, request_data, 'Rejected',
+                                                        error='You already have a booking for this time slot')
+                    else:
+                        fresh.append((row_number, request_data))
+
+                allocations = self.allocate_import(time_slot, [request_data for _, request_data in fresh])
+                for index, (row_number, request_data) in enumerate(fresh):
+                    bus_number, seat = allocations.get(index, ('', ''))
+                    if not seat and not waitlist:
+                        report[row_number] = report_row(row_number, request_data, 'Rejected',
+                                                        error='No seats available for this time slot')
+                        continue
+                    new_bookings.append((row_number, request_data, {
+                        'BookingID': None,
+                        'StudentID': request_data['studentId'],
+                        'Name': request_data['name'],
+                        'Email': request_data['email'],
+                        'BusNumber': bus_number,
+                        'SeatNumber': seat,
+                        'TimeSlot': time_slot,
+                        'Destination': request_data['destination'],
+                        'BookingDate': booking_date,
+                        'Status': 'Confirmed' if seat else 'Waitlisted',
+                        'Priority': request_data.get('priority') or 'Normal',
+                        'SpecialNeeds': request_data.get('specialNeeds') or 'None'
+                    }))
+
+            new_bookings.sort(key=lambda item: item[0])
+            saved = self.save_seat_changes([booking for _, _, booking in new_bookings])
+            for (row_number, request_data, _), booking in zip(new_bookings, saved):
+                report[row_number] = report_row(row_number, request_data, booking['Status'], booking)
+
+        self.bus_table.flush()
+        return [report[row_number] for row_number in sorted(report)]
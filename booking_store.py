@@ -0,0 +1,423 @@
+import atexit
+import heapq
+import logging
+import threading
+from collections import defaultdict, deque
+
+from journal import COMPACT_MIN_ROWS, SNAPSHOT_EVERY_ROWS
+from storage import BOOKING_FIELDS
+
+logger = logging.getLogger(__name__)
+
+SEAT_LOG_SIZE = 4096  # seat changes kept for delta reads (see seat_changes)
+
+
+class BookingStore:
+    """
+    Process-resident index over the stored bookings
+    The bookings are read once at startup; after that storage is only ever
+    appended to, so no request has to scan the booking history again. A row
+    whose BookingID already exists supersedes the earlier row (status changes
+    are appended, never rewritten in place).
+    Other processes' writes are picked up by sync(), which asks the storage
+    backend (see storage.py) only for the rows written since the last read;
+    the backend's bookings lock serializes appends and BookingID assignment
+    across processes.
+    Pending and Waitlisted bookings are kept in a heap per (status, time
+    slot), ordered by priority(booking) (highest first, then booking order);
+    a heap is built on first use, so priority is only called once needed.
+    With a SnapshotFile (see journal.py), startup loads the latest snapshot
+    and replays only the rows written after it. Every snapshot_every journal
+    rows a new snapshot is written in the background, and once superseded
+    rows outnumber both compact_min_rows and the live bookings, the storage
+    is compacted to the latest row of each booking instead.
+    """
+
+    def __init__(self, storage, layout, priority=None, snapshots=None,
+                 snapshot_every=SNAPSHOT_EVERY_ROWS, compact_min_rows=COMPACT_MIN_ROWS):
+        self.storage = storage
+        self.layout = layout
+        self.priority = priority or (lambda booking: 0)
+        self.snapshots = snapshots
+        self.snapshot_every = snapshot_every
+        self.compact_min_rows = compact_min_rows
+        self.lock = threading.RLock()
+        self.listeners = []  # called with (version, seat changes) after each stamp
+        self.maintenance = None  # running snapshot/compaction thread
+        self.load()
+        atexit.register(self.wait)
+
+    def load(self):
+        """(Re)build every index from storage"""
+        with self.lock:
+            self.by_id = {}                         # BookingID -> latest row, in booking order
+            self.bus_occupancy = defaultdict(int)   # BusNumber -> confirmed seat bitmask
+            self.slot_bookings = defaultdict(dict)  # TimeSlot -> {BookingID: row}
+            self.slot_pending = defaultdict(dict)   # TimeSlot -> {BookingID: row} still Pending
+            self.slot_waitlist = defaultdict(dict)  # TimeSlot -> {BookingID: row} Waitlisted
+            self.queue_heaps = {}                   # (Status, TimeSlot) -> [(-priority, position, BookingID)]
+            self.queue_keys = {}                    # BookingID -> its live heap entry
+            self.slot_demand = defaultdict(int)     # TimeSlot -> Confirmed + Pending + Waitlisted bookings
+            self.by_student = defaultdict(dict)     # StudentID -> {BookingID: row}
+            self.by_email = defaultdict(dict)       # Email -> {BookingID: row}
+            self.position = {}                      # BookingID -> first row number
+            self.order = []                         # BookingIDs by position
+            self.max_id = 0
+            self.seat_log = deque()                 # (version, BusNumber, SeatNumber, taken), oldest first
+            self.unstamped = None                   # seat changes not yet given a version
+
+            rows, tail = self._read_journal()
+            for booking in rows:
+                self._index(booking)
+            for booking in tail:
+                self._index(booking)
+            # Deltas can only be served from the loaded state onwards
+            self.log_floor = self.version()
+            self.unstamped = []
+            self._maintain()
+
+    def _read_journal(self):
+        """
+        (rows, tail) to index on load: the snapshot's rows and those written
+        after it, or every stored row and no tail without a usable snapshot
+        Also sets the cursor and the journal row counters.
+        """
+        snapshot = self.snapshots.load(self.storage.journal_id()) if self.snapshots else None
+        if snapshot is not None:
+            rows, cursor, journal_rows = snapshot
+            tail, tail_cursor = self.storage.booking_changes(cursor)
+            if tail is not None:
+                self.cursor = tail_cursor
+                self.snapshot_rows = journal_rows
+                self.journal_rows = journal_rows + len(tail)
+                return rows, tail
+        rows, self.cursor = self.storage.load_bookings()
+        self.snapshot_rows = 0
+        self.journal_rows = len(rows)  # rows in storage up to the cursor, superseded ones included
+        return rows, []
+
+    def sync(self):
+        """Index rows written by other processes since the last read"""
+        with self.lock:
+            rows, cursor = self.storage.booking_changes(self.cursor)
+            if rows is None:
+                # Storage was replaced or truncated: start over
+                self.load()
+                return
+            self.cursor = cursor
+            for booking in rows:
+                self._index(booking)
+            self.journal_rows += len(rows)
+            self._stamp()
+            self._maintain()
+
+    def _index(self, booking):
+        booking_id = booking['BookingID']
+        previous = self.by_id.get(booking_id)
+        if previous is not None:
+            self._unindex(previous)
+        else:
+            self.position[booking_id] = len(self.order)
+            self.order.append(booking_id)
+
+        self.by_id[booking_id] = booking
+        time_slot = booking.get('TimeSlot')
+        status = booking.get('Status')
+
+        if status == 'Confirmed':
+            seat_mask = self.layout.mask_of((booking['SeatNumber'],))
+            self.bus_occupancy[booking['BusNumber']] |= seat_mask
+            self._seat_changed(booking, True)
+        elif status in ('Pending', 'Waitlisted'):
+            self._queue(status, time_slot)[booking_id] = booking
+            heap = self.queue_heaps.get((status, time_slot))
+            if heap is not None:
+                heapq.heappush(heap, self._queue_entry(booking))
+        if status in ('Confirmed', 'Pending', 'Waitlisted'):
+            self.slot_demand[time_slot] += 1
+
+        self.slot_bookings[time_slot][booking_id] = booking
+        self.by_student[booking.get('StudentID')][booking_id] = booking
+        self.by_email[booking.get('Email')][booking_id] = booking
+
+        try:
+            self.max_id = max(self.max_id, int(booking_id))
+        except (TypeError, ValueError):
+            pass
+
+    def _unindex(self, booking):
+        booking_id = booking['BookingID']
+        time_slot = booking.get('TimeSlot')
+
+        if booking.get('Status') == 'Confirmed':
+            seat_mask = self.layout.mask_of((booking['SeatNumber'],))
+            self.bus_occupancy[booking['BusNumber']] &= ~seat_mask
+            self._seat_changed(booking, False)
+        if booking.get('Status') in ('Confirmed', 'Pending', 'Waitlisted'):
+            self.slot_demand[time_slot] -= 1
+        self.slot_pending[time_slot].pop(booking_id, None)
+        self.slot_waitlist[time_slot].pop(booking_id, None)
+        self.queue_keys.pop(booking_id, None)
+        self.slot_bookings[time_slot].pop(booking_id, None)
+        self.by_student[booking.get('StudentID')].pop(booking_id, None)
+        self.by_email[booking.get('Email')].pop(booking_id, None)
+
+    def _seat_changed(self, booking, taken):
+        if self.unstamped is not None:
+            self.unstamped.append((booking['BusNumber'], booking['SeatNumber'], taken))
+
+    def _stamp(self):
+        """Move seat changes just indexed into the log under the current version"""
+        version = self.version()
+        changes, self.unstamped = self.unstamped, []
+        for bus_number, seat_number, taken in changes:
+            self.seat_log.append((version, bus_number, seat_number, taken))
+        while len(self.seat_log) > SEAT_LOG_SIZE:
+            self.log_floor = self.seat_log.popleft()[0]
+        if changes:
+            for listener in self.listeners:
+                listener(version, changes)
+
+    def add_listener(self, listener):
+        """Call listener(version, [(BusNumber, SeatNumber, taken), ...]) whenever seats change"""
+        self.listeners.append(listener)
+
+    def version(self):
+        """
+        Position of the indexed state in the booking history
+        Derived from the storage cursor, so every process reports the same
+        version for the same data.
+        """
+        with self.lock:
+            return self.storage.cursor_version(self.cursor)
+
+    def seat_changes(self, since):
+        """
+        (BusNumber, SeatNumber, taken) changes after version since, oldest
+        first, or None when they are no longer known (the caller then needs
+        the full occupancy)
+        """
+        with self.lock:
+            if since < self.log_floor or since > self.version():
+                return None
+            return [(bus_number, seat_number, taken) for version, bus_number, seat_number, taken in self.seat_log
+                    if version > since]
+
+    def next_booking_id(self):
+        """Next free BookingID, from the running maximum"""
+        with self.lock:
+            return self.max_id + 1
+
+    def get(self, booking_id):
+        with self.lock:
+            return self.by_id.get(str(booking_id))
+
+    def occupancy(self, bus_number):
+        """Confirmed-seat bitmask of a bus (see SeatLayout)"""
+        with self.lock:
+            return self.bus_occupancy.get(bus_number, 0)
+
+    def pending_bookings(self, time_slot):
+        """Pending bookings for a time slot"""
+        with self.lock:
+            return list(self.slot_pending.get(time_slot, {}).values())
+
+    def _queue(self, status, time_slot):
+        return (self.slot_pending if status == 'Pending' else self.slot_waitlist)[time_slot]
+
+    def _queue_entry(self, booking):
+        booking_id = booking['BookingID']
+        entry = (-self.priority(booking), self.position[booking_id], booking_id)
+        self.queue_keys[booking_id] = entry
+        return entry
+
+    def _queue_heap(self, status, time_slot):
+        heap = self.queue_heaps.get((status, time_slot))
+        if heap is None:
+            heap = [self._queue_entry(booking) for booking in self._queue(status, time_slot).values()]
+            heapq.heapify(heap)
+            self.queue_heaps[(status, time_slot)] = heap
+        return heap
+
+    def top_queued(self, status, time_slot, count=1):
+        """
+        The count highest-priority Pending/Waitlisted bookings of a slot, best
+        first, as (heap key, booking) pairs; a key is (-priority, position, BookingID)
+        O(count log n); entries of bookings that left the queue are dropped
+        as they surface.
+        """
+        with self.lock:
+            heap = self._queue_heap(status, time_slot)
+            taken = []
+            while heap and len(taken) < count:
+                entry = heapq.heappop(heap)
+                if self.queue_keys.get(entry[2]) == entry:
+                    taken.append(entry)
+            for entry in taken:
+                heapq.heappush(heap, entry)
+            queue = self._queue(status, time_slot)
+            return [(entry, queue[entry[2]]) for entry in taken]
+
+    def next_waitlisted(self, time_slot, count=1):
+        """The count highest-priority waitlisted bookings of a slot, best first"""
+        return [booking for _, booking in self.top_queued('Waitlisted', time_slot, count)]
+
+    def waitlisted(self, time_slot):
+        """Every waitlisted booking of a slot, highest priority first"""
+        with self.lock:
+            self._queue_heap('Waitlisted', time_slot)
+            bookings = list(self.slot_waitlist.get(time_slot, {}).values())
+            return sorted(bookings, key=lambda booking: self.queue_keys[booking['BookingID']])
+
+    def slot_history(self, time_slot):
+        """Every booking (any status) for a time slot"""
+        with self.lock:
+            return list(self.slot_bookings.get(time_slot, {}).values())
+
+    def demand(self):
+        """{TimeSlot: students holding or waiting for a seat}"""
+        with self.lock:
+            return {time_slot: count for time_slot, count in self.slot_demand.items() if count}
+
+    def confirmed_count(self, bus_number):
+        with self.lock:
+            return self.layout.count_taken(self.bus_occupancy.get(bus_number, 0))
+
+    def has_booking(self, student_id, time_slot, statuses=('Confirmed',)):
+        """True if the student already holds a booking in this slot with one of the statuses"""
+        with self.lock:
+            for booking in self.by_student.get(student_id, {}).values():
+                if booking['TimeSlot'] == time_slot and booking['Status'] in statuses:
+                    return True
+            return False
+
+    def has_confirmed_booking(self, student_id, time_slot):
+        """True if the student already holds a confirmed seat in this slot"""
+        return self.has_booking(student_id, time_slot)
+
+    def student_bookings(self, student_id=None, email=None):
+        """Bookings matching a student ID or an email, in booking order"""
+        with self.lock:
+            matches = {}
+            if email:
+                matches.update(self.by_email.get(email, {}))
+            if student_id:
+                matches.update(self.by_student.get(student_id, {}))
+            return [matches[booking_id] for booking_id in sorted(matches, key=self.position.__getitem__)]
+
+    def all_bookings(self):
+        with self.lock:
+            return list(self.by_id.values())
+
+    def position_of(self, booking_id):
+        with self.lock:
+            return self.position.get(booking_id)
+
+    def iter_bookings(self, start=0, chunk_size=500):
+        """
+        Yield (position, booking) in booking order, from position start on
+        The lock is only held while copying out one chunk at a time, so a
+        long export neither pins the whole history in memory nor blocks
+        writers; bookings committed meanwhile are included when reached.
+        """
+        position = max(start, 0)
+        while True:
+            with self.lock:
+                chunk = [self.by_id[booking_id] for booking_id in self.order[position:position + chunk_size]]
+            if not chunk:
+                return
+            for booking in chunk:
+                yield position, booking
+                position += 1
+
+    def append(self, booking):
+        """Persist one booking and index it"""
+        return self.save([booking])[0]
+
+    def save(self, bookings):
+        """
+        Persist new or updated bookings with a single append
+        Rows with an existing BookingID supersede the stored row; rows without
+        a BookingID get the next free one while the bookings lock is held.
+        """
+        if not bookings:
+            return []
+        with self.lock, self.storage.bookings_lock():
+            self.sync()
+            rows = []
+            for booking in bookings:
+                row = {field: '' if booking.get(field) is None else str(booking.get(field)) for field in BOOKING_FIELDS}
+                if not row['BookingID']:
+                    row['BookingID'] = str(self.max_id + 1)
+                    self.max_id += 1
+                rows.append(row)
+
+            self.cursor = self.storage.append_bookings(rows)
+            for row in rows:
+                self._index(row)
+            self.journal_rows += len(rows)
+            self._stamp()
+            self._maintain()
+            return rows
+
+    # Snapshots and compaction
+
+    def _maintain(self):
+        """Start a background compaction or snapshot once enough journal rows have built up"""
+        if self.snapshots is None or self.maintenance is not None:
+            return
+        superseded = self.journal_rows - len(self.by_id)
+        if superseded >= max(self.compact_min_rows, len(self.by_id)):
+            task = self.compact
+        elif self.journal_rows - self.snapshot_rows >= self.snapshot_every:
+            task = self.snapshot
+        else:
+            return
+        self.maintenance = threading.Thread(target=self._run_maintenance, args=(task,), daemon=True)
+        self.maintenance.start()
+
+    def _run_maintenance(self, task):
+        try:
+            task()
+        except Exception:
+            logger.exception("Booking journal maintenance failed")
+        finally:
+            with self.lock:
+                self.maintenance = None
+
+    def wait(self):
+        """Wait for a running snapshot or compaction to finish"""
+        maintenance = self.maintenance
+        if maintenance is not None:
+            maintenance.join()
+
+    def snapshot(self):
+        """Write a snapshot of the indexed bookings (the rows are copied under the lock, written outside it)"""
+        with self.lock:
+            rows = list(self.by_id.values())
+            cursor, journal_rows = self.cursor, self.journal_rows
+            journal_id = self.storage.journal_id()
+            self.snapshot_rows = journal_rows
+        self.snapshots.save(rows, cursor, journal_rows, journal_id)
+
+    def compact(self):
+        """
+        Rewrite storage with only the latest row of each booking, writing the
+        matching snapshot first
+        Processes (this one included) pick up the compacted storage on their
+        next sync and reload from that snapshot.
+        """
+        with self.lock:
+            self.sync()
+            rows = list(self.by_id.values())
+            cursor = self.cursor
+
+        def write_snapshot(rows_cursor, journal_id):
+            self.snapshots.save(rows, rows_cursor, len(rows), journal_id)
+
+        if self.storage.compact_bookings(rows, cursor, write_snapshot) is None:
+            # Nothing to compact (storage updates rows in place, or was replaced
+            # meanwhile): count superseded rows from here and take a plain snapshot
+            with self.lock:
+                self.journal_rows = len(self.by_id)
+            self.snapshot()
@@ -0,0 +1,83 @@
+import csv
+
+# Booking request fields and the column names accepted for them (compared
+# lower-case with spaces, dashes and underscores removed), so both the
+# /api/book field names and the booking.csv headers work
+IMPORT_COLUMNS = {
+    'name': ('name', 'studentname', 'fullname'),
+    'studentId': ('studentid', 'id', 'rollnumber', 'rollno'),
+    'email': ('email', 'emailaddress'),
+    'timeSlot': ('timeslot', 'slot'),
+    'destination': ('destination', 'stop'),
+    'specialNeeds': ('specialneeds',),
+    'priority': ('priority',),
+}
+REQUIRED_COLUMNS = ('name', 'studentId', 'email', 'timeSlot', 'destination')
+REPORT_FIELDS = ['Row', 'StudentID', 'TimeSlot', 'Status', 'BookingID', 'BusNumber', 'SeatNumber', 'Error']
+IMPORT_CHUNK_ROWS = 1000
+
+
+def column_key(header):
+    return ''.join(ch for ch in header.lower() if ch.isalnum())
+
+
+def header_map(headers):
+    """{column position: request field} for a CSV header row; raises ValueError if a required column is missing"""
+    aliases = {alias: field for field, names in IMPORT_COLUMNS.items() for alias in names}
+    mapping = {}
+    for position, header in enumerate(headers):
+        field = aliases.get(column_key(header))
+        if field is not None and field not in mapping.values():
+            mapping[position] = field
+    missing = [field for field in REQUIRED_COLUMNS if field not in mapping.values()]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    return mapping
+
+
+def read_requests(lines, chunk_size=IMPORT_CHUNK_ROWS):
+    """
+    Yield lists of (row number, request) from CSV text, chunk_size rows at a time
+    lines is any iterable of text lines (an open file, an uploaded stream);
+    row numbers count the header as row 1, like a spreadsheet. Blank rows
+    are skipped.
+    """
+    reader = csv.reader(lines)
+    headers = next(reader, None)
+    if headers is None:
+        raise ValueError('The file is empty')
+    mapping = header_map(headers)
+
+    chunk = []
+    for row in reader:
+        if not any(value.strip() for value in row):
+            continue
+        request = {field: row[position].strip() for position, field in mapping.items() if position < len(row)}
+        chunk.append((reader.line_num, request))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def report_row(row_number, request, status, booking=None, error=''):
+    booking = booking or {}
+    return {
+        'Row': row_number,
+        'StudentID': request.get('studentId', ''),
+        'TimeSlot': request.get('timeSlot', ''),
+        'Status': status,
+        'BookingID': booking.get('BookingID', ''),
+        'BusNumber': booking.get('BusNumber', ''),
+        'SeatNumber': booking.get('SeatNumber', ''),
+        'Error': error
+    }
+
+
+def import_summary(report):
+    """{Status: rows} counts of an import report"""
+    summary = {'Confirmed': 0, 'Waitlisted': 0, 'Rejected': 0}
+    for row in report:
+        summary[row['Status']] = summary.get(row['Status'], 0) + 1
+    return summary
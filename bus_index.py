@@ -0,0 +1,97 @@
+import heapq
+import threading
+
+
+class BusIndex:
+    """
+    Buses of each time slot ordered by free seats, overall and per seat zone
+    One heap per (slot, zone) and per slot; a bus whose occupancy changes
+    gets a fresh entry and its old ones are skipped when they surface (lazy
+    deletion), so picking a bus is O(log buses). Ties go to the bus listed
+    first in the bus table.
+    """
+
+    def __init__(self, layout, occupancy):
+        self.layout = layout
+        self.occupancy = occupancy  # BusNumber -> confirmed seat bitmask
+        self.lock = threading.Lock()
+        self.version = None         # bus table version the index was built from
+        self.slot_of = {}           # BusNumber -> TimeSlot
+        self.position = {}          # BusNumber -> row number in the bus table
+        self.slot_buses = {}        # TimeSlot -> BusNumbers in table order
+        self.current = {}           # (BusNumber, zone or None) -> live heap key
+        self.heaps = {}             # (TimeSlot, zone or None) -> [(key, position, BusNumber)]
+
+    def _keys(self, bus_number):
+        """Heap keys of a bus: fewer free seats sort later"""
+        occupied = self.occupancy(bus_number)
+        free = self.layout.count_free(occupied)
+        keys = {None: (-free,)}
+        for zone, zone_mask in self.layout.zone_masks.items():
+            keys[zone] = (-self.layout.count_free(occupied | (self.layout.full_mask & ~zone_mask)), -free)
+        return keys
+
+    def rebuild(self, buses, version=None):
+        """Index the bus rows (e.g. after the bus table was reloaded)"""
+        keys = {bus['BusNumber']: self._keys(bus['BusNumber']) for bus in buses}
+        with self.lock:
+            self.version = version
+            self.slot_of = {bus['BusNumber']: bus['TimeSlot'] for bus in buses}
+            self.position = {bus['BusNumber']: i for i, bus in enumerate(buses)}
+            self.slot_buses = {}
+            self.current = {}
+            self.heaps = {}
+            for bus in buses:
+                self.slot_buses.setdefault(bus['TimeSlot'], []).append(bus['BusNumber'])
+                self._push(bus['BusNumber'], keys[bus['BusNumber']])
+            for heap in self.heaps.values():
+                heapq.heapify(heap)
+
+    def _push(self, bus_number, keys):
+        time_slot = self.slot_of[bus_number]
+        position = self.position[bus_number]
+        for zone, key in keys.items():
+            self.current[(bus_number, zone)] = key
+            heap = self.heaps.setdefault((time_slot, zone), [])
+            heapq.heappush(heap, (key, position, bus_number))
+            if len(heap) > 4 * len(self.slot_buses[time_slot]) + 16:
+                # Drop stale entries once they dominate
+                heap[:] = [entry for entry in heap if self.current.get((entry[2], zone)) == entry[0]]
+                heapq.heapify(heap)
+
+    def update(self, bus_numbers):
+        """Re-rank buses whose occupancy changed"""
+        keys = {bus_number: self._keys(bus_number) for bus_number in bus_numbers if bus_number in self.slot_of}
+        with self.lock:
+            for bus_number, bus_keys in keys.items():
+                if bus_number in self.slot_of:
+                    self._push(bus_number, bus_keys)
+
+    def _top(self, time_slot, zone):
+        heap = self.heaps.get((time_slot, zone))
+        while heap:
+            key, _, bus_number = heap[0]
+            if self.current.get((bus_number, zone)) == key:
+                return bus_number, key
+            heapq.heappop(heap)
+        return None, None
+
+    def pick(self, time_slot, zone=None):
+        """
+        Bus of the slot with the most free seats in zone (most free seats
+        overall when no bus has any there), or None when the slot is full
+        """
+        with self.lock:
+            if zone is not None and zone in self.layout.zone_masks:
+                bus_number, key = self._top(time_slot, zone)
+                if bus_number is not None and key[0] < 0:
+                    return bus_number
+            bus_number, key = self._top(time_slot, None)
+            if bus_number is not None and key[0] < 0:
+                return bus_number
+            return None
+
+    def buses(self, time_slot):
+        """Every bus of a slot, in bus table order"""
+        with self.lock:
+            return list(self.slot_buses.get(time_slot, ()))
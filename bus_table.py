@@ -0,0 +1,137 @@
+import atexit
+import threading
+from collections import defaultdict
+
+
+class BusTable:
+    """
+    In-memory bus table with incrementally maintained seat counters
+    Bookings adjust a bus's BookedSeats by +/- deltas; storage is written at
+    most once per flush_delay seconds, coalescing every change made in the
+    meantime. On flush, the changed buses get their count from count_source
+    (the booking store's occupancy, which also sees other processes' commits),
+    so worker processes sharing the bus table never overwrite each other with
+    stale numbers. source_lock guards count_source and is always taken before
+    the storage's buses lock, the same order the booking store saves in
+    (with SQLite both are one write transaction, so the other order deadlocks).
+    """
+
+    def __init__(self, storage, count_source, flush_delay=1.0, source_lock=None):
+        self.storage = storage
+        self.count_source = count_source
+        self.source_lock = source_lock if source_lock is not None else threading.RLock()
+        self.flush_delay = flush_delay
+        self.lock = threading.RLock()
+        self.pending = defaultdict(int)  # BusNumber -> seats booked since last flush
+        self.timer = None
+        self.version = 0  # bumped on every (re)load, so dependent indexes know to rebuild
+        self.load()
+        atexit.register(self.flush)
+
+    def load(self):
+        """Read the bus table (pending deltas are kept and still applied on top)"""
+        with self.lock:
+            self.version += 1
+            self.signature = self.storage.buses_signature()
+            self.rows = rows = self.storage.read_buses()
+            self.by_number = {bus['BusNumber']: bus for bus in rows}
+
+    def refresh(self):
+        """Reload if another process rewrote the bus table"""
+        if self.storage.buses_signature() != self.signature:
+            self.load()
+
+    def _view(self, bus):
+        row = dict(bus)
+        change = self.pending.get(bus['BusNumber'], 0)
+        if change:
+            booked = int(row['BookedSeats']) + change
+            row['BookedSeats'] = str(booked)
+            row['AvailableSeats'] = str(int(row['TotalSeats']) - booked)
+        return row
+
+    def buses(self):
+        """Current bus rows, including changes not yet flushed"""
+        with self.lock:
+            self.refresh()
+            return [self._view(bus) for bus in self.rows]
+
+    def bus(self, bus_number):
+        """Current row of one bus, including changes not yet flushed, or None"""
+        with self.lock:
+            bus = self.by_number.get(bus_number)
+            return self._view(bus) if bus is not None else None
+
+    def booked(self, bus_number):
+        with self.lock:
+            bus = self.by_number.get(bus_number)
+            if bus is None:
+                return 0
+            return int(bus['BookedSeats']) + self.pending.get(bus_number, 0)
+
+    def adjust(self, bus_number, change):
+        """Record change more (or, if negative, fewer) booked seats on a bus"""
+        if not change:
+            return
+        with self.lock:
+            self.pending[bus_number] += change
+            self._schedule_flush()
+
+    def reconcile(self):
+        """Correct every stored counter that disagrees with count_source"""
+        with self.lock:
+            self.refresh()
+            self._write(self.by_number)
+
+    def _schedule_flush(self):
+        if self.flush_delay <= 0:
+            self.flush()
+        elif self.timer is None:
+            self.timer = threading.Timer(self.flush_delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """Write the counters of every changed bus to storage in one write"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            changed = [bus_number for bus_number, change in self.pending.items() if change]
+            self.pending.clear()
+            if changed:
+                self._write(changed)
+
+    def rewrite(self, plan):
+        """
+        Replace the bus rows with plan(current rows), atomically across processes
+        Seat counters of the new rows come from count_source.
+        """
+        with self.lock, self.source_lock, self.storage.buses_lock():
+            self.load()
+            rows = plan([self._view(bus) for bus in self.rows])
+            for bus in rows:
+                booked = self.count_source(bus['BusNumber'])
+                bus['BookedSeats'] = str(booked)
+                bus['AvailableSeats'] = str(int(bus['TotalSeats']) - booked)
+                self.pending.pop(bus['BusNumber'], None)
+            self.storage.write_buses(rows)
+            self.load()
+            return rows
+
+    def _write(self, bus_numbers):
+        with self.source_lock, self.storage.buses_lock():
+            self.load()
+            stale = False
+            for bus_number in bus_numbers:
+                bus = self.by_number.get(bus_number)
+                if bus is None:
+                    continue
+                booked = self.count_source(bus_number)
+                if int(bus['BookedSeats']) != booked:
+                    bus['BookedSeats'] = str(booked)
+                    bus['AvailableSeats'] = str(int(bus['TotalSeats']) - booked)
+                    stale = True
+            if stale:
+                self.storage.write_buses(self.rows)
+                self.load()
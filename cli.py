@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Bus Seat Allocation Optimizer - command line tools (no web server needed)
+
+    python cli.py allocate [--time-slot 4PM] [--plan]
+    python cli.py replay old_booking.csv --algorithm hybrid --report replay.csv
+    python cli.py simulate --time-slot 11AM --students 60 --algorithms greedy,hybrid
+
+allocate works on the live data directory and is safe to run from cron next
+to the web app (slot locks are shared between processes). replay and
+simulate run against a scratch copy of the routes and buses and never touch
+the live bookings.
+"""
+
+import csv
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+import click
+
+from allocation import ALLOCATORS, SEAT_ZONES, SPECIAL_NEEDS_PRIORITY, SPECIAL_NEEDS_SEAT_BONUS, TIME_SLOTS
+from booking_service import BookingError, BookingService
+from storage import BOOKING_FIELDS, BUS_FIELDS, ROUTE_FIELDS
+
+REPLAY_FIELDS = ['BookingID', 'StudentID', 'TimeSlot', 'Destination', 'SpecialNeeds',
+                 'OriginalStatus', 'OriginalBus', 'OriginalSeat',
+                 'ReplayStatus', 'ReplayBus', 'ReplaySeat', 'Error']
+
+
+def write_csv(path, fields, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+@contextmanager
+def scratch_service(source, algorithm, bookings=()):
+    """
+    BookingService over a temporary copy of source's routes and buses
+    The copy starts with the given booking rows (none by default) and is
+    removed on exit.
+    """
+    data_dir = tempfile.mkdtemp(prefix='bus-optimizer-')
+    try:
+        write_csv(os.path.join(data_dir, 'routes.csv'), ROUTE_FIELDS, source.route_table.rows())
+        write_csv(os.path.join(data_dir, 'buses.csv'), BUS_FIELDS, source.bus_table.buses())
+        write_csv(os.path.join(data_dir, 'booking.csv'), BOOKING_FIELDS, bookings)
+        service = BookingService(data_dir, default_algorithm=algorithm, flush_delay=0)
+        try:
+            yield service
+        finally:
+            service.booking_store.wait()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def seat_quality(service, bookings):
+    """
+    (share of seated bookings in their destination's zone, share of
+    special-needs bookings in their preferred rows or None)
+    """
+    seated = [booking for booking in bookings if booking.get('SeatNumber')]
+    zone_hits = sum(1 for booking in seated
+                    if booking['SeatNumber'][0] in SEAT_ZONES.get(service.route_table.zone(booking['Destination']), ()))
+    special = [booking for booking in seated if booking.get('SpecialNeeds') in SPECIAL_NEEDS_SEAT_BONUS]
+    priority_hits = sum(1 for booking in special
+                        if booking['SeatNumber'][0] in SPECIAL_NEEDS_SEAT_BONUS[booking['SpecialNeeds']][1])
+    return (zone_hits / len(seated) if seated else 0.0,
+            priority_hits / len(special) if special else None)
+
+
+def percent(value):
+    return 'n/a' if value is None else f'{value:.0%}'
+
+
+@click.group()
+@click.option('--data-dir', default='data', show_default=True, type=click.Path(file_okay=False),
+              help='Data directory (routes.csv, booking.csv, buses.csv)')
+@click.option('--storage', type=click.Choice(['csv', 'sqlite', 'binary']),
+              default=lambda: os.environ.get('BUS_OPTIMIZER_STORAGE', 'csv'),
+              help='Storage backend of the data directory [default: $BUS_OPTIMIZER_STORAGE or csv]')
+@click.pass_context
+def cli(ctx, data_dir, storage):
+    """Allocate, replay and simulate bookings without the web app"""
+    ctx.obj = {'data_dir': data_dir, 'storage': storage}
+
+
+def open_service(ctx):
+    return BookingService(ctx.obj['data_dir'], backend=ctx.obj['storage'])
+
+
+@cli.command()
+@click.option('--time-slot', 'time_slots', multiple=True, type=click.Choice(list(TIME_SLOTS)),
+              help='Time slot to allocate (repeatable) [default: every slot]')
+@click.option('--plan', is_flag=True, help='Re-plan the fleet (overflow buses) for current demand first')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, type=click.IntRange(min=1),
+              help='Processes solving the slots (and, for large queues, the buses) in parallel; 1 solves each slot exactly in-process')
+@click.pass_context
+def allocate(ctx, time_slots, plan, workers):
+    """Seat pending bookings in one batch, then waitlisted students in any free seats"""
+    service = open_service(ctx)
+    if plan:
+        _, vehicles, skipped = service.plan_buses()
+        print(f'Planned the fleet: {vehicles} physical buses')
+        if skipped:
+            print(f"Skipped time slots without a start time: {', '.join(skipped)}")
+    time_slots = list(time_slots or TIME_SLOTS)
+    start = time.perf_counter()
+    confirmed, pending = service.batch_allocate(time_slots, workers=workers)
+    print(f'Seated {sum(len(bookings) for bookings in confirmed.values())} pending bookings '
+          f'in {time.perf_counter() - start:.2f}s')
+    for time_slot in time_slots:
+        promoted = service.fill_from_waitlist(time_slot)
+        print(f'{time_slot}: {len(confirmed[time_slot])} pending bookings seated, {len(pending[time_slot])} still pending, '
+              f'{len(promoted)} promoted from the waitlist')
+    service.bus_table.flush()
+
+
+@cli.command()
+@click.argument('booking_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--algorithm', type=click.Choice(sorted(ALLOCATORS)), help='Strategy to replay with [default: configured one]')
+@click.option('--report', type=click.Path(dir_okay=False), help='Write the per-booking comparison to this CSV file')
+@click.pass_context
+def replay(ctx, booking_file, algorithm, report):
+    """
+    Re-run the requests of a booking.csv file through an allocator
+
+    The first row of each BookingID is replayed as a booking request, in file
+    order; a later Cancelled row cancels the replayed booking. Other updates
+    (promotions, batch allocation) are not replayed.
+    """
+    source = open_service(ctx)
+    algorithm = algorithm or source.allocation_algorithm(None)
+    with open(booking_file, newline='', encoding='utf-8-sig') as file:
+        journal = list(csv.DictReader(file))
+
+    latest = {}
+    for row in journal:
+        latest[row['BookingID']] = row
+
+    results = {}
+    latencies = []
+    with scratch_service(source, algorithm) as service:
+        for row in journal:
+            booking_id = row['BookingID']
+            result = results.get(booking_id)
+            if result is None:
+                result = results[booking_id] = {
+                    'BookingID': booking_id, 'StudentID': row['StudentID'], 'TimeSlot': row['TimeSlot'],
+                    'Destination': row['Destination'], 'SpecialNeeds': row['SpecialNeeds'] or 'None',
+                    'OriginalStatus': latest[booking_id]['Status'], 'OriginalBus': latest[booking_id]['BusNumber'],
+                    'OriginalSeat': latest[booking_id]['SeatNumber'],
+                    'ReplayStatus': 'Rejected', 'ReplayBus': '', 'ReplaySeat': '', 'Error': '', 'replayed': None
+                }
+                start = time.perf_counter()
+                try:
+                    booking, _ = service.book({
+                        'studentId': row['StudentID'], 'name': row['Name'], 'email': row['Email'],
+                        'timeSlot': row['TimeSlot'], 'destination': row['Destination'],
+                        'specialNeeds': row['SpecialNeeds'] or 'None', 'priority': row['Priority'] or 'Normal',
+                        'algorithm': algorithm
+                    })
+                except BookingError as e:
+                    result['Error'] = str(e)
+                else:
+                    result.update(ReplayStatus=booking['Status'], ReplayBus=booking['BusNumber'],
+                                  ReplaySeat=booking['SeatNumber'], replayed=booking['BookingID'])
+                latencies.append(time.perf_counter() - start)
+            elif row['Status'] == 'Cancelled' and result['replayed'] is not None \
+                    and result['ReplayStatus'] != 'Cancelled':
+                cancelled, _ = service.cancel(result['replayed'])
+                result['ReplayStatus'] = cancelled['Status']
+
+        rows = list(results.values())
+        original = seat_quality(service, [{'Destination': row['Destination'], 'SpecialNeeds': row['SpecialNeeds'],
+                                           'SeatNumber': row['OriginalSeat']}
+                                          for row in rows if row['OriginalStatus'] == 'Confirmed'])
+        replayed = seat_quality(service, [{'Destination': row['Destination'], 'SpecialNeeds': row['SpecialNeeds'],
+                                           'SeatNumber': row['ReplaySeat']}
+                                          for row in rows if row['ReplayStatus'] == 'Confirmed'])
+
+    if report:
+        write_csv(report, REPLAY_FIELDS, rows)
+    seated = sum(1 for row in rows if row['OriginalStatus'] == 'Confirmed')
+    reseated = sum(1 for row in rows if row['ReplayStatus'] == 'Confirmed')
+    same = sum(1 for row in rows if row['ReplayStatus'] == 'Confirmed' and row['OriginalStatus'] == 'Confirmed'
+               and (row['ReplayBus'], row['ReplaySeat']) == (row['OriginalBus'], row['OriginalSeat']))
+    mean_ms = sum(latencies) / len(latencies) * 1000 if latencies else 0.0
+    print(f'Replayed {len(rows)} booking requests with {algorithm} ({mean_ms:.2f} ms per request)')
+    print(f'  seated:           {seated} originally, {reseated} replayed ({same} in the same seat)')
+    print(f'  zone match:       {percent(original[0])} originally, {percent(replayed[0])} replayed')
+    print(f'  priority seating: {percent(original[1])} originally, {percent(replayed[1])} replayed')
+
+
+@cli.command()
+@click.option('--time-slot', required=True, type=click.Choice(list(TIME_SLOTS)), help='Time slot to simulate')
+@click.option('--students', default=40, show_default=True, type=click.IntRange(min=1), help='Synthetic booking requests')
+@click.option('--special-share', default=0.2, show_default=True, type=click.FloatRange(0, 1),
+              help='Share of students with special needs')
+@click.option('--algorithms', default=','.join(sorted(ALLOCATORS)), show_default=True,
+              help='Comma-separated strategies to compare')
+@click.option('--empty', is_flag=True, help="Start from empty buses instead of the slot's current bookings")
+@click.option('--seed', default=1, show_default=True, type=int, help='Random seed of the synthetic students')
+@click.pass_context
+def simulate(ctx, time_slot, students, special_share, algorithms, empty, seed):
+    """
+    Book synthetic students into one time slot with each strategy
+
+    Every strategy starts from the same copy of the slot (its buses and, unless
+    --empty, its confirmed bookings) and gets the same students in the same
+    order.
+    """
+    names = [name.strip() for name in algorithms.split(',') if name.strip()]
+    unknown = [name for name in names if name not in ALLOCATORS]
+    if unknown:
+        raise click.BadParameter(f"unknown strategy {', '.join(unknown)}", param_hint='--algorithms')
+
+    source = open_service(ctx)
+    destinations = [route['Destination'] for route in source.route_table.rows()]
+    if not destinations:
+        raise click.ClickException('No routes to simulate')
+    current = [] if empty else [booking for booking in source.booking_store.slot_history(time_slot)
+                                if booking['Status'] == 'Confirmed']
+
+    rng = random.Random(seed)
+    needs = list(SPECIAL_NEEDS_PRIORITY)
+    requests = [{
+        'studentId': str(900000 + i), 'name': f'Simulated {i}', 'email': f'sim{i}@example.com',
+        'timeSlot': time_slot, 'destination': rng.choice(destinations),
+        'specialNeeds': rng.choice(needs) if rng.random() < special_share else 'None'
+    } for i in range(students)]
+
+    print(f'{time_slot}: {len(current)} seats already taken, {students} simulated students')
+    print(f"{'strategy':<16}{'seated':>8}{'zone':>8}{'priority':>10}{'mean ms':>10}{'max ms':>10}")
+    for name in names:
+        with scratch_service(source, name, current) as service:
+            seated = []
+            latencies = []
+            for request_data in requests:
+                start = time.perf_counter()
+                try:
+                    booking, _ = service.book(dict(request_data, algorithm=name))
+                except BookingError:
+                    pass
+                else:
+                    seated.append(booking)
+                latencies.append(time.perf_counter() - start)
+            zone_match, priority = seat_quality(service, seated)
+        print(f'{name:<16}{len(seated):>8}{percent(zone_match):>8}{percent(priority):>10}'
+              f'{sum(latencies) / len(latencies) * 1000:>10.2f}{max(latencies) * 1000:>10.2f}')
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,116 @@
+import json
+import queue
+import threading
+import time
+
+
+def format_event(event_id, event, data):
+    """One Server-Sent Events message"""
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    """
+    One open event stream
+    Messages wait in a bounded queue; a client that falls queue_size messages
+    behind is told to resync instead of making publishers wait for it.
+    """
+
+    def __init__(self, queue_size):
+        self.messages = queue.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.messages.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+
+class EventHub:
+    """
+    In-process publish/subscribe hub for Server-Sent Events
+    publish() formats a message once and hands it to every subscriber without
+    blocking. While anyone is subscribed, poll (if given) runs every
+    poll_interval seconds on a background thread; it is how changes committed
+    by other worker processes reach this process's streams.
+    Every open stream holds a server thread for as long as the client stays
+    connected, so at most max_subscribers (if given) are open at once;
+    subscribe() returns None beyond that and the client has to poll instead.
+    """
+
+    def __init__(self, poll=None, poll_interval=1.0, queue_size=256, heartbeat=15.0, max_subscribers=None):
+        self.poll = poll
+        self.max_subscribers = max_subscribers
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.next_id = 0
+        self.poller = None
+
+    def publish(self, event, data):
+        with self.lock:
+            if not self.subscribers:
+                return
+            self.next_id += 1
+            message = format_event(self.next_id, event, data)
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def subscribe(self):
+        """New subscription, or None if max_subscribers streams are already open"""
+        subscription = Subscription(self.queue_size)
+        with self.lock:
+            if self.max_subscribers is not None and len(self.subscribers) >= self.max_subscribers:
+                return None
+            self.subscribers.add(subscription)
+            if self.poll is not None and self.poller is None:
+                self.poller = threading.Thread(target=self._poll_loop, daemon=True)
+                self.poller.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self.lock:
+                if not self.subscribers:
+                    self.poller = None
+                    return
+            try:
+                self.poll()
+            except Exception:  # keep polling; the next round may succeed
+                pass
+
+    def stream(self, subscription, hello=None):
+        """
+        Generator of SSE text for one subscription; unsubscribes when the
+        client goes away
+        hello is sent first, e.g. so the client knows which version it starts from.
+        """
+        try:
+            yield 'retry: 3000\n\n'
+            if hello is not None:
+                yield format_event(0, 'hello', hello)
+            while True:
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    while not subscription.messages.empty():
+                        subscription.messages.get_nowait()
+                    yield format_event(0, 'resync', {})
+                try:
+                    yield subscription.messages.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,116 @@
+import heapq
+import re
+
+SLOT_PATTERN = re.compile(r'^\s*(\d{1,2})(?::(\d{2}))?\s*([AaPp][Mm])\s*$')
+
+
+def slot_minutes(time_slot):
+    """Start of a time slot label such as '11AM' or '4:30PM', in minutes after midnight"""
+    match = SLOT_PATTERN.match(time_slot)
+    if not match:
+        raise ValueError(f'Unrecognized time slot: {time_slot}')
+    hour, minute, half = int(match.group(1)) % 12, int(match.group(2) or 0), match.group(3).upper()
+    return (hour + (12 if half == 'PM' else 0)) * 60 + minute
+
+
+def buses_needed(demand, capacity):
+    """Buses a slot needs for demand students"""
+    return -(-demand // capacity)
+
+
+def bus_number_key(bus_number):
+    digits = ''.join(ch for ch in bus_number if ch.isdigit())
+    return int(digits) if digits else 0
+
+
+def plan_fleet(buses, demand, capacity, trip_minutes, turnaround_minutes, reuse=None):
+    """
+    Chain bus trips across time slots onto the fewest physical buses
+    Every row of buses is one trip in its TimeSlot (kept, since bookings may
+    reference it); slots whose demand exceeds their seats get overflow trips.
+    Trips are then assigned to vehicles by start time: a vehicle can take a
+    trip once its previous trip plus turnaround is over. Taking any free
+    vehicle, and a new one only when none is free, uses the minimum number of
+    vehicles (interval partitioning, i.e. a minimum path cover of the trip
+    DAG); among free vehicles the one coming from the slot declared in
+    reuse[time_slot] is preferred.
+
+    Returns (rows, vehicle_count, skipped): the bus rows in their original
+    order, overflow trips appended, with IsReused/ReusedFrom filled in (a
+    vehicle's trips chain through ReusedFrom; BusID is left as it is), and
+    the time slots left out because their label has no start time. Rows of
+    skipped slots are returned unchanged and get no overflow trips.
+    """
+    reuse = reuse or {}
+    trips = [dict(bus) for bus in buses]
+    starts = {}
+    skipped = []
+    for time_slot in sorted({trip['TimeSlot'] for trip in trips} | set(demand)):
+        try:
+            starts[time_slot] = slot_minutes(time_slot)
+        except ValueError:
+            skipped.append(time_slot)
+    slot_trips = {time_slot: [] for time_slot in starts}
+    for trip in trips:
+        if trip['TimeSlot'] in slot_trips:
+            slot_trips[trip['TimeSlot']].append(trip)
+
+    # Overflow trips for slots that need more buses than they have
+    next_number = max((bus_number_key(trip['BusNumber']) for trip in trips), default=0)
+    next_id = max((bus_number_key(trip.get('BusID') or '') for trip in trips), default=0)
+    for time_slot in sorted(starts, key=starts.get):
+        existing = slot_trips[time_slot]
+        for _ in range(buses_needed(demand.get(time_slot, 0), capacity) - len(existing)):
+            next_number += 1
+            next_id += 1
+            trip = {
+                'BusID': f'B{next_id}',
+                'BusNumber': f'BUS{next_number}',
+                'TimeSlot': time_slot,
+                'TotalSeats': str(capacity),
+                'BookedSeats': '0',
+                'AvailableSeats': str(capacity),
+            }
+            existing.append(trip)
+            trips.append(trip)
+
+    schedule = sorted((trip for trip in trips if trip['TimeSlot'] in starts), key=lambda trip: starts[trip['TimeSlot']])
+
+    busy = []           # (free at, vehicle number)
+    free = {}           # vehicle -> slot of its last trip, for vehicles already back
+    free_by_slot = {}   # slot of last trip -> {vehicle: None}
+    last_trip = {}      # vehicle -> BusNumber of its last trip
+    vehicle_slot = {}   # vehicle -> TimeSlot of its last trip
+    vehicle_count = 0
+
+    for trip in schedule:
+        time_slot = trip['TimeSlot']
+        start = starts[time_slot]
+        while busy and busy[0][0] <= start:
+            _, vehicle = heapq.heappop(busy)
+            free[vehicle] = vehicle_slot[vehicle]
+            free_by_slot.setdefault(vehicle_slot[vehicle], {})[vehicle] = None
+
+        preferred = free_by_slot.get(reuse.get(time_slot)) if reuse.get(time_slot) else None
+        if preferred:
+            vehicle = next(iter(preferred))
+        elif free:
+            vehicle = next(iter(free))
+        else:
+            vehicle = None
+
+        if vehicle is None:
+            vehicle_count += 1
+            vehicle = vehicle_count
+            trip['IsReused'] = 'False'
+            trip['ReusedFrom'] = ''
+        else:
+            del free_by_slot[free.pop(vehicle)][vehicle]
+            trip['IsReused'] = 'True'
+            trip['ReusedFrom'] = last_trip[vehicle]
+
+        last_trip[vehicle] = trip['BusNumber']
+        vehicle_slot[vehicle] = time_slot
+        heapq.heappush(busy, (start + trip_minutes + turnaround_minutes, vehicle))
+
+    return trips, vehicle_count, skipped
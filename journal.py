@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from metrics import file_opened
+from storage import BOOKING_FIELDS
+
+SNAPSHOT_FORMAT = 2
+SNAPSHOT_EVERY_ROWS = 5000   # journal rows indexed between snapshots
+COMPACT_MIN_ROWS = 20000     # superseded rows tolerated before booking.csv is compacted
+
+logger = logging.getLogger(__name__)
+
+
+def _tuples(value):
+    """JSON arrays back to the tuples storage cursors and ids are made of"""
+    if isinstance(value, list):
+        return tuple(_tuples(item) for item in value)
+    return value
+
+
+class SnapshotFile:
+    """
+    Snapshot of the booking index at a storage cursor, as JSON lines
+    The first line holds the cursor the rows were read up to and how many
+    journal rows that cursor covers; every further line is the latest row of
+    one booking (its values, in booking order). It is plain data: a damaged
+    or tampered file is rejected, never executed. Loading it and replaying
+    only the rows written after the cursor replaces parsing the whole
+    booking history at startup.
+    A snapshot taken against other storage (a replaced booking.csv, another
+    database) is ignored, so a stale or missing file only costs a full load.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def load(self, storage_id):
+        """(rows, cursor, journal rows) or None if there is no usable snapshot"""
+        try:
+            file_opened()
+            with open(self.path, encoding='utf-8') as file:
+                header = json.loads(file.readline())
+                if header.get('format') != SNAPSHOT_FORMAT or header.get('fields') != BOOKING_FIELDS \
+                        or _tuples(header.get('storage')) != storage_id:
+                    return None
+                rows = []
+                for line in file:
+                    values = json.loads(line)
+                    if len(values) != len(BOOKING_FIELDS):
+                        raise ValueError(f'row {len(rows) + 1} has {len(values)} fields')
+                    rows.append(dict(zip(BOOKING_FIELDS, values)))
+            if len(rows) != header['booked_rows']:
+                raise ValueError(f"{len(rows)} of {header['booked_rows']} rows")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, AttributeError, TypeError) as e:
+            logger.warning("Ignoring unreadable booking snapshot %s: %s", self.path, e)
+            return None
+        return rows, _tuples(header['cursor']), header['journal_rows']
+
+    def save(self, rows, cursor, journal_rows, storage_id):
+        """Write a snapshot of rows (booking dicts) atomically"""
+        header = {
+            'format': SNAPSHOT_FORMAT,
+            'fields': BOOKING_FIELDS,
+            'storage': storage_id,
+            'cursor': cursor,
+            'journal_rows': journal_rows,
+            'booked_rows': len(rows),
+        }
+        directory = os.path.dirname(self.path) or '.'
+        with self.lock:
+            fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(self.path) + '.', suffix='.tmp', dir=directory)
+            file_opened()
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as file:
+                    file.write(json.dumps(header) + '\n')
+                    file.writelines(json.dumps([row.get(field, '') for field in BOOKING_FIELDS],
+                                               ensure_ascii=False) + '\n' for row in rows)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(temp_path, self.path)
+            except BaseException:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                raise
@@ -0,0 +1,115 @@
+import csv
+import os
+import stat
+import tempfile
+import threading
+
+from metrics import file_opened
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    Exclusive inter-process lock on a lock file
+    OS file locks are held per process, so a thread lock is taken first to
+    keep threads of the same process out as well.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.thread_lock = threading.Lock()
+        self.handle = None
+
+    def acquire(self):
+        self.thread_lock.acquire()
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            file_opened()
+            handle = open(self.path, 'a+')
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            else:
+                handle.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:  # LK_LOCK gives up after ~10 seconds
+                        continue
+            self.handle = handle
+        except BaseException:
+            self.thread_lock.release()
+            raise
+
+    def release(self):
+        handle, self.handle = self.handle, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            handle.close()
+            self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class KeyedLocks:
+    """
+    One FileLock per key (e.g. per time slot) under a lock directory
+    Work on different keys proceeds in parallel, across threads and processes.
+    """
+
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+        self.locks = {}
+        self.guard = threading.Lock()
+
+    def __call__(self, key):
+        with self.guard:
+            lock = self.locks.get(key)
+            if lock is None:
+                safe_key = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in str(key))
+                lock = self.locks[key] = FileLock(os.path.join(self.lock_dir, f"{safe_key}.lock"))
+            return lock
+
+
+def atomic_write_csv(path, fieldnames, rows):
+    """Write a CSV to a temp file in the same directory, then rename it over path"""
+    directory = os.path.dirname(path) or '.'
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    file_opened()
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+            file.flush()
+            os.fsync(file.fileno())
+        # mkstemp creates 0600 files; keep the permissions of the file being replaced
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except OSError:
+            mode = 0o644
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
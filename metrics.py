@@ -0,0 +1,211 @@
+import cProfile
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Histogram upper bounds (Prometheus "le" labels)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 1000, 10000, 100000)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.values = {}  # label values -> total
+
+    def inc(self, amount=1, *label_values):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def reset(self):
+        with self.lock:
+            self.values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for label_values, total in sorted(self.values.items()):
+                lines.append(f'{self.name}{format_labels(self.labels, label_values)} {total}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.values = {}  # label values -> [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0, 0]
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def reset(self):
+        with self.lock:
+            self.values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for label_values, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    labels = format_labels(self.labels, label_values, [('le', bound)])
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {total}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+request_seconds = Histogram('bus_optimizer_request_seconds', 'Request latency by endpoint',
+                            ('endpoint', 'status'))
+stage_seconds = Histogram('bus_optimizer_stage_seconds', 'Latency of the stages of a request',
+                          ('endpoint', 'stage'))
+request_file_opens = Histogram('bus_optimizer_request_file_opens', 'Files opened per request',
+                               ('endpoint',), COUNT_BUCKETS)
+request_rows_parsed = Histogram('bus_optimizer_request_csv_rows_parsed', 'CSV rows parsed per request',
+                                ('endpoint',), COUNT_BUCKETS)
+file_opens = Counter('bus_optimizer_file_opens_total', 'Files opened (data, lock and settings files)')
+rows_parsed_total = Counter('bus_optimizer_csv_rows_parsed_total', 'CSV rows parsed')
+allocations = Counter('bus_optimizer_allocations_total', 'Single-booking allocations by strategy and outcome',
+                      ('algorithm', 'outcome'))
+slow_profiles = Counter('bus_optimizer_slow_request_profiles_total', 'Slow requests written out as cProfile stats',
+                        ('endpoint',))
+
+METRICS = [request_seconds, stage_seconds, request_file_opens, request_rows_parsed,
+           file_opens, rows_parsed_total, allocations, slow_profiles]
+
+# Per-thread state of the request being handled, if any
+current = threading.local()
+
+
+def render():
+    """Every metric of this process in the Prometheus text format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Zero every metric (a forked worker starts its own series)"""
+    for metric in METRICS:
+        metric.reset()
+
+
+def endpoint():
+    return getattr(current, 'endpoint', None) or 'none'
+
+
+def file_opened():
+    """Count a file open, against the current request too"""
+    file_opens.inc()
+    if getattr(current, 'endpoint', None) is not None:
+        current.file_opens += 1
+
+
+def rows_parsed(count):
+    """Count CSV rows parsed, against the current request too"""
+    if not count:
+        return
+    rows_parsed_total.inc(count)
+    if getattr(current, 'endpoint', None) is not None:
+        current.rows_parsed += count
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one stage of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, endpoint(), name)
+
+
+class SlowRequestProfiler:
+    """
+    Opt-in cProfile sampling of slow requests
+    A sample_rate fraction of requests runs under cProfile (one at a time,
+    as the profiler is process-wide on newer Pythons); those that take at
+    least threshold seconds are written to directory as .prof files, to be
+    read with pstats or snakeviz. Disabled when threshold is None.
+    """
+
+    def __init__(self, directory, threshold=None, sample_rate=1.0):
+        self.directory = directory
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.threshold is None or random.random() >= self.sample_rate:
+            return None
+        if not self.lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # another profiler is active
+            self.lock.release()
+            return None
+        return profile
+
+    def finish(self, profile, name, elapsed):
+        try:
+            profile.disable()
+            if elapsed >= self.threshold:
+                os.makedirs(self.directory, exist_ok=True)
+                stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+                profile.dump_stats(os.path.join(self.directory, f'{stamp}-{name}-{int(elapsed * 1000)}ms.prof'))
+                slow_profiles.inc(1, name)
+        finally:
+            self.lock.release()
+
+
+def start_request(name, profiler=None):
+    current.endpoint = name
+    current.file_opens = 0
+    current.rows_parsed = 0
+    current.profile = profiler.start() if profiler is not None else None
+    current.start = time.perf_counter()
+
+
+def finish_request(status, profiler=None):
+    """Record the request started by start_request on this thread"""
+    name = getattr(current, 'endpoint', None)
+    if name is None:
+        return
+    elapsed = time.perf_counter() - current.start
+    if current.profile is not None:
+        profiler.finish(current.profile, name, elapsed)
+    request_seconds.observe(elapsed, name, str(status))
+    request_file_opens.observe(current.file_opens, name)
+    request_rows_parsed.observe(current.rows_parsed, name)
+    current.endpoint = None
+    current.profile = None
@@ -0,0 +1,94 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from allocation import SEAT_LAYOUT, SEAT_ZONES, SPECIAL_NEEDS_PRIORITY, solve_batch_assignment
+from scoring import SeatScorer
+
+SPLIT_MIN_BOOKINGS = 120    # a slot's batch is split per bus from this many bookings on
+PARALLEL_MIN_BOOKINGS = 200  # smaller runs are solved in-process (a pool costs more to start)
+
+
+class StaticRoutes:
+    """The part of a RouteTable a SeatScorer reads, over a fixed routes snapshot"""
+
+    def __init__(self, routes):
+        self.routes = routes
+
+    def snapshot(self):
+        return self.routes
+
+
+# Seat scorer of a pool worker process, built once by init_worker
+worker_scorer = None
+
+
+def init_worker(routes):
+    global worker_scorer
+    worker_scorer = SeatScorer(SEAT_LAYOUT, SEAT_ZONES, StaticRoutes(routes), SPECIAL_NEEDS_PRIORITY)
+
+
+def solve_partition(bookings, bus_occupancy):
+    """solve_batch_assignment in a pool worker"""
+    return solve_batch_assignment(worker_scorer, bookings, bus_occupancy)
+
+
+def partition_slot(scorer, route_table, bookings, bus_occupancy, split=True):
+    """
+    Split one slot's batch into independent assignment problems
+    Returns [(booking indexes, {BusNumber: occupancy})]. Without split, or
+    below SPLIT_MIN_BOOKINGS, or with one bus, the slot is one problem and
+    is solved exactly. Otherwise bookings are taken in priority order, those
+    beyond the slot's free seats are left out, and each goes to the bus with
+    the most seats left in its zone (then overall); each bus then solves its
+    own matching. Seat weights do not depend on the bus, so this only gives
+    up trades between buses.
+    """
+    if not split or len(bookings) < SPLIT_MIN_BOOKINGS or len(bus_occupancy) < 2:
+        return [(list(range(len(bookings))), bus_occupancy)]
+
+    free = {}  # BusNumber -> {zone: free seats}
+    for bus_number, occupied in bus_occupancy.items():
+        zones = free[bus_number] = {zone: 0 for zone in SEAT_ZONES}
+        for seat in SEAT_LAYOUT.free_seats(occupied):
+            zone = next((zone for zone, rows in SEAT_ZONES.items() if seat[0] in rows), None)
+            if zone is not None:
+                zones[zone] += 1
+    left = {bus_number: sum(zones.values()) for bus_number, zones in free.items()}
+
+    scores = scorer.priority_scores(bookings)
+    groups = {bus_number: [] for bus_number in bus_occupancy}
+    for index in sorted(range(len(bookings)), key=lambda index: -scores[index]):
+        zone = route_table.zone(bookings[index]['Destination'])
+        candidates = [bus_number for bus_number in bus_occupancy if left[bus_number]]
+        if not candidates:
+            break
+        bus_number = max(candidates, key=lambda bus_number: (free[bus_number].get(zone, 0), left[bus_number]))
+        groups[bus_number].append(index)
+        left[bus_number] -= 1
+        if free[bus_number].get(zone, 0):
+            free[bus_number][zone] -= 1
+    return [(sorted(indexes), {bus_number: bus_occupancy[bus_number]})
+            for bus_number, indexes in groups.items() if indexes]
+
+
+def solve_partitions(scorer, routes, problems, workers=1):
+    """
+    Solve (bookings, bus occupancy) problems, in a process pool when it pays
+    routes is the RouteTable snapshot the workers score with. Problems run
+    in-process with one worker, one problem or fewer than
+    PARALLEL_MIN_BOOKINGS bookings in all. Returns one
+    solve_batch_assignment result per problem, in order.
+    """
+    total = sum(len(bookings) for bookings, _ in problems)
+    if workers <= 1 or len(problems) < 2 or total < PARALLEL_MIN_BOOKINGS:
+        return [solve_batch_assignment(scorer, bookings, bus_occupancy) for bookings, bus_occupancy in problems]
+
+    # spawn: the caller may be a threaded web worker, which must not be forked
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=min(workers, len(problems)), mp_context=context,
+                             initializer=init_worker, initargs=(routes,)) as pool:
+        # Largest problems first, so the pool does not end on one long solve
+        futures = {}
+        for index in sorted(range(len(problems)), key=lambda index: -len(problems[index][0])):
+            futures[index] = pool.submit(solve_partition, *problems[index])
+        return [futures[index].result() for index in range(len(problems))]
@@ -0,0 +1,119 @@
+import threading
+import time
+
+DEFAULT_ZONE = 'middle'
+PREFERRED_ZONE_SCORE = 10  # seat is in the destination's zone
+OTHER_ZONE_SCORE = 5       # any other seat
+
+
+class RouteTable:
+    """
+    Cached view of the route table keyed by destination
+    Routes are re-read only when the storage signature changes (routes.csv
+    mtime/size, or the SQLite routes version; checked at most once per
+    check_interval seconds), and seat preference scores are precomputed
+    as a destination x seat-row matrix so scoring is a dict lookup. Given
+    door_order (seats nearest the door first), each destination's drop-off
+    seat order is precomputed the same way.
+    """
+
+    def __init__(self, storage, zones, check_interval=1.0, door_order=()):
+        self.storage = storage
+        self.zones = zones
+        self.door_order = list(door_order)
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.signature = None
+        self.next_check = 0.0
+        self.version = 0
+        self.routes = {}
+        self.route_rows = []
+        self.default_scores = self._row_scores(DEFAULT_ZONE)
+        self.preference = {}
+        self.dropoff = {}
+
+    def _row_scores(self, zone):
+        zone_rows = self.zones.get(zone, ())
+        scores = {}
+        for rows in self.zones.values():
+            for row in rows:
+                scores[row] = PREFERRED_ZONE_SCORE if row in zone_rows else OTHER_ZONE_SCORE
+        return scores
+
+    def _dropoff_orders(self, routes):
+        """
+        Seats in preference order for every destination
+        Stops are ranked by distance (the drop-off sequence) and each rank
+        gets an equal band of door_order, nearest the door for the first
+        stop. A destination's seats are its band from the door side, then
+        the seats closest to the band.
+        """
+        stops = {distance: rank for rank, distance in enumerate(sorted({route['distance'] for route in routes.values()}))}
+        seat_count = len(self.door_order)
+        bands = {}
+        for rank in stops.values():
+            start = rank * seat_count // len(stops)
+            end = max((rank + 1) * seat_count // len(stops), start + 1)
+            order = sorted(range(seat_count), key=lambda i: (max(start - i, i - end + 1, 0), i))
+            bands[rank] = [self.door_order[i] for i in order]
+        return {destination: bands[stops[route['distance']]] for destination, route in routes.items()}
+
+    def refresh(self, force=False):
+        """Reload the routes if they changed in storage"""
+        now = time.monotonic()
+        if not force and now < self.next_check:
+            return
+        with self.lock:
+            self.next_check = now + self.check_interval
+            signature = self.storage.routes_signature()
+            if not force and signature == self.signature:
+                return
+
+            routes = {}
+            route_rows = []
+            for route in self.storage.read_routes():
+                route_rows.append(route)
+                routes[route['Destination']] = {
+                    'zone': route['SeatZone'],
+                    'distance': int(route['DistanceFromCollege'])
+                }
+
+            self.routes = routes
+            self.route_rows = route_rows
+            self.preference = {destination: self._row_scores(route['zone']) for destination, route in routes.items()}
+            self.dropoff = self._dropoff_orders(routes)
+            self.signature = signature
+            self.version += 1
+
+    def rows(self):
+        """Routes as stored"""
+        self.refresh()
+        return list(self.route_rows)
+
+    def snapshot(self):
+        """Current {destination: {'zone', 'distance'}} mapping (do not mutate)"""
+        self.refresh()
+        return self.routes
+
+    def get(self, destination):
+        self.refresh()
+        return self.routes.get(destination)
+
+    def zone(self, destination):
+        route = self.get(destination)
+        return route['zone'] if route else DEFAULT_ZONE
+
+    def distance(self, destination, default=None):
+        route = self.get(destination)
+        return route['distance'] if route else default
+
+    def seat_preference(self, destination, seat_number):
+        """Preference score of a seat for a destination (see PREFERRED_ZONE_SCORE)"""
+        self.refresh()
+        row_scores = self.preference.get(destination, self.default_scores)
+        return row_scores.get(seat_number[0], OTHER_ZONE_SCORE)
+
+    def dropoff_order(self, destination):
+        """Seats for a destination in drop-off order preference (door_order for unknown destinations)"""
+        self.refresh()
+        return self.dropoff.get(destination, self.door_order)
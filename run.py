@@ -2,8 +2,20 @@
 """
 Bus Seat Allocation Optimizer - Startup Script
 A simple script to run the Flask application with proper setup.
+
+    python run.py                                  # development server, opens the browser
+    python run.py --production --workers 4         # multi-worker WSGI server
+
+In production mode the app is served by gunicorn (pre-forked worker
+processes, each with --threads threads) or, where gunicorn is unavailable
+(Windows), by waitress (one process, --workers x --threads threads).
+Every open /api/events stream (an admin dashboard tab) holds one of those
+threads, so a process serves at most half its threads as streams
+(BUS_OPTIMIZER_MAX_STREAMS overrides it); further tabs poll instead.
 """
 
+import argparse
+import importlib.util
 import os
 import sys
 import subprocess
@@ -72,8 +84,111 @@ def print_info():
     """
     print(info)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the Bus Seat Allocation Optimizer")
+    parser.add_argument("--production", action="store_true",
+                        help="serve with a multi-worker WSGI server instead of the Flask development server")
+    parser.add_argument("--server", choices=["auto", "gunicorn", "waitress"], default="auto",
+                        help="production server (auto: gunicorn if installed and supported, else waitress)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--threads", type=int, default=4, help="threads per worker")
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="seconds workers get to finish in-flight requests on reload or shutdown")
+    return parser.parse_args()
+
+def pick_server(requested):
+    """Name of the production server to use, or None if none is installed"""
+    gunicorn = importlib.util.find_spec("gunicorn") is not None and os.name != "nt"
+    waitress = importlib.util.find_spec("waitress") is not None
+    if requested == "gunicorn":
+        return "gunicorn" if gunicorn else None
+    if requested == "waitress":
+        return "waitress" if waitress else None
+    return "gunicorn" if gunicorn else "waitress" if waitress else None
+
+def gunicorn_pre_fork(server, worker):
+    # Runs in the master before each fork: no snapshot or flush may be mid-flight
+    from app import service
+    service.prepare_fork()
+
+def gunicorn_post_fork(server, worker):
+    # Runs in the new worker before it accepts requests: reopen connections
+    # and catch up on bookings made since the master loaded them
+    from app import service
+    service.after_fork()
+
+def run_gunicorn(args):
+    """
+    Serve with gunicorn, preloading the app in the master
+    The master imports app once (loading the route, bus and booking indexes
+    and warming the slot caches) and forks the workers from it, so they
+    start warm and share those pages copy-on-write. kill -HUP <master pid>
+    re-forks the workers gracefully: old ones finish their requests
+    (--graceful-timeout) while new ones take over. Code changes need a full
+    restart (or gunicorn's USR2 binary upgrade), as workers come from the
+    preloaded master.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            settings = {
+                "bind": f"{args.host}:{args.port}",
+                "workers": args.workers,
+                "threads": args.threads,
+                "preload_app": True,
+                "graceful_timeout": args.graceful_timeout,
+                "proc_name": "bus-optimizer",
+                "pre_fork": gunicorn_pre_fork,
+                "post_fork": gunicorn_post_fork,
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import app
+            return app
+
+    ProductionServer().run()
+
+def run_waitress(args):
+    """Serve with waitress: one process, the workers' threads pooled"""
+    from waitress import serve
+    from app import app
+    serve(app, host=args.host, port=args.port, threads=args.workers * args.threads)
+
+def run_production(args):
+    """Production mode: no dependency install, no browser, no debugger or reloader"""
+    server = pick_server(args.server)
+    if server is None:
+        print("❌ No production WSGI server found.")
+        print("💡 Install one: pip install gunicorn (Linux/macOS) or pip install waitress (any platform)")
+        sys.exit(1)
+    create_data_directory()
+    # Set before the app is imported; keeps half the threads for other requests
+    threads = args.threads if server == "gunicorn" else args.workers * args.threads
+    os.environ.setdefault("BUS_OPTIMIZER_MAX_STREAMS", str(threads // 2))
+    if server == "gunicorn":
+        print(f"🚀 Serving on http://{args.host}:{args.port} with gunicorn "
+              f"({args.workers} workers x {args.threads} threads, "
+              f"{os.environ['BUS_OPTIMIZER_MAX_STREAMS']} event streams each); readiness at /ready")
+        run_gunicorn(args)
+    else:
+        print(f"🚀 Serving on http://{args.host}:{args.port} with waitress "
+              f"({threads} threads, {os.environ['BUS_OPTIMIZER_MAX_STREAMS']} event streams); "
+              f"readiness at /ready")
+        run_waitress(args)
+
 def main():
     """Main startup function"""
+    args = parse_args()
+    if args.production:
+        run_production(args)
+        return
+
     print_banner()
     
     # Check Python version
@@ -0,0 +1,154 @@
+from route_cache import DEFAULT_ZONE, PREFERRED_ZONE_SCORE, OTHER_ZONE_SCORE
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; every score has a pure-Python path
+    np = None
+
+# Below this many bookings the pure-Python loops beat NumPy's call overhead
+NUMPY_MIN_BOOKINGS = 16
+
+
+class SeatScorer:
+    """
+    Student x seat scoring for the queue-based allocators
+    Students are encoded as integer arrays (special-needs code, destination
+    zone, distance, student ID) and seats as row/zone arrays, so a whole
+    pending queue is scored in one vectorized operation when NumPy is
+    installed. Scores are identical to calculate_priority_score and
+    calculate_seat_preference_score plus the given special-needs seat bonus.
+    """
+
+    def __init__(self, layout, zones, route_table, need_priority):
+        self.layout = layout
+        self.route_table = route_table
+
+        # Code 0 is "no recognised special need"
+        self.need_codes = {need: code for code, need in enumerate(need_priority, start=1)}
+        self.zone_codes = {zone: code for code, zone in enumerate(zones)}
+        self.row_codes = {row: code for code, row in enumerate(layout.rows)}
+        self.seat_zone = []
+        for row in layout.seat_rows:
+            self.seat_zone.append(next((self.zone_codes[zone] for zone, rows in zones.items() if row in rows), -1))
+        self.seat_row = [self.row_codes[row] for row in layout.seat_rows]
+        self.need_base = [0] + [need_priority[need] for need in need_priority]
+
+        if np is not None:
+            self.np_seat_zone = np.array(self.seat_zone)
+            self.np_seat_row = np.array(self.seat_row)
+            self.np_need_base = np.array(self.need_base, dtype=float)
+
+    def use_numpy(self, bookings):
+        return np is not None and len(bookings) >= NUMPY_MIN_BOOKINGS
+
+    def encode(self, bookings):
+        """Column arrays (need codes, zone codes, distances, student ids) for the bookings"""
+        routes = self.route_table.snapshot()
+        # Destinations repeat heavily in a queue, so resolve each one once
+        destinations = {}
+        need_codes = self.need_codes
+        needs, zones, distances, student_ids = [], [], [], []
+        for booking in bookings:
+            destination = booking['Destination']
+            route_codes = destinations.get(destination)
+            if route_codes is None:
+                route = routes.get(destination)
+                zone = route['zone'] if route else DEFAULT_ZONE
+                route_codes = destinations[destination] = (
+                    self.zone_codes.get(zone, -2),  # unknown zone name matches no seat
+                    route['distance'] if route else 0
+                )
+            needs.append(need_codes.get(booking.get('SpecialNeeds'), 0))
+            zones.append(route_codes[0])
+            distances.append(route_codes[1])
+            student_ids.append(int(booking['StudentID']))
+        return needs, zones, distances, student_ids
+
+    def bonus_matrix(self, seat_bonus):
+        """need code x row code bonus table for a {need: (bonus, rows)} mapping"""
+        matrix = [[0] * len(self.row_codes) for _ in range(len(self.need_base))]
+        for need, (bonus, rows) in seat_bonus.items():
+            code = self.need_codes.get(need)
+            if code is None:
+                continue
+            for row in rows:
+                matrix[code][self.row_codes[row]] = bonus
+        return matrix
+
+    def priority_scores(self, bookings, encoded=None):
+        """calculate_priority_score for every booking (encoded: reuse an encode() result)"""
+        needs, _, distances, student_ids = encoded or self.encode(bookings)
+        if self.use_numpy(bookings):
+            distance = np.array(distances, dtype=float)
+            student_id = np.array(student_ids, dtype=float)
+            return (self.np_need_base[np.array(needs, dtype=int)] + distance * 2 + (10000 - student_id) / 10000).tolist()
+        return [self.need_base[need] + distance * 2 + (10000 - student_id) / 10000
+                for need, distance, student_id in zip(needs, distances, student_ids)]
+
+    def seat_scores(self, bookings, seat_bonus, encoded=None):
+        """
+        Seat preference plus special-needs bonus for every (booking, seat) pair
+        Returns an ndarray on the NumPy path and a list of rows otherwise;
+        columns follow the seat layout order.
+        """
+        bonus = self.bonus_matrix(seat_bonus)
+        needs, zones, _, _ = encoded or self.encode(bookings)
+        if self.use_numpy(bookings):
+            need = np.array(needs, dtype=int)
+            zone = np.array(zones, dtype=int)
+            preference = np.where(zone[:, None] == self.np_seat_zone[None, :], PREFERRED_ZONE_SCORE, OTHER_ZONE_SCORE)
+            return preference + np.array(bonus)[need][:, self.np_seat_row]
+
+        matrix = []
+        for need, zone in zip(needs, zones):
+            need_bonus = bonus[need]
+            matrix.append([
+                (PREFERRED_ZONE_SCORE if zone == seat_zone else OTHER_ZONE_SCORE) + need_bonus[seat_row]
+                for seat_zone, seat_row in zip(self.seat_zone, self.seat_row)
+            ])
+        return matrix
+
+    def stack(self, first, second):
+        """Rows of first followed by rows of second (seat_scores results, either kind)"""
+        if np is not None and (isinstance(first, np.ndarray) or isinstance(second, np.ndarray)):
+            width = len(self.layout.seats)
+            return np.vstack([np.asarray(first).reshape(-1, width), np.asarray(second).reshape(-1, width)])
+        return list(first) + list(second)
+
+    def assignment_weights(self, priority_scores, matrix, seats):
+        """Rows of priority + seat score restricted to the given seats (Hungarian input)"""
+        columns = [self.layout.index[seat] for seat in seats]
+        if np is not None and isinstance(matrix, np.ndarray):
+            return (np.array(priority_scores)[:, None] + matrix[:, columns]).tolist()
+        return [[priority_score + scores[column] for column in columns]
+                for priority_score, scores in zip(priority_scores, matrix)]
+
+    def greedy_assign(self, matrix, order, occupied):
+        """
+        Give each booking (in order) its best-scoring free seat
+        Ties go to the first seat in layout order. Returns {booking index: seat}.
+        """
+        allocations = {}
+        if np is not None and isinstance(matrix, np.ndarray):
+            free = np.array([not occupied >> i & 1 for i in range(len(self.layout.seats))])
+            for index in order:
+                if not free.any():
+                    break
+                column = int(np.argmax(np.where(free, matrix[index], -1)))
+                allocations[index] = self.layout.seats[column]
+                free[column] = False
+            return allocations
+
+        for index in order:
+            row = matrix[index]
+            best_seat = None
+            best_score = -1
+            for seat in self.layout.free_seats(occupied):
+                if row[self.layout.index[seat]] > best_score:
+                    best_score = row[self.layout.index[seat]]
+                    best_seat = seat
+            if not best_seat:
+                break
+            allocations[index] = best_seat
+            occupied = self.layout.take(occupied, best_seat)
+        return allocations
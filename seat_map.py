@@ -0,0 +1,76 @@
+class SeatLayout:
+    """
+    Bitmask view of the bus seat layout
+    Seat i (row-major: A1, A2, ... J4) is bit i of an occupancy integer, so
+    "is it free", "first free seat in a zone" and "how many are free" are
+    plain integer operations instead of rebuilding seat strings.
+    """
+
+    def __init__(self, rows, cols, zones):
+        self.rows = list(rows)
+        self.cols = list(cols)
+        self.seats = [f"{row}{col}" for row in self.rows for col in self.cols]
+        self.index = {seat: i for i, seat in enumerate(self.seats)}
+        self.seat_rows = [seat_row for seat_row in self.rows for _ in self.cols]
+        self.full_mask = (1 << len(self.seats)) - 1
+
+        self.row_masks = {}
+        for i, row in enumerate(self.seat_rows):
+            self.row_masks[row] = self.row_masks.get(row, 0) | (1 << i)
+
+        self.zone_masks = {}
+        for zone, zone_rows in zones.items():
+            self.zone_masks[zone] = self.rows_mask(zone_rows)
+
+    def rows_mask(self, rows):
+        """Mask covering every seat in the given rows"""
+        mask = 0
+        for row in rows:
+            mask |= self.row_masks.get(row, 0)
+        return mask
+
+    def bit(self, seat):
+        return 1 << self.index[seat]
+
+    def mask_of(self, seats):
+        """Occupancy mask for an iterable of seat labels (unknown labels are ignored)"""
+        mask = 0
+        for seat in seats:
+            i = self.index.get(seat)
+            if i is not None:
+                mask |= 1 << i
+        return mask
+
+    def take(self, occupied, seat):
+        return occupied | self.bit(seat)
+
+    def release(self, occupied, seat):
+        return occupied & ~self.bit(seat)
+
+    def is_free(self, occupied, seat):
+        return not occupied & self.bit(seat)
+
+    def first_free(self, occupied, candidates=None):
+        """Lowest-numbered free seat within candidates (default: whole bus)"""
+        free = ~occupied & (self.full_mask if candidates is None else candidates)
+        if not free:
+            return None
+        return self.seats[(free & -free).bit_length() - 1]
+
+    def count_free(self, occupied, candidates=None):
+        return popcount(~occupied & (self.full_mask if candidates is None else candidates))
+
+    def count_taken(self, occupied):
+        return popcount(occupied & self.full_mask)
+
+    def free_seats(self, occupied, candidates=None):
+        """Yield free seat labels in layout order"""
+        free = ~occupied & (self.full_mask if candidates is None else candidates)
+        while free:
+            low = free & -free
+            yield self.seats[low.bit_length() - 1]
+            free ^= low
+
+
+def popcount(mask):
+    return bin(mask).count('1')
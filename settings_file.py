@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from metrics import file_opened
+
+
+class JsonSettings:
+    """
+    A JSON settings file that is re-read when it changes
+    The file's mtime/size is checked at most once per check_interval
+    seconds, so every worker process follows an edit without a restart.
+    A missing file reads as {}.
+    """
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.signature = None
+        self.next_check = 0.0
+        self.settings = {}
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def get(self):
+        """Current settings (do not mutate)"""
+        now = time.monotonic()
+        if now < self.next_check:
+            return self.settings
+        with self.lock:
+            self.next_check = now + self.check_interval
+            signature = self._signature()
+            if signature != self.signature:
+                settings = {}
+                if signature is not None:
+                    file_opened()
+                    with open(self.path, encoding='utf-8') as file:
+                        settings = json.load(file)
+                self.settings = settings
+                self.signature = signature
+            return self.settings
+
+    def save(self, settings):
+        """Replace the file atomically and use the new settings right away"""
+        directory = os.path.dirname(self.path) or '.'
+        fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(self.path) + '.', suffix='.tmp', dir=directory)
+        file_opened()
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                json.dump(settings, file, indent=2)
+                file.flush()
+                os.fsync(file.fileno())
+            os.chmod(temp_path, 0o644)  # mkstemp creates 0600 files
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        with self.lock:
+            self.settings = settings
+            self.signature = self._signature()
@@ -0,0 +1,101 @@
+class SlotContext:
+    """
+    What the allocators need to know about one time slot, worked out once
+    The bus picked per zone, bus occupancy, the pending queue with its
+    priority and seat scores, and the FIFO order of the slot's bookings are
+    computed on first use and shared by every allocator until the slot
+    changes: contexts are keyed on the booking store and bus table versions,
+    so any commit (in any process, once synced) retires them.
+    routes (the RouteTable) and scorer (the SeatScorer) are exposed for the
+    allocators. Allocators must not mutate what they get back.
+    """
+
+    def __init__(self, time_slot, version, store, bus_index, scorer, routes):
+        self.time_slot = time_slot
+        self.version = version
+        self.store = store
+        self.bus_index = bus_index
+        self.scorer = scorer
+        self.routes = routes
+        self.picked = {}        # zone or None -> BusNumber (or None when the slot is full)
+        self.pending_rows = None
+        self.pending_encoded = None
+        self.pending_priority = None
+        self.pending_seat_scores = {}  # id(seat bonus table) -> matrix over the pending queue
+        self.history_positions = None
+        self.reserved = {}      # (BusNumber, id(seat bonus table)) -> (keys, prefix masks)
+
+    def bus(self, zone=None):
+        """Bus of the slot with the most free seats in zone (see BusIndex.pick)"""
+        if zone not in self.picked:
+            self.picked[zone] = self.bus_index.pick(self.time_slot, zone)
+        return self.picked[zone]
+
+    def occupancy(self, bus_number):
+        return self.store.occupancy(bus_number)
+
+    def bus_occupancy(self):
+        """{BusNumber: occupancy bitmask} for every bus of the slot"""
+        return {bus_number: self.store.occupancy(bus_number) for bus_number in self.bus_index.buses(self.time_slot)}
+
+    def pending(self):
+        if self.pending_rows is None:
+            self.pending_rows = self.store.pending_bookings(self.time_slot)
+        return self.pending_rows
+
+    def queue(self, booking):
+        """The pending queue followed by booking (a new list)"""
+        return self.pending() + [booking]
+
+    def priority_scores(self, booking):
+        """calculate_priority_score for queue(booking)"""
+        if self.pending_priority is None:
+            self.pending_encoded = self.scorer.encode(self.pending())
+            self.pending_priority = self.scorer.priority_scores(self.pending(), self.pending_encoded)
+        return self.pending_priority + self.scorer.priority_scores([booking])
+
+    def seat_scores(self, booking, seat_bonus):
+        """SeatScorer.seat_scores for queue(booking) with a special-needs seat bonus table"""
+        matrix = self.pending_seat_scores.get(id(seat_bonus))
+        if matrix is None:
+            self.priority_scores(booking)  # encodes the pending queue
+            matrix = self.pending_seat_scores[id(seat_bonus)] = \
+                self.scorer.seat_scores(self.pending(), seat_bonus, self.pending_encoded)
+        return self.scorer.stack(matrix, self.scorer.seat_scores([booking], seat_bonus))
+
+    def reservations(self, bus_number, seat_bonus):
+        """
+        Tentative seats of the pending queue on a bus, in priority order
+        Each pending student, best first, takes their best-scoring free seat
+        (seat_bonus as in seat_scores). Once the free seats are used up,
+        nobody further down gets one, so only the top free-seat-count
+        students are taken off the store's priority heap: the work is bounded
+        by the bus size, not the queue length.
+        Returns (keys, prefix): keys[i] is the (-priority, position) of the
+        i-th seated student, prefix[i] the seats taken by the first i.
+        """
+        cache_key = (bus_number, id(seat_bonus))
+        if cache_key not in self.reserved:
+            occupied = self.store.occupancy(bus_number)
+            top = self.store.top_queued('Pending', self.time_slot, self.scorer.layout.count_free(occupied))
+            bookings = [booking for _, booking in top]
+            allocations = self.scorer.greedy_assign(self.scorer.seat_scores(bookings, seat_bonus), range(len(bookings)), occupied)
+            keys, prefix = [], [0]
+            for index, (entry, _) in enumerate(top):
+                if index not in allocations:
+                    break
+                keys.append(entry[:2])
+                prefix.append(prefix[-1] | self.scorer.layout.bit(allocations[index]))
+            self.reserved[cache_key] = (keys, prefix)
+        return self.reserved[cache_key]
+
+    def history_position(self, student_id):
+        """Position of the student's first booking in the slot by BookingDate, or the queue length if none"""
+        if self.history_positions is None:
+            history = sorted(self.store.slot_history(self.time_slot), key=lambda booking: booking['BookingDate'])
+            positions = {}
+            for position, booking in enumerate(history):
+                positions.setdefault(booking['StudentID'], position)
+            self.history_positions = (positions, len(history))
+        positions, length = self.history_positions
+        return positions.get(student_id, length)
@@ -0,0 +1,498 @@
+import csv
+import io
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from locking import FileLock, atomic_write_csv
+from metrics import file_opened, rows_parsed
+
+ROUTE_FIELDS = ['Destination', 'DistanceFromCollege', 'SeatZone']
+BOOKING_FIELDS = ['BookingID', 'StudentID', 'Name', 'Email', 'BusNumber', 'SeatNumber', 'TimeSlot', 'Destination', 'BookingDate', 'Status', 'Priority', 'SpecialNeeds']
+BUS_FIELDS = ['BusID', 'BusNumber', 'TimeSlot', 'TotalSeats', 'BookedSeats', 'AvailableSeats', 'IsReused', 'ReusedFrom']
+
+
+class CsvStorage:
+    """
+    Persistence in the three CSV files
+    booking.csv is append-only, a journal in which a booking's later rows
+    supersede its earlier ones: changes are read back by byte offset, so a
+    cursor is (file identity, bytes consumed). Compaction replaces it with
+    the latest row of each booking, and records in booking.csv.versions how
+    many bytes came before the new file, so versions keep increasing.
+    buses.csv is replaced atomically; routes.csv is only read.
+    """
+
+    def __init__(self, routes_file, booking_file, buses_file, lock_dir):
+        self.routes_file = routes_file
+        self.booking_file = booking_file
+        self.buses_file = buses_file
+        self.booking_file_lock = FileLock(os.path.join(lock_dir, 'booking.lock'))
+        self.buses_file_lock = FileLock(os.path.join(lock_dir, 'buses.lock'))
+        self.booking_fieldnames = None
+        self.versions_file = booking_file + '.versions'
+        self.version_bases = {}  # booking file id -> version at its offset 0
+
+    # Bookings
+
+    def bookings_lock(self):
+        """Held while appending, so BookingIDs stay unique across processes"""
+        return self.booking_file_lock
+
+    def load_bookings(self):
+        """Every booking row in file order, and the cursor after them"""
+        self.booking_fieldnames = None
+        self.version_bases.clear()
+        if not os.path.exists(self.booking_file):
+            return [], None
+        file_opened()
+        with open(self.booking_file, 'rb') as file:
+            data = file.read()
+            stat = os.fstat(file.fileno())
+        return self._parse_bookings(data), ((stat.st_dev, stat.st_ino), len(data))
+
+    def after_fork(self):
+        """Nothing to reopen: files are opened per call"""
+
+    def booking_changes(self, cursor):
+        """
+        Rows appended since cursor, and the new cursor
+        Returns (None, None) when the file was replaced and must be reloaded.
+        """
+        try:
+            stat = os.stat(self.booking_file)
+        except OSError:
+            return [], cursor
+        file_id, offset = cursor or (None, 0)
+        if (stat.st_dev, stat.st_ino) != file_id or stat.st_size < offset:
+            self.version_bases.clear()  # a later file may reuse an inode we know
+            return None, None
+        if stat.st_size == offset:
+            return [], cursor
+
+        file_opened()
+        with open(self.booking_file, 'rb') as file:
+            if self.booking_fieldnames is None and offset:
+                # Resuming mid-file (from a snapshot): the header is still needed
+                self.booking_fieldnames = next(csv.reader([file.readline().decode('utf-8')]))
+            file.seek(offset)
+            data = file.read()
+        # Only consume complete lines; a writer may be mid-row
+        end = data.rfind(b'\n') + 1
+        if not end:
+            return [], cursor
+        return self._parse_bookings(data[:end]), (file_id, offset + end)
+
+    def _parse_bookings(self, data):
+        text = io.StringIO(data.decode('utf-8'), newline='')
+        if self.booking_fieldnames is None:
+            reader = csv.DictReader(text, restval='')
+        else:
+            reader = csv.DictReader(text, fieldnames=self.booking_fieldnames, restval='')
+        rows = [self._normalize(booking) for booking in reader]
+        rows_parsed(len(rows))
+        if reader.fieldnames:
+            self.booking_fieldnames = reader.fieldnames
+        return rows
+
+    def _normalize(self, booking):
+        # Files created with the old 10-column header still get 12-column rows
+        extra = booking.pop(None, None) or []
+        missing = [field for field in BOOKING_FIELDS if field not in booking]
+        if missing:
+            booking.update(zip(missing, extra + [''] * (len(missing) - len(extra))))
+        return booking
+
+    def cursor_version(self, cursor):
+        """
+        Monotonic number for a cursor, equal in every process that has read as far
+        Bytes ever appended to the journal: the offset plus what compactions
+        dropped before the current file.
+        """
+        if not cursor:
+            return 0
+        file_id, offset = cursor
+        return self._version_base(file_id) + offset
+
+    def _version_base(self, file_id):
+        base = self.version_bases.get(file_id)
+        if base is None:
+            if os.path.exists(self.versions_file):
+                file_opened()
+                with open(self.versions_file, encoding='utf-8') as file:
+                    for line in file:
+                        device, inode, version = map(int, line.split())
+                        self.version_bases[(device, inode)] = version
+            # A file never compacted into starts at 0
+            base = self.version_bases.setdefault(file_id, 0)
+        return base
+
+    def _record_compaction(self, cursor, new_id, rows_size):
+        """
+        Before a compacted file replaces the journal (bookings lock held): its
+        tail, which starts at rows_size, keeps the versions it had at cursor
+        """
+        file_id, offset = cursor
+        base = self._version_base(file_id) + offset - rows_size
+        file_opened()
+        with open(self.versions_file, 'a', encoding='utf-8') as file:
+            file.write(f'{new_id[0]} {new_id[1]} {base}\n')
+            file.flush()
+            os.fsync(file.fileno())
+        self.version_bases[new_id] = base
+
+    def journal_id(self):
+        """Identity of the current booking.csv (snapshots are only valid against it)"""
+        try:
+            stat_result = os.stat(self.booking_file)
+        except OSError:
+            return None
+        return (stat_result.st_dev, stat_result.st_ino)
+
+    def compact_bookings(self, rows, cursor, before_replace=None):
+        """
+        Replace booking.csv with rows (the latest row of every booking as of
+        cursor) followed by whatever was appended after cursor
+        The rows are written to a temp file without the bookings lock; only
+        copying the tail and the rename happen under it, so appends are held
+        up briefly. before_replace(cursor after rows, new journal id) runs
+        just before the rename, e.g. to write a matching snapshot.
+        Returns the cursor at the end of the new file, or None (and changes
+        nothing) if booking.csv was replaced since cursor.
+        """
+        file_id, offset = cursor
+        directory = os.path.dirname(self.booking_file) or '.'
+        fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(self.booking_file) + '.', suffix='.tmp', dir=directory)
+        file_opened()
+        try:
+            with os.fdopen(fd, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.DictWriter(file, fieldnames=BOOKING_FIELDS, extrasaction='ignore')
+                writer.writeheader()
+                writer.writerows(rows)
+            rows_size = os.path.getsize(temp_path)
+
+            with self.booking_file_lock:
+                current = os.stat(self.booking_file)
+                if (current.st_dev, current.st_ino) != file_id or current.st_size < offset:
+                    os.remove(temp_path)
+                    return None
+                file_opened()
+                with open(self.booking_file, 'rb') as source:
+                    source.seek(offset)
+                    tail = source.read()
+                file_opened()
+                with open(temp_path, 'ab') as file:
+                    file.write(tail)
+                    file.flush()
+                    os.fsync(file.fileno())
+                    compacted = os.fstat(file.fileno())
+                new_id = (compacted.st_dev, compacted.st_ino)
+                self._record_compaction(cursor, new_id, rows_size)
+                if before_replace is not None:
+                    before_replace((new_id, rows_size), new_id)
+                os.chmod(temp_path, stat.S_IMODE(current.st_mode))
+                os.replace(temp_path, self.booking_file)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self.booking_fieldnames = None
+        return (new_id, rows_size + len(tail))
+
+    def append_bookings(self, rows):
+        """Append rows in one write; returns the cursor after them"""
+        write_header = not os.path.exists(self.booking_file) or os.path.getsize(self.booking_file) == 0
+        file_opened()
+        with open(self.booking_file, 'a', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=BOOKING_FIELDS)
+            if write_header:
+                writer.writeheader()
+            writer.writerows(rows)
+            file.flush()
+            stat = os.fstat(file.fileno())
+        if write_header:
+            self.booking_fieldnames = list(BOOKING_FIELDS)
+        return ((stat.st_dev, stat.st_ino), stat.st_size)
+
+    # Buses
+
+    def buses_lock(self):
+        return self.buses_file_lock
+
+    def buses_signature(self):
+        """Changes whenever buses.csv is rewritten"""
+        try:
+            stat = os.stat(self.buses_file)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def read_buses(self):
+        if not os.path.exists(self.buses_file):
+            return []
+        file_opened()
+        with open(self.buses_file, 'r', encoding='utf-8') as file:
+            rows = list(csv.DictReader(file))
+        rows_parsed(len(rows))
+        return rows
+
+    def write_buses(self, rows):
+        atomic_write_csv(self.buses_file, BUS_FIELDS, rows)
+
+    # Routes
+
+    def routes_signature(self):
+        try:
+            stat = os.stat(self.routes_file)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def read_routes(self):
+        if not os.path.exists(self.routes_file):
+            return []
+        file_opened()
+        with open(self.routes_file, 'r', encoding='utf-8') as file:
+            rows = list(csv.DictReader(file))
+        rows_parsed(len(rows))
+        return rows
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    Key TEXT PRIMARY KEY,
+    Value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (Key, Value) VALUES ('booking_seq', 0), ('buses_version', 0), ('routes_version', 0);
+INSERT OR IGNORE INTO meta (Key, Value) VALUES ('database_id', ABS(RANDOM()));
+
+CREATE TABLE IF NOT EXISTS routes (
+    Destination TEXT PRIMARY KEY,
+    DistanceFromCollege TEXT NOT NULL,
+    SeatZone TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS bookings (
+    BookingID TEXT PRIMARY KEY,
+    StudentID TEXT,
+    Name TEXT,
+    Email TEXT,
+    BusNumber TEXT,
+    SeatNumber TEXT,
+    TimeSlot TEXT,
+    Destination TEXT,
+    BookingDate TEXT,
+    Status TEXT,
+    Priority TEXT,
+    SpecialNeeds TEXT,
+    Position INTEGER NOT NULL,  -- order of first insert
+    Seq INTEGER NOT NULL        -- bumped on every write, for incremental sync
+);
+CREATE INDEX IF NOT EXISTS idx_bookings_bus_status ON bookings (BusNumber, Status);
+CREATE INDEX IF NOT EXISTS idx_bookings_slot_status ON bookings (TimeSlot, Status);
+CREATE INDEX IF NOT EXISTS idx_bookings_student ON bookings (StudentID);
+CREATE INDEX IF NOT EXISTS idx_bookings_email ON bookings (Email);
+CREATE INDEX IF NOT EXISTS idx_bookings_seq ON bookings (Seq);
+
+CREATE TABLE IF NOT EXISTS buses (
+    BusID TEXT,
+    BusNumber TEXT PRIMARY KEY,
+    TimeSlot TEXT,
+    TotalSeats TEXT,
+    BookedSeats TEXT,
+    AvailableSeats TEXT,
+    IsReused TEXT,
+    ReusedFrom TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_buses_slot ON buses (TimeSlot);
+"""
+
+# Direct edits to routes/buses (e.g. from the sqlite3 shell) still invalidate caches
+VERSION_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS {table}_{action}_version AFTER {action} ON {table}
+BEGIN
+    UPDATE meta SET Value = Value + 1 WHERE Key = '{key}';
+END;
+"""
+
+
+class SqliteStorage:
+    """
+    Persistence in a single SQLite database (WAL mode)
+    Bookings are upserted by BookingID and stamped with an increasing Seq,
+    so the booking cursor is the last Seq seen and picking up other
+    processes' writes is an indexed range query.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self.connection()
+        connection.executescript(SCHEMA)
+        for table, key in (('routes', 'routes_version'), ('buses', 'buses_version')):
+            for action in ('INSERT', 'UPDATE', 'DELETE'):
+                connection.executescript(VERSION_TRIGGERS.format(table=table, action=action, key=key))
+
+    def after_fork(self):
+        """Drop the connections inherited from the parent (sqlite3 connections must not cross a fork)"""
+        self.local = threading.local()
+
+    def connection(self):
+        """Connection of the calling thread (sqlite3 connections are per thread)"""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction; BEGIN IMMEDIATE also serializes writers across processes"""
+        connection = self.connection()
+        if connection.in_transaction:
+            yield connection
+            return
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def is_empty(self):
+        connection = self.connection()
+        for table in ('routes', 'bookings', 'buses'):
+            if connection.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone():
+                return False
+        return True
+
+    def _meta(self, key):
+        return self.connection().execute('SELECT Value FROM meta WHERE Key = ?', (key,)).fetchone()[0]
+
+    # Bookings
+
+    def bookings_lock(self):
+        return self.transaction()
+
+    def load_bookings(self):
+        connection = self.connection()
+        with self.transaction():
+            rows = connection.execute(f"SELECT {', '.join(BOOKING_FIELDS)} FROM bookings ORDER BY Position").fetchall()
+            cursor = self._meta('booking_seq')
+        return [dict(row) for row in rows], cursor
+
+    def booking_changes(self, cursor):
+        connection = self.connection()
+        rows = connection.execute(
+            f"SELECT {', '.join(BOOKING_FIELDS)}, Seq FROM bookings WHERE Seq > ? ORDER BY Seq", (cursor or 0,)
+        ).fetchall()
+        if not rows:
+            return [], cursor
+        changes = []
+        for row in rows:
+            booking = dict(row)
+            cursor = booking.pop('Seq')
+            changes.append(booking)
+        return changes, cursor
+
+    def cursor_version(self, cursor):
+        return cursor or 0
+
+    def journal_id(self):
+        return self._meta('database_id')
+
+    def compact_bookings(self, rows, cursor, before_replace=None):
+        """Nothing to compact: bookings are updated in place"""
+        return None
+
+    def append_bookings(self, rows):
+        """Insert new bookings and update existing ones in one transaction"""
+        with self.transaction() as connection:
+            seq = self._meta('booking_seq')
+            position = connection.execute('SELECT COALESCE(MAX(Position), 0) FROM bookings').fetchone()[0]
+            values = []
+            for row in rows:
+                seq += 1
+                position += 1
+                values.append([row.get(field, '') for field in BOOKING_FIELDS] + [position, seq])
+            connection.executemany(
+                f"INSERT INTO bookings ({', '.join(BOOKING_FIELDS)}, Position, Seq) "
+                f"VALUES ({', '.join('?' * (len(BOOKING_FIELDS) + 2))}) "
+                f"ON CONFLICT (BookingID) DO UPDATE SET "
+                + ', '.join(f'{field} = excluded.{field}' for field in BOOKING_FIELDS[1:])
+                + ', Seq = excluded.Seq',
+                values
+            )
+            connection.execute("UPDATE meta SET Value = ? WHERE Key = 'booking_seq'", (seq,))
+        return seq
+
+    # Buses
+
+    def buses_lock(self):
+        return self.transaction()
+
+    def buses_signature(self):
+        return self._meta('buses_version')
+
+    def read_buses(self):
+        rows = self.connection().execute(f"SELECT {', '.join(BUS_FIELDS)} FROM buses ORDER BY rowid").fetchall()
+        return [dict(row) for row in rows]
+
+    def write_buses(self, rows):
+        with self.transaction() as connection:
+            connection.executemany(
+                f"INSERT INTO buses ({', '.join(BUS_FIELDS)}) VALUES ({', '.join('?' * len(BUS_FIELDS))}) "
+                f"ON CONFLICT (BusNumber) DO UPDATE SET "
+                + ', '.join(f'{field} = excluded.{field}' for field in BUS_FIELDS if field != 'BusNumber'),
+                [[str(row.get(field, '')) for field in BUS_FIELDS] for row in rows]
+            )
+
+    # Routes
+
+    def routes_signature(self):
+        return self._meta('routes_version')
+
+    def read_routes(self):
+        rows = self.connection().execute(f"SELECT {', '.join(ROUTE_FIELDS)} FROM routes ORDER BY rowid").fetchall()
+        return [dict(row) for row in rows]
+
+    # Migration
+
+    def migrate_from_csv(self, routes_file, booking_file, buses_file):
+        """
+        One-shot import of the three CSV files
+        Superseded booking rows collapse to their latest version. Returns the
+        number of (routes, bookings, buses) imported, or None (and imports
+        nothing) if the database already has data.
+        """
+        csv_storage = CsvStorage(routes_file, booking_file, buses_file, os.path.dirname(self.path) or '.')
+        routes = csv_storage.read_routes()
+        bookings, _ = csv_storage.load_bookings()
+        buses = csv_storage.read_buses()
+
+        latest = {}
+        for booking in bookings:
+            latest[booking['BookingID']] = booking
+
+        with self.transaction() as connection:
+            if not self.is_empty():
+                return None
+            connection.executemany(
+                f"INSERT OR REPLACE INTO routes ({', '.join(ROUTE_FIELDS)}) VALUES (?, ?, ?)",
+                [[route[field] for field in ROUTE_FIELDS] for route in routes]
+            )
+            self.append_bookings(list(latest.values()))
+            self.write_buses(buses)
+        return len(routes), len(latest), len(buses)